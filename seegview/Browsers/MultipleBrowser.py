@@ -19,6 +19,7 @@ import sys
 from seegview.Managers.KeypressManager import KeybindingManager
 from seegview.Managers.TimeManager import TimeManager
 from seegview.Managers.AnnotationsManager import AnnotationsManager
+from seegview.Data.AnnotationJournal import AnnotationJournal
 
 from seegview.Widgets.MultipleTimeWidget import MultipleTimeWidget
 
@@ -33,6 +34,7 @@ class MultipleBrowser(QMainWindow):
             window_duration, 
             num_traces, 
             annotations: mne.Annotations | None = None,
+            journal: AnnotationJournal | None = None,
             ): 
         super().__init__()
 
@@ -52,8 +54,11 @@ class MultipleBrowser(QMainWindow):
         self.annot_manager = AnnotationsManager(
             annotations = self.annotations, 
             current_time = curr_time, 
-            window_duration = window_duration
+            window_duration = window_duration, 
+            journal = journal
         )
+        # Replayed from the journal, if any
+        self.annotations = self.annot_manager.annotations
 
         self.time_manager = TimeManager(
             initial_time = curr_time, 
@@ -79,4 +84,9 @@ class MultipleBrowser(QMainWindow):
 
         self.ch_names = self.widget.ch_names
         
-                
\ No newline at end of file
+                
+    def closeEvent(self, event) -> None: 
+        # Folds the annotation edits into the journal's snapshot
+        self.annot_manager.close()
+        self.widget.release()
+        super().closeEvent(event)
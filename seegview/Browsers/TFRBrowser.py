@@ -22,26 +22,29 @@ from seegview.Managers.KeypressManager import KeybindingManager
 
 from seegview.Widgets.TimeWidget import TimeWidget
 from seegview.Widgets.TFRWidget import TFRWidget
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRStore import TFRStore
+from seegview.Data.TFRCache import TFRCache
+from seegview.Data.AnnotationJournal import AnnotationJournal
 
 from seegview.StyleSheets import minimalist_sheet
 
 class TFRBrowser(QMainWindow):
     def __init__(self, 
-                 tf: mne.time_frequency.BaseTFR, 
+                 tf: mne.time_frequency.BaseTFR | MorletEngine | TFRStore | TFRCache, 
                  raw: mne.io.BaseRaw | None = None,
                  annotations: mne.Annotations | None = None,
                  dB: float = False,
                  window_duration: float = 10.0, 
                  current_time: float = 0.0,
+                 journal: AnnotationJournal | None = None,
                  ):
         super().__init__()
 
         self.setStyleSheet(minimalist_sheet)
 
-        self.data = tf.data # (n_chan, n_freqs, n_times)
+        # The TFRWidget converts the visible slice to dB, no copy of the TFR is made
         self.dB = dB
-        if self.dB: 
-            self.data = 20*np.log10(self.data)
         self.times = tf.times
         self.sfreq_tf = tf.sfreq
         self.freqs = tf.freqs
@@ -70,8 +73,11 @@ class TFRBrowser(QMainWindow):
         self.annot_manager = AnnotationsManager(
             annotations = self.annotations,
             current_time = self.current_time, 
-            window_duration = self.window_duration 
+            window_duration = self.window_duration, 
+            journal = journal
         )
+        # Replayed from the journal, if any
+        self.annotations = self.annot_manager.annotations
 
         # Time Manager
         # Might move this if add a Widget component
@@ -97,7 +103,11 @@ class TFRBrowser(QMainWindow):
         main_layout = QVBoxLayout()
         central_widget.setLayout(main_layout)
 
-        self.channel_manager = ChannelManager(self.ch_names, self.current_channel)
+        self.channel_manager = ChannelManager(
+            self.ch_names, 
+            self.current_channel, 
+            scheduler = self.time_manager.scheduler
+        )
         
         main_layout.addWidget(self.channel_manager)
 
@@ -165,6 +175,14 @@ class TFRBrowser(QMainWindow):
         if not self.keybinding_manager.handle_key_press(event.key()): 
             super().keyPressEvent(event)
 
+    def closeEvent(self, event) -> None: 
+        # Folds the annotation edits into the journal's snapshot
+        self.annot_manager.close()
+        if self.raw is not None: 
+            self.plot_time_widget.release()
+        self.tfr_widget.release()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -174,9 +192,9 @@ if __name__ == "__main__":
     raw = load(0)
     freqs = np.arange(50) + 2
 
-    picks = np.arange(2) + 65
-
-    tf = raw.copy().pick(picks).compute_tfr(method = "morlet", freqs = freqs, decim = 100)
+    # Every channel, power is only computed for the windows that are viewed
+    # and kept on disk for the next session
+    tf = TFRCache(MorletEngine(raw, freqs = freqs, decim = 100))
 
     browser = TFRBrowser(tf,
                          raw = raw, 
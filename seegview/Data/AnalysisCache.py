@@ -0,0 +1,269 @@
+import functools
+import hashlib
+import json
+import os
+import time
+import weakref
+import zipfile
+
+import mne
+import numpy as np
+
+from seegview.config import cache_root
+from seegview.Data.MemmapRaw import raw_fingerprint
+from seegview.Widgets.Analysis import get_psds, welch_with_CI, jackknife_CI_z_score
+
+_FORMAT_VERSION = 1
+
+class AnalysisCache: 
+    """On-disk memoization of analysis results across sessions.
+
+    Each result is a tuple of arrays saved as one ``.npz`` file named after
+    a hash of the function, its parameters and, for the wrappers of
+    ``get_psds`` and ``welch_with_CI``, the fingerprint of the recording.
+    Results are stored, and returned on a miss as on a hit, with their own
+    dtype; a ``dtype`` such as float32 halves the size of the entries by
+    storing arrays of more than one dimension in it. Functions are
+    identified by module and name, lambdas and local functions need an
+    explicit name (``psd_func_name``, ``CI_func_name``). A recording's
+    fingerprint is computed once per Raw while its ``info`` is unchanged;
+    ``data_key`` replaces it for samples modified in ways ``info`` does not
+    record. Reading an entry marks it as used; once the cache holds more
+    than ``max_bytes``, the least recently used entries are deleted.
+    """
+    def __init__(self, cache_dir: str | None = None, max_bytes: int = 2 * 2**30, dtype: str | None = None): 
+        if cache_dir is None: 
+            cache_dir = os.path.join(cache_root, "analysis")
+        self.path = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        # id(raw) -> (weak reference, processing state, fingerprint). Keyed
+        # on id, as hashing a Raw hashes its samples
+        self._fingerprints = {}
+        os.makedirs(self.path, exist_ok = True)
+
+    def memoize(self, name: str, params: dict, compute): 
+        """``compute()`` the first time ``name`` is called with ``params``,
+        which must be JSON serializable, and read it back afterwards."""
+        # Entries stored in another dtype are not returned for this one
+        key = _key(name, params, self.dtype)
+        fname = os.path.join(self.path, f"{key}.npz")
+        result = self._load(fname)
+        if result is not None: 
+            return result
+
+        result = self._stored(compute())
+        self._save(fname, name, params, result)
+        self.evict()
+        return result
+
+    def get_psds( 
+            self, 
+            raw, 
+            picks, 
+            psd_func, 
+            fs, 
+            onsets, 
+            ends, 
+            n_jobs, 
+            dB, 
+            fmax, 
+            psd_func_name: str | None = None, 
+            data_key: str | None = None
+    ): 
+        """``get_psds``, computed once per recording and parameters."""
+        params = dict( 
+            _data_params(self._fingerprint(raw, data_key), picks, fs, onsets, ends), 
+            psd_func = _func_name(psd_func, psd_func_name), 
+            dB = dB, 
+            fmax = fmax
+        )
+        return self.memoize( 
+            "get_psds", 
+            params, 
+            lambda: get_psds(raw, picks, psd_func, fs, onsets, ends, n_jobs, dB, fmax)
+        )
+
+    def psd_with_CI( 
+            self, 
+            raw, 
+            picks, 
+            psd_func, 
+            fs, 
+            onsets, 
+            ends, 
+            n_jobs, 
+            dB, 
+            fmax, 
+            CI_func = jackknife_CI_z_score, 
+            alpha = 0.95, 
+            psd_func_name: str | None = None, 
+            CI_func_name: str | None = None, 
+            data_key: str | None = None
+    ): 
+        """``welch_with_CI`` of the segments' PSDs, (freqs, psd, bias,
+        lower, upper). Neither is recomputed on a hit."""
+        params = dict( 
+            _data_params(self._fingerprint(raw, data_key), picks, fs, onsets, ends), 
+            psd_func = _func_name(psd_func, psd_func_name), 
+            dB = dB, 
+            fmax = fmax, 
+            CI_func = _func_name(CI_func, CI_func_name), 
+            alpha = alpha
+        )
+
+        def compute(): 
+            freqs, psds = self.get_psds(raw, picks, psd_func, fs, onsets, ends, n_jobs, dB, fmax, psd_func_name, data_key)
+            return welch_with_CI(freqs, psds, CI_func = CI_func, alpha = alpha)
+
+        return self.memoize("welch_with_CI", params, compute)
+
+    def info(self): 
+        """Entries from most to least recently used, and their total size."""
+        entries = []
+        for fname, nbytes, last_used in self._entries(): 
+            with np.load(fname) as archive: 
+                meta = json.loads(str(archive["__meta__"]))
+            entries.append({
+                "key": os.path.basename(fname)[:-len(".npz")], 
+                "name": meta["name"], 
+                "params": meta["params"], 
+                "nbytes": nbytes, 
+                "last_used": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used))
+            })
+        entries.reverse()
+        return {
+            "path": self.path, 
+            "n_entries": len(entries), 
+            "nbytes": sum(entry["nbytes"] for entry in entries), 
+            "max_bytes": self.max_bytes, 
+            "entries": entries
+        }
+
+    def clear(self, name: str | None = None): 
+        """Delete every entry, or only those of function ``name``."""
+        for fname, _, _ in self._entries(): 
+            if name is not None: 
+                with np.load(fname) as archive: 
+                    if json.loads(str(archive["__meta__"]))["name"] != name: 
+                        continue
+            os.remove(fname)
+
+    def evict(self): 
+        entries = self._entries()
+        total = sum(nbytes for _, nbytes, _ in entries)
+        # Oldest first, the most recent entry is always kept
+        for fname, nbytes, _ in entries[:-1]: 
+            if total <= self.max_bytes: 
+                break
+            os.remove(fname)
+            total -= nbytes
+
+    def _fingerprint(self, raw, data_key = None): 
+        if data_key is not None: 
+            return raw_fingerprint(raw, data_key)
+        state = _processing_state(raw)
+        entry = self._fingerprints.get(id(raw))
+        if entry is not None and entry[0]() is raw and entry[1] == state: 
+            return entry[2]
+        fingerprint = raw_fingerprint(raw)
+        fingerprints = self._fingerprints
+        ref = weakref.ref(raw, lambda _, key = id(raw): fingerprints.pop(key, None))
+        fingerprints[id(raw)] = (ref, state, fingerprint)
+        return fingerprint
+
+    def _entries(self): 
+        # (fname, nbytes, last used), least recently used first
+        entries = []
+        for entry in os.scandir(self.path): 
+            if entry.name.endswith(".npz"): 
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        entries.sort(key = lambda entry: entry[2])
+        return entries
+
+    def _load(self, fname): 
+        try: 
+            with np.load(fname) as archive: 
+                n_arrays = len(archive.files) - 1
+                result = tuple(archive[f"arr_{i}"] for i in range(n_arrays))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile): 
+            return None
+        os.utime(fname)
+        return result
+
+    def _stored(self, result): 
+        # As read back from the cache
+        stored = []
+        for array in result: 
+            array = np.asarray(array)
+            if self.dtype is not None and array.ndim > 1 and np.issubdtype(array.dtype, np.floating): 
+                array = array.astype(self.dtype)
+            stored.append(array)
+        return tuple(stored)
+
+    def _save(self, fname, name, params, result): 
+        arrays = {f"arr_{i}": array for i, array in enumerate(result)}
+        meta = json.dumps({"name": name, "params": params})
+
+        # Written aside and renamed, so a partial entry is never read
+        tmp_fname = f"{fname[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_fname, __meta__ = np.array(meta), **arrays)
+        os.replace(tmp_fname, fname)
+
+
+def _key(name, params, dtype = None): 
+    key = hashlib.sha1()
+    key.update(json.dumps({
+        "version": _FORMAT_VERSION, 
+        "mne": mne.__version__, 
+        "name": name, 
+        "params": params, 
+        "dtype": dtype
+    }, sort_keys = True).encode())
+    return key.hexdigest()
+
+
+def _processing_state(raw): 
+    # What in-place processing of a Raw changes, cheap to compare
+    info = raw.info
+    return ( 
+        int(raw.n_times), 
+        getattr(raw, "first_samp", 0), 
+        info.get("highpass"), 
+        info.get("lowpass"), 
+        info.get("custom_ref_applied"), 
+        tuple(proj["desc"] for proj in info.get("projs", ()) if proj["active"])
+    )
+
+
+def _data_params(fingerprint, picks, fs, onsets, ends): 
+    segments = hashlib.sha1()
+    segments.update(np.ascontiguousarray(onsets, dtype = np.int64).tobytes())
+    segments.update(np.ascontiguousarray(ends, dtype = np.int64).tobytes())
+    if picks is not None and not isinstance(picks, str): 
+        picks = np.asarray(picks).tolist()
+    return {
+        "raw": fingerprint, 
+        "picks": picks, 
+        "fs": float(fs), 
+        "segments": segments.hexdigest()
+    }
+
+
+def _func_name(func, name = None): 
+    # Module-level functions are identified by name, partials of them by
+    # their arguments too. Anything else would share or never hit a key
+    if name is not None: 
+        return str(name)
+    if isinstance(func, functools.partial): 
+        try: 
+            arguments = json.dumps([func.args, func.keywords], sort_keys = True)
+        except TypeError: 
+            raise ValueError(f"{func!r} has arguments that are not JSON serializable, pass an explicit name") from None
+        return f"{_func_name(func.func)}{arguments}"
+    qualname = getattr(func, "__qualname__", None)
+    module = getattr(func, "__module__", None)
+    if qualname is None or module is None or "<" in qualname or hasattr(func, "__func__"): 
+        raise ValueError(f"{func!r} has no stable name to be cached under, pass an explicit name")
+    return f"{module}.{qualname}"
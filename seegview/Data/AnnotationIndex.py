@@ -0,0 +1,191 @@
+import numpy as np
+
+# Durations up to 2**_MIN_CLASS seconds, zero included, share a class
+_MIN_CLASS = -20
+
+class AnnotationIndex: 
+    """Interval index of annotations for visible-range and navigation queries.
+
+    All onsets are kept sorted, so the next or previous onset is a binary
+    search. For range queries, annotations are also split into classes of
+    durations up to a power of two. Within class c, sorted by onset, an
+    annotation overlapping [start, stop] starts in [start - 2**c, stop], so
+    a query costs two binary searches per class plus the annotations found.
+    ``insert`` and ``remove`` update the sorted arrays without re-sorting.
+
+    With ``per_description``, every description also gets an index of its
+    own, so queries restricted to a set of descriptions cost the same
+    searches per description instead of a scan of the other annotations.
+    """
+    def __init__(self, onsets = (), durations = (), descriptions = (), per_description: bool = True): 
+        self.onsets = np.empty(0)
+        self._classes = {}
+        self.per_description = per_description
+        self._descriptions = {}
+        # Merged onsets of description sets, for nth queries
+        self._selections = {}
+        self.insert(onsets, durations, descriptions)
+
+    @classmethod
+    def from_annotations(cls, annotations): 
+        return cls(annotations.onset, annotations.duration, annotations.description)
+
+    def __len__(self): 
+        return len(self.onsets)
+
+    @property
+    def descriptions(self): 
+        return sorted(self._descriptions)
+
+    def count(self, descriptions = None): 
+        """Number of annotations, of ``descriptions`` only if given."""
+        if descriptions is None: 
+            return len(self.onsets)
+        return sum(len(index) for index in self._select(descriptions))
+
+    def insert(self, onsets, durations, descriptions): 
+        onsets = np.atleast_1d(np.asarray(onsets, dtype = float))
+        durations = np.atleast_1d(np.asarray(durations, dtype = float))
+        descriptions = np.atleast_1d(np.asarray(descriptions, dtype = object))
+        if not len(onsets): 
+            return
+        order = np.argsort(onsets, kind = "stable")
+        onsets, durations, descriptions = onsets[order], durations[order], descriptions[order]
+        self.onsets = np.insert(self.onsets, np.searchsorted(self.onsets, onsets, side = "right"), onsets)
+        self._selections.clear()
+        if self.per_description: 
+            # Grouped by a stable sort, each group stays sorted by onset
+            labels, groups = np.unique(descriptions.astype(str), return_inverse = True)
+            order = np.argsort(groups, kind = "stable")
+            bounds = np.searchsorted(groups[order], np.arange(len(labels) + 1))
+            for label, first, last in zip(labels.tolist(), bounds[:-1], bounds[1:]): 
+                selected = order[first:last]
+                if label not in self._descriptions: 
+                    self._descriptions[label] = AnnotationIndex(per_description = False)
+                self._descriptions[label].insert(onsets[selected], durations[selected], descriptions[selected])
+
+        classes = _duration_class(durations)
+        for c in np.unique(classes): 
+            mask = classes == c
+            # (onsets, ends) of the class, with the longest duration it admits
+            times, class_descriptions, lookback = self._classes.get( 
+                c, 
+                (np.empty((2, 0)), np.empty(0, dtype = object), 2.0**c)
+            )
+            positions = times[0].searchsorted(onsets[mask], side = "right")
+            new_times = np.stack([onsets[mask], onsets[mask] + durations[mask]])
+            self._classes[c] = ( 
+                np.insert(times, positions, new_times, axis = 1), 
+                np.insert(class_descriptions, positions, descriptions[mask]), 
+                lookback
+            )
+
+    def remove(self, onset: float, duration: float, description: str): 
+        """Remove one annotation, return whether it was found."""
+        c = _duration_class(np.array([duration]))[0]
+        if c not in self._classes: 
+            return False
+        times, descriptions, lookback = self._classes[c]
+        first = times[0].searchsorted(onset, side = "left")
+        last = times[0].searchsorted(onset, side = "right")
+        for i in range(first, last): 
+            if times[1, i] == onset + duration and descriptions[i] == description: 
+                self._classes[c] = (np.delete(times, i, axis = 1), np.delete(descriptions, i), lookback)
+                self.onsets = np.delete(self.onsets, self.onsets.searchsorted(onset, side = "left"))
+                self._selections.clear()
+                if self.per_description: 
+                    index = self._descriptions[str(description)]
+                    index.remove(onset, duration, description)
+                    if not len(index): 
+                        del self._descriptions[str(description)]
+                return True
+        return False
+
+    def visible(self, start: float, stop: float, descriptions = None): 
+        """(onsets, ends, descriptions) of the annotations overlapping
+        [start, stop], sorted by onset, of ``descriptions`` only if given."""
+        if descriptions is not None: 
+            found = [index.visible(start, stop) for index in self._select(descriptions)]
+            found = [result for result in found if len(result[0])]
+            if len(found) == 1: 
+                return found[0]
+            if not found: 
+                return np.empty(0), np.empty(0), np.empty(0, dtype = object)
+            onsets, ends, found_descriptions = (np.concatenate(arrays) for arrays in zip(*found))
+            order = np.argsort(onsets, kind = "stable")
+            return onsets[order], ends[order], found_descriptions[order]
+
+        found_times = []
+        found_descriptions = []
+        for times, descriptions, lookback in self._classes.values(): 
+            onsets = times[0]
+            first = onsets.searchsorted(start - lookback, side = "left")
+            last = onsets.searchsorted(stop, side = "right")
+            if last <= first: 
+                continue
+            selected = np.flatnonzero(times[1, first:last] >= start) + first
+            found_times.append(times[:, selected])
+            found_descriptions.append(descriptions[selected])
+        if not found_times: 
+            return np.empty(0), np.empty(0), np.empty(0, dtype = object)
+        if len(found_times) == 1: 
+            times, descriptions = found_times[0], found_descriptions[0]
+        else: 
+            times = np.concatenate(found_times, axis = 1)
+            order = np.argsort(times[0], kind = "stable")
+            times = times[:, order]
+            descriptions = np.concatenate(found_descriptions)[order]
+        return times[0], times[1], descriptions
+
+    def next_onset(self, time: float, descriptions = None): 
+        """First onset after ``time``, None if there is none."""
+        if descriptions is not None: 
+            onsets = [index.next_onset(time) for index in self._select(descriptions)]
+            onsets = [onset for onset in onsets if onset is not None]
+            return min(onsets) if onsets else None
+        i = self.onsets.searchsorted(time, side = "right")
+        return self.onsets[i] if i < len(self.onsets) else None
+
+    def previous_onset(self, time: float, descriptions = None): 
+        """Last onset before ``time``, None if there is none."""
+        if descriptions is not None: 
+            onsets = [index.previous_onset(time) for index in self._select(descriptions)]
+            onsets = [onset for onset in onsets if onset is not None]
+            return max(onsets) if onsets else None
+        i = self.onsets.searchsorted(time, side = "left") - 1
+        return self.onsets[i] if i >= 0 else None
+
+    def nth_onset(self, n: int, descriptions = None): 
+        """Onset of the ``n``-th annotation by onset, negative counting
+        from the last, None if there are fewer."""
+        onsets = self.onsets
+        if descriptions is not None: 
+            onsets = self._selection_onsets(descriptions)
+        if not -len(onsets) <= n < len(onsets): 
+            return None
+        return onsets[n]
+
+    def _select(self, descriptions): 
+        if not self.per_description: 
+            raise ValueError("index was built without per_description")
+        if isinstance(descriptions, str): 
+            descriptions = [descriptions]
+        return [self._descriptions[description] for description in descriptions if description in self._descriptions]
+
+    def _selection_onsets(self, descriptions): 
+        # Merged once per set of descriptions, until the next edit
+        key = frozenset([descriptions] if isinstance(descriptions, str) else descriptions)
+        onsets = self._selections.get(key)
+        if onsets is None: 
+            indexes = self._select(key)
+            if len(indexes) == 1: 
+                onsets = indexes[0].onsets
+            else: 
+                onsets = np.sort(np.concatenate([index.onsets for index in indexes] + [np.empty(0)]))
+            self._selections[key] = onsets
+        return onsets
+
+
+def _duration_class(durations): 
+    classes = np.ceil(np.log2(np.maximum(durations, 2.0**_MIN_CLASS)))
+    return np.maximum(classes, _MIN_CLASS).astype(int)
@@ -0,0 +1,231 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+import mne
+import numpy as np
+
+class AnnotationJournal: 
+    """Append-only on-disk log of annotation edits.
+
+    The journal is a JSON-lines file. Its first line is a snapshot of the
+    annotations, every following line one edit ("add", "delete" or
+    "relabel"), identified by (onset, duration, description, ch_names,
+    extras). An edit costs
+    one appended line, flushed to disk, so edits survive a crash. A torn
+    last line is ignored on replay.
+
+    ``compact`` rewrites the journal as a new snapshot plus the edits made
+    while it ran, atomically, then exports ``events_fname`` as a BIDS
+    events.tsv (onset, duration, trial_type). Its onsets are relative to
+    the first sample, annotation onsets minus ``first_time`` (the Raw's
+    ``first_time``), and tabs and line breaks in descriptions are replaced
+    by spaces. The journal stays the source of truth, the export is never
+    replayed.
+    """
+    def __init__( 
+            self, 
+            path: str, 
+            events_fname: str | None = None, 
+            fsync: bool = True, 
+            first_time: float = 0.0
+    ): 
+        self.path = path
+        self.events_fname = events_fname
+        self.first_time = float(first_time)
+        self.fsync = fsync
+        self.n_edits = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._compaction = None
+
+    def load(self, annotations: mne.Annotations | None = None): 
+        """Replay the journal into annotations. A new journal starts from
+        a snapshot of ``annotations``."""
+        if not os.path.exists(self.path): 
+            if annotations is None: 
+                annotations = mne.Annotations([], [], [])
+            self._write_journal(json.dumps(_snapshot(annotations)), b"")
+            self._file = open(self.path, "ab")
+            return annotations.copy()
+
+        with open(self.path, "rb") as f: 
+            data = f.read()
+        if not data.endswith(b"\n"): 
+            # Drop a line torn by a crash, so the next edit starts a new line
+            data = data[:data.rfind(b"\n") + 1]
+            with open(self.path, "r+b") as f: 
+                f.truncate(len(data))
+        lines = data.split(b"\n")
+        snapshot = json.loads(lines[0])
+        entries = Counter(zip( 
+            snapshot["onsets"], 
+            snapshot["durations"], 
+            snapshot["descriptions"], 
+            map(tuple, snapshot.get("ch_names", [()]*len(snapshot["onsets"]))), 
+            map(_extras_key, snapshot.get("extras", [None]*len(snapshot["onsets"])))
+        ))
+        n_edits = 0
+        for line in lines[1:]: 
+            try: 
+                edit = json.loads(line)
+            except ValueError: 
+                continue
+            key = _edit_key(edit)
+            if edit["op"] == "add": 
+                entries[key] += 1
+            elif entries[key] > 0: 
+                entries[key] -= 1
+                if edit["op"] == "relabel": 
+                    entries[key[:2] + (edit["new_description"],) + key[3:]] += 1
+            n_edits += 1
+        self.n_edits = n_edits
+
+        keys = list(entries.elements())
+        self._file = open(self.path, "ab")
+        return mne.Annotations( 
+            onset = [key[0] for key in keys], 
+            duration = [key[1] for key in keys], 
+            description = [key[2] for key in keys], 
+            orig_time = snapshot["orig_time"], 
+            ch_names = [key[3] for key in keys], 
+            extras = [json.loads(key[4]) for key in keys]
+        )
+
+    def add(self, onset: float, duration: float, description: str, ch_names = (), extras = None): 
+        self._append(_edit("add", onset, duration, description, ch_names, extras))
+
+    def delete(self, onset: float, duration: float, description: str, ch_names = (), extras = None): 
+        self._append(_edit("delete", onset, duration, description, ch_names, extras))
+
+    def relabel( 
+            self, 
+            onset: float, 
+            duration: float, 
+            description: str, 
+            new_description: str, 
+            ch_names = (), 
+            extras = None
+    ): 
+        edit = _edit("relabel", onset, duration, description, ch_names, extras)
+        edit["new_description"] = str(new_description)
+        self._append(edit)
+
+    def compact(self, annotations: mne.Annotations, wait: bool = False): 
+        """Fold the edits into a snapshot of ``annotations``, in the
+        background unless ``wait``."""
+        if self._compaction is not None: 
+            self._compaction.join()
+        with self._lock: 
+            # Edits appended after this offset are kept after the snapshot
+            self._file.flush()
+            offset = self._file.tell()
+            snapshot = _snapshot(annotations)
+        self._compaction = threading.Thread(target = self._compact, args = (snapshot, offset), daemon = True)
+        self._compaction.start()
+        if wait: 
+            self._compaction.join()
+
+    def close(self): 
+        if self._compaction is not None: 
+            self._compaction.join()
+        with self._lock: 
+            if self._file is not None: 
+                self._file.close()
+                self._file = None
+
+    def _append(self, edit): 
+        line = (json.dumps(edit) + "\n").encode()
+        with self._lock: 
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync: 
+                os.fsync(self._file.fileno())
+            self.n_edits += 1
+
+    def _compact(self, snapshot, offset): 
+        # The snapshot is written while edits keep being appended, the lock
+        # is only taken to copy them after it and swap the files
+        tmp_path = self.path + ".tmp"
+        _write_synced(tmp_path, (json.dumps(snapshot) + "\n").encode(), "wb")
+        with self._lock: 
+            with open(self.path, "rb") as f: 
+                f.seek(offset)
+                tail = f.read()
+            _write_synced(tmp_path, tail, "ab")
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "ab")
+            self.n_edits = tail.count(b"\n")
+        if self.events_fname is not None: 
+            _write_events(self.events_fname, snapshot, self.first_time)
+
+    def _write_journal(self, header, tail): 
+        # Written aside and renamed, a crash leaves the old or the new journal
+        tmp_path = self.path + ".tmp"
+        _write_synced(tmp_path, (header + "\n").encode() + tail, "wb")
+        os.replace(tmp_path, self.path)
+
+
+def _snapshot(annotations): 
+    orig_time = annotations.orig_time
+    return {
+        "op": "snapshot", 
+        "orig_time": None if orig_time is None else orig_time.timestamp(), 
+        "onsets": np.asarray(annotations.onset, dtype = float).tolist(), 
+        "durations": np.asarray(annotations.duration, dtype = float).tolist(), 
+        "descriptions": [str(description) for description in annotations.description], 
+        "ch_names": [list(names) for names in annotations.ch_names], 
+        "extras": [dict(extras or {}) for extras in annotations.extras]
+    }
+
+
+def _edit(op, onset, duration, description, ch_names, extras): 
+    return {
+        "op": op, 
+        "onset": float(onset), 
+        "duration": float(duration), 
+        "description": str(description), 
+        "ch_names": [str(name) for name in ch_names], 
+        "extras": dict(extras or {})
+    }
+
+
+def _edit_key(edit): 
+    # Journals written before ch_names and extras were recorded lack them
+    return ( 
+        edit["onset"], 
+        edit["duration"], 
+        edit["description"], 
+        tuple(edit.get("ch_names", ())), 
+        _extras_key(edit.get("extras"))
+    )
+
+
+def _extras_key(extras): 
+    return json.dumps(extras or {}, sort_keys = True)
+
+
+def _write_synced(path, data, mode): 
+    with open(path, mode) as f: 
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_events(fname, snapshot, first_time = 0.0): 
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w", encoding = "utf-8") as f: 
+        f.write("onset\tduration\ttrial_type\n")
+        for onset, duration, description in zip(snapshot["onsets"], snapshot["durations"], snapshot["descriptions"]): 
+            onset = round(onset - first_time, 9)
+            f.write(f"{onset!r}\t{duration!r}\t{_tsv_value(description)}\n")
+    os.replace(tmp_fname, fname)
+
+
+def _tsv_value(value): 
+    # A tab or a line break would shift or split the row
+    value = re.sub(r"[\t\r\n]+", " ", str(value)).strip()
+    return value or "n/a"
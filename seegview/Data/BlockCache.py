@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+class BlockCache: 
+    """LRU cache of fixed-size sample blocks keyed by (channel, block index).
+
+    Blocks are read from any Raw-like object with a ``get_data`` method
+    (an unloaded mne Raw, a MemmapRaw, ...) and evicted least recently used
+    first once ``max_bytes`` is exceeded.
+    """
+    def __init__( 
+            self, 
+            raw, 
+            block_duration: float = 2.0, 
+            max_bytes: int = 256 * 2**20, 
+            dtype = np.float64, 
+            max_read_blocks: int = 64
+    ): 
+        self.raw = raw
+        self.dtype = np.dtype(dtype)
+        self.n_times = int(raw.n_times)
+        self.block_size = max(int(block_duration * raw.info["sfreq"]), 1)
+        self.max_bytes = max_bytes
+        # Longer reads (e.g. building an envelope pyramid) bypass the cache
+        # instead of flushing it
+        self.max_read_blocks = max_read_blocks
+
+        self.nbytes = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def n_blocks(self): 
+        return -(-self.n_times // self.block_size)
+
+    def block_range(self, start: int, stop: int): 
+        start = min(max(start, 0), self.n_times)
+        stop = min(max(stop, 0), self.n_times)
+        if stop <= start: 
+            return range(0)
+        return range(start // self.block_size, (stop - 1) // self.block_size + 1)
+
+    def read(self, ch: int, start: int, stop: int): 
+        blocks = self.block_range(start, stop)
+        if not len(blocks): 
+            return np.empty(0, dtype = self.dtype)
+        if len(blocks) > self.max_read_blocks: 
+            return self._read_raw([ch], max(start, 0), min(stop, self.n_times))[0]
+
+        self.load([ch], blocks)
+        with self._lock: 
+            parts = [self._touch((ch, b)) for b in blocks]
+        for i, b in enumerate(blocks): 
+            if parts[i] is None: 
+                # Evicted between load and read, read again outside the lock
+                block_start = b * self.block_size
+                parts[i] = self._read_raw([ch], block_start, min(block_start + self.block_size, self.n_times))[0]
+                with self._lock: 
+                    self._insert((ch, b), parts[i])
+        offset = blocks[0] * self.block_size
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return data[max(start, 0) - offset:min(stop, self.n_times) - offset]
+
+    def load(self, channels, blocks): 
+        # One raw read per block for all the channels that miss it
+        for b in blocks: 
+            with self._lock: 
+                missing = [ch for ch in channels if (ch, b) not in self._blocks]
+            if not missing: 
+                continue
+            start = b * self.block_size
+            stop = min(start + self.block_size, self.n_times)
+            data = self._read_raw(missing, start, stop)
+            with self._lock: 
+                for ch, block in zip(missing, data): 
+                    self._insert((ch, b), block)
+
+    def contains(self, ch: int, b: int): 
+        with self._lock: 
+            return (ch, b) in self._blocks
+
+    def clear(self): 
+        with self._lock: 
+            self._blocks.clear()
+            self.nbytes = 0
+
+    def _read_raw(self, channels, start, stop): 
+        data = self.raw.get_data(picks = list(channels), start = start, stop = stop)
+        data = data.astype(self.dtype, copy = False)
+        data.setflags(write = False)
+        return data
+
+    def _touch(self, key): 
+        block = self._blocks.get(key)
+        if block is not None: 
+            self._blocks.move_to_end(key)
+        return block
+
+    def _insert(self, key, block): 
+        if key in self._blocks: 
+            return
+        self._blocks[key] = block
+        self.nbytes += block.nbytes
+        while self.nbytes > self.max_bytes and len(self._blocks) > 1: 
+            _, evicted = self._blocks.popitem(last = False)
+            self.nbytes -= evicted.nbytes
+
+
+class CachedChannel: 
+    """Sliceable single channel that reads through a BlockCache."""
+    def __init__(self, cache: BlockCache, ch: int): 
+        self.cache = cache
+        self.ch = ch
+        self.dtype = cache.dtype
+        self.shape = (cache.n_times,)
+
+    def __len__(self): 
+        return self.shape[0]
+
+    def __getitem__(self, item): 
+        if isinstance(item, slice): 
+            start, stop, step = item.indices(len(self))
+            return self.cache.read(self.ch, start, stop)[::step]
+        indices = np.asarray(item)
+        if not indices.size: 
+            return np.empty(indices.shape, dtype = self.dtype)
+        first = int(indices.min())
+        block = self.cache.read(self.ch, first, int(indices.max()) + 1)
+        return block[indices - first]
+
+
+class Prefetcher: 
+    """Loads the blocks ahead of the current window in a background thread.
+
+    Connect ``on_time_params_changed`` to ``TimeManager.time_params_changed``.
+    The direction and speed of navigation are estimated from successive
+    updates, and the look-ahead grows with the speed so that holding an
+    arrow key never waits on disk. Only the latest request is served.
+    """
+    def __init__( 
+            self, 
+            cache: BlockCache, 
+            get_channels, 
+            horizon: float = 1.0, 
+            max_lookahead_windows: float = 8.0
+    ): 
+        self.cache = cache
+        self.get_channels = get_channels
+        # Wall-clock seconds of navigation to stay ahead of
+        self.horizon = horizon
+        self.max_lookahead_windows = max_lookahead_windows
+
+        self.velocity = 0.0
+        self._last_update = None
+
+        self._requests = queue.Queue()
+        self._generation = 0
+        self._stopped = False
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def on_time_params_changed(self, curr_time: float, window_duration: float): 
+        if self._stopped: 
+            return
+        now = time.monotonic()
+        if self._last_update is not None: 
+            last_time, last_now = self._last_update
+            elapsed = max(now - last_now, 1e-3)
+            velocity = (curr_time - last_time) / elapsed
+            # Jumps (annotations, long pauses) reset the estimate
+            if elapsed > 2.0 or abs(curr_time - last_time) > 2 * window_duration: 
+                self.velocity = 0.0
+            else: 
+                self.velocity = 0.5 * self.velocity + 0.5 * velocity
+        self._last_update = (curr_time, now)
+
+        sfreq = self.cache.raw.info["sfreq"]
+        lookahead = min( 
+            max(abs(self.velocity) * self.horizon, window_duration), 
+            self.max_lookahead_windows * window_duration
+        )
+        window_start = curr_time
+        window_end = curr_time + window_duration
+        if self.velocity > 0: 
+            ranges = [(window_end, window_end + lookahead)]
+        elif self.velocity < 0: 
+            ranges = [(window_start - lookahead, window_start)]
+        else: 
+            ranges = [
+                (window_end, window_end + window_duration), 
+                (window_start - window_duration, window_start)
+            ]
+        # The visible window first, then in the direction of travel
+        ranges.insert(0, (window_start, window_end))
+
+        blocks = []
+        for start, stop in ranges: 
+            blocks.extend(self.cache.block_range(int(start * sfreq), int(stop * sfreq)))
+
+        self._generation += 1
+        self._requests.put((self._generation, blocks))
+
+    def stop(self): 
+        """End the background thread, after the block being loaded."""
+        self._stopped = True
+        self._generation += 1
+        self._requests.put(None)
+
+    def _run(self): 
+        while True: 
+            request = self._requests.get()
+            if request is None: 
+                return
+            generation, blocks = request
+            channels = list(self.get_channels())
+            for b in blocks: 
+                if generation != self._generation: 
+                    # A newer request superseded this one
+                    break
+                self.cache.load(channels, [b])
@@ -0,0 +1,102 @@
+import re
+import threading
+
+import numpy as np
+
+SCALING_MODES = ("global", "channel", "shaft")
+
+class ChannelScaler: 
+    """Robust per-channel amplitude scales of a recording.
+
+    Scales are the median, over chunks of the recording, of each chunk's
+    MAD-based standard deviation estimate. They are computed once in a
+    streaming background pass and kept as one float32 per channel and
+    chunk, so looking them up while drawing is free and does not jump when
+    scrolling past artifacts. ``n_chunks`` evenly spaced chunks are used, or
+    every chunk of the recording when it is None.
+    """
+    def __init__( 
+            self, 
+            raw, 
+            chunk_duration: float = 2.0, 
+            n_chunks: int | None = 64, 
+            start: bool = True
+    ): 
+        self.raw = raw
+        self.ch_names = raw.ch_names
+        self.shafts = np.array([get_shaft_name(name) for name in self.ch_names])
+
+        sfreq = raw.info["sfreq"]
+        n_times = int(raw.n_times)
+        chunk_size = max(int(chunk_duration * sfreq), 1)
+        chunk_starts = np.arange(0, max(n_times - chunk_size, 0) + 1, chunk_size)
+        if n_chunks is not None and len(chunk_starts) > n_chunks: 
+            chunk_starts = chunk_starts[
+                np.linspace(0, len(chunk_starts) - 1, n_chunks).astype(int)
+            ]
+        self._chunks = [(start, min(start + chunk_size, n_times)) for start in chunk_starts]
+
+        self.chunk_scales = np.full( 
+            (len(self.ch_names), len(self._chunks)), np.nan, dtype = np.float32
+        )
+        self.n_done = 0
+        self.scales = None
+
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target = self.compute, daemon = True)
+        if start: 
+            self._thread.start()
+
+    @property
+    def done(self): 
+        return self.n_done == len(self._chunks)
+
+    def compute(self): 
+        for i, (start, stop) in enumerate(self._chunks): 
+            data = self.raw.get_data(start = start, stop = stop)
+            median = np.median(data, axis = -1, keepdims = True)
+            mad = np.median(np.abs(data - median), axis = -1)
+            with self._lock: 
+                # 1.4826 makes the MAD a consistent estimator of the std
+                self.chunk_scales[:, i] = 1.4826 * mad
+                self.n_done = i + 1
+                self.scales = np.nanmedian(self.chunk_scales[:, :i + 1], axis = -1)
+
+    def get_scales(self, channels, mode: str = "global"): 
+        """Per-channel scale of ``channels`` under ``mode``, None until the
+        first chunk has been processed."""
+        if mode not in SCALING_MODES: 
+            raise ValueError(f"mode must be one of {SCALING_MODES}")
+        with self._lock: 
+            scales = self.scales
+        if scales is None: 
+            return None
+        channels = np.asarray(channels)
+        if mode == "channel": 
+            return scales[channels]
+        if mode == "global": 
+            return np.full(len(channels), np.nanmedian(scales), dtype = np.float32)
+        shaft_scales = {
+            shaft: np.nanmedian(scales[self.shafts == shaft])
+            for shaft in np.unique(self.shafts[channels])
+        }
+        return np.array( 
+            [shaft_scales[shaft] for shaft in self.shafts[channels]], 
+            dtype = np.float32
+        )
+
+    def get_reference_scale(self): 
+        with self._lock: 
+            scales = self.scales
+        if scales is None: 
+            return None
+        return np.nanmedian(scales)
+
+
+def get_shaft_name(ch_name: str): 
+    # sEEG contacts are named after their shaft followed by the contact number,
+    # e.g. LA1, LA2, ... or RH'10
+    match = re.match(r"^(.*?)[\s_-]*\d+$", ch_name)
+    if match is None or not match.group(1): 
+        return ch_name
+    return match.group(1)
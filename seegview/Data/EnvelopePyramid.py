@@ -0,0 +1,110 @@
+import numpy as np
+
+class EnvelopePyramid: 
+    """Multi-resolution min/max envelope of a single trace.
+
+    Level k summarises the trace in bins of ``base_bin * factor**k`` samples,
+    keeping both the min and the max of every bin so that spikes and
+    stimulation artifacts survive any amount of decimation. Levels are built
+    lazily, in chunks of ``chunk_bins`` bins, so only the parts of the trace
+    that are viewed are read, whatever the length of the recording.
+    """
+    def __init__( 
+            self, 
+            data, 
+            base_bin: int = 8, 
+            factor: int = 4, 
+            min_bins: int = 256, 
+            chunk_bins: int = 4096
+    ): 
+        self.data = data
+        self.n_times = len(data)
+        self.base_bin = base_bin
+        self.factor = factor
+        self.chunk_bins = chunk_bins
+
+        self.bin_sizes = [base_bin]
+        while -(-self.n_times // self.bin_sizes[-1]) > min_bins: 
+            self.bin_sizes.append(self.bin_sizes[-1] * factor)
+
+        # (mins, maxs) of every chunk built so far, per level
+        self._chunks = [{} for _ in self.bin_sizes]
+
+    def select_level(self, n_samples: int, n_pixels: int): 
+        # Coarsest level that still leaves at least one bin (two points) per pixel
+        samples_per_pixel = n_samples / max(n_pixels, 1)
+        level = None
+        for k, bin_size in enumerate(self.bin_sizes): 
+            if bin_size <= samples_per_pixel: 
+                level = k
+        return level
+
+    def envelope(self, start: int, stop: int, n_pixels: int): 
+        """Return (sample_positions, values) for [start, stop), or None when
+        the window is zoomed in enough that raw samples should be drawn."""
+        start = max(start, 0)
+        stop = min(stop, self.n_times)
+        if stop <= start: 
+            return None
+        level = self.select_level(stop - start, n_pixels)
+        if level is None: 
+            return None
+
+        bin_size = self.bin_sizes[level]
+        first_bin = start // bin_size
+        last_bin = -(-stop // bin_size)
+        first_chunk = first_bin // self.chunk_bins
+        last_chunk = (last_bin - 1) // self.chunk_bins
+        parts = [self._get_chunk(level, c) for c in range(first_chunk, last_chunk + 1)]
+        offset = first_chunk * self.chunk_bins
+        mins = np.concatenate([part[0] for part in parts])[first_bin - offset:last_bin - offset]
+        maxs = np.concatenate([part[1] for part in parts])[first_bin - offset:last_bin - offset]
+
+        centers = (np.arange(first_bin, last_bin) + 0.5) * bin_size
+        centers = np.clip(centers, start, stop - 1)
+
+        positions = np.repeat(centers, 2)
+        values = np.empty(2 * len(mins), dtype = mins.dtype)
+        values[0::2] = mins
+        values[1::2] = maxs
+        return positions, values
+
+    def _get_chunk(self, level, c): 
+        chunk = self._chunks[level].get(c)
+        if chunk is not None: 
+            return chunk
+
+        if level == 0: 
+            start = c * self.chunk_bins * self.base_bin
+            data = np.asarray(self.data[start:min(start + self.chunk_bins * self.base_bin, self.n_times)])
+            mins, maxs = _reduce_bins(data, data, self.base_bin)
+        else: 
+            # Built from the factor chunks below, themselves built on demand
+            lower = [
+                self._get_chunk(level - 1, c * self.factor + i)
+                for i in range(self.factor)
+                if (c * self.factor + i) * self.chunk_bins * self.bin_sizes[level - 1] < self.n_times
+            ]
+            mins, maxs = _reduce_bins( 
+                np.concatenate([part[0] for part in lower]), 
+                np.concatenate([part[1] for part in lower]), 
+                self.factor
+            )
+        chunk = (mins.astype(np.float32, copy = False), maxs.astype(np.float32, copy = False))
+        self._chunks[level][c] = chunk
+        return chunk
+
+    @property
+    def nbytes(self): 
+        return sum(mins.nbytes + maxs.nbytes for chunks in self._chunks for mins, maxs in chunks.values())
+
+
+def _reduce_bins(mins, maxs, bin_size): 
+    n_full = len(mins) // bin_size
+    split = n_full * bin_size
+    out_mins = mins[:split].reshape(n_full, bin_size).min(axis = -1)
+    out_maxs = maxs[:split].reshape(n_full, bin_size).max(axis = -1)
+    if split < len(mins): 
+        out_mins = np.append(out_mins, mins[split:].min())
+        out_maxs = np.append(out_maxs, maxs[split:].max())
+    return out_mins, out_maxs
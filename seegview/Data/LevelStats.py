@@ -0,0 +1,222 @@
+import threading
+
+import numpy as np
+
+LEVEL_MODES = ("global", "channel", "window")
+
+class LevelStats: 
+    """Colour levels of time-frequency power from precomputed histograms.
+
+    A background pass bins the log power of the channels, chunk by chunk,
+    into ``n_bins`` fixed bins. Quantiles are then read off cumulative
+    counts instead of sorting the visible data: over all channels
+    ("global"), over a channel ("channel"), or over the chunks a window
+    overlaps ("window", approximate to a chunk). ``fetch(channel, start,
+    stop)`` returns (n_freqs, stop - start) power. ``n_chunks`` evenly
+    spaced chunks are used, or every chunk of the recording when None.
+    Channels are processed as their levels are first asked for, the most
+    recently asked first, so the displayed channel never waits for the
+    others; "global" levels ask for every channel and cover those processed
+    so far.
+    """
+    def __init__( 
+            self, 
+            fetch, 
+            n_channels: int, 
+            n_freqs: int, 
+            n_times: int, 
+            chunk_size: int, 
+            n_chunks: int | None = None, 
+            n_bins: int = 256, 
+            quantiles = (0.01, 0.99), 
+            per_frequency: bool = False, 
+            start: bool = True
+    ): 
+        self.fetch = fetch
+        self.n_channels = n_channels
+        self.n_freqs = n_freqs
+        self.n_bins = n_bins
+        self.quantiles = quantiles
+        self.per_frequency = per_frequency
+
+        self.chunk_size = max(int(chunk_size), 1)
+        chunk_starts = np.arange(0, max(n_times, 1), self.chunk_size)
+        if n_chunks is not None and len(chunk_starts) > n_chunks: 
+            chunk_starts = chunk_starts[
+                np.linspace(0, len(chunk_starts) - 1, n_chunks).astype(int)
+            ]
+        self.chunk_starts = chunk_starts
+        self._chunks = [(start, min(start + self.chunk_size, n_times)) for start in chunk_starts]
+
+        # Log10 bin edges, set from the first chunk processed
+        self.log_min = None
+        self.bin_width = None
+
+        self.chunk_hists = np.zeros((n_channels, len(self._chunks), n_bins), dtype = np.uint32)
+        self.chunk_done = np.zeros((n_channels, len(self._chunks)), dtype = bool)
+        self.freq_hists = None
+        if per_frequency: 
+            self.freq_hists = np.zeros((n_channels, n_freqs, n_bins), dtype = np.uint32)
+        self.n_done = 0
+
+        # Lookups only change when a chunk is added
+        self._levels = {}
+        self._lock = threading.Lock()
+        # Channels asked for and not processed yet, next first
+        self._queue = []
+        self._wake = threading.Condition(self._lock)
+        self._running = False
+        self._thread = None
+        if start: 
+            self.start()
+
+    @property
+    def done(self): 
+        return self.n_done == self.chunk_done.size
+
+    def start(self): 
+        if self._running: 
+            return
+        self._running = True
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def stop(self): 
+        with self._wake: 
+            self._running = False
+            self._wake.notify()
+        if self._thread is not None: 
+            self._thread.join(timeout = 1.0)
+            self._thread = None
+
+    def request(self, channels): 
+        """Process ``channels`` next, in order, in the background."""
+        with self._wake: 
+            channels = [ch for ch in dict.fromkeys(channels) if not self.chunk_done[ch].all()]
+            requested = set(channels)
+            self._queue = channels + [ch for ch in self._queue if ch not in requested]
+            self._wake.notify()
+
+    def compute(self, channels = None): 
+        """Process every chunk of ``channels``, all when None, in this thread."""
+        if channels is None: 
+            channels = range(self.n_channels)
+        for ch in channels: 
+            for i in range(len(self._chunks)): 
+                self._compute_chunk(ch, i)
+
+    def _run(self): 
+        while True: 
+            with self._wake: 
+                while self._running and not self._queue: 
+                    self._wake.wait()
+                if not self._running: 
+                    return
+                ch = self._queue[0]
+            # One chunk at a time, a newly displayed channel takes over quickly
+            missing = np.flatnonzero(~self.chunk_done[ch])
+            if len(missing): 
+                self._compute_chunk(ch, missing[0])
+            if len(missing) <= 1: 
+                with self._wake: 
+                    if self._queue and self._queue[0] == ch: 
+                        self._queue.pop(0)
+
+    def _compute_chunk(self, ch, i): 
+        if self.chunk_done[ch, i]: 
+            return
+        start, stop = self._chunks[i]
+        power = np.asarray(self.fetch(ch, start, stop))
+        log_power = np.log10(np.maximum(power, np.finfo(np.float32).tiny))
+        with self._lock: 
+            if self.log_min is None: 
+                # Leave room for channels much weaker or stronger than the first
+                low = np.floor(np.nanmin(log_power)) - 3
+                high = np.ceil(np.nanmax(log_power)) + 3
+                self.bin_width = (high - low) / self.n_bins
+                self.log_min = low
+        indices = self._bin(log_power)
+        hist = np.bincount(indices.ravel(), minlength = self.n_bins)
+        freq_hist = None
+        if self.per_frequency: 
+            offsets = np.arange(indices.shape[0])[:, np.newaxis] * self.n_bins
+            freq_hist = np.bincount( 
+                (indices + offsets).ravel(), 
+                minlength = indices.shape[0] * self.n_bins
+            ).reshape(indices.shape[0], self.n_bins)
+        with self._lock: 
+            if self.chunk_done[ch, i]: 
+                return
+            self.chunk_hists[ch, i] = hist
+            if freq_hist is not None: 
+                self.freq_hists[ch] += freq_hist.astype(np.uint32)
+            self.chunk_done[ch, i] = True
+            self.n_done += 1
+            self._levels.clear()
+
+    def get_levels(self, channel: int, mode: str = "channel", start: int | None = None, stop: int | None = None): 
+        """(vmin, vmax) of ``channel`` under ``mode``, None until the chunks
+        involved have been processed. ``start`` and ``stop`` are the window
+        samples for the "window" mode."""
+        if mode not in LEVEL_MODES: 
+            raise ValueError(f"mode must be one of {LEVEL_MODES}")
+        if mode == "global" and not self.done: 
+            self.request([channel, *range(self.n_channels)])
+        elif not self.chunk_done[channel].all(): 
+            self.request([channel])
+        if mode == "window": 
+            first = max(np.searchsorted(self.chunk_starts, start, side = "right") - 1, 0)
+            last = max(np.searchsorted(self.chunk_starts, stop, side = "left"), first + 1)
+            key = (mode, channel, first, last)
+        else: 
+            key = (mode, None if mode == "global" else channel)
+
+        with self._lock: 
+            if key in self._levels: 
+                return self._levels[key]
+            if mode == "global": 
+                hist = self.chunk_hists.sum(axis = (0, 1))
+            elif mode == "channel": 
+                hist = self.chunk_hists[channel].sum(axis = 0)
+            else: 
+                hist = self.chunk_hists[channel, first:last].sum(axis = 0)
+            levels = self._quantiles(hist)
+            if levels is None and mode == "window": 
+                # Nothing processed under this window yet
+                levels = self._quantiles(self.chunk_hists[channel].sum(axis = 0))
+            self._levels[key] = levels
+        return levels
+
+    def get_frequency_levels(self, channel: int): 
+        """(n_freqs, 2) levels of ``channel``, one row per frequency."""
+        if not self.per_frequency: 
+            raise ValueError("per_frequency histograms were not computed")
+        if not self.chunk_done[channel].all(): 
+            self.request([channel])
+        with self._lock: 
+            hists = self.freq_hists[channel].copy()
+        levels = [self._quantiles(hist) for hist in hists]
+        if any(level is None for level in levels): 
+            return None
+        return np.array(levels)
+
+    def _bin(self, log_power): 
+        indices = np.floor((log_power - self.log_min) / self.bin_width)
+        return np.clip(np.nan_to_num(indices), 0, self.n_bins - 1).astype(np.int64)
+
+    def _quantiles(self, hist): 
+        total = hist.sum()
+        if not total: 
+            return None
+        cumulative = np.cumsum(hist)
+        indices = np.searchsorted(cumulative, np.asarray(self.quantiles) * total)
+        indices = np.minimum(indices, self.n_bins - 1)
+        # Bin centers, back in power
+        return tuple(10 ** (self.log_min + (indices + 0.5) * self.bin_width))
+
+    @property
+    def nbytes(self): 
+        nbytes = self.chunk_hists.nbytes
+        if self.freq_hists is not None: 
+            nbytes += self.freq_hists.nbytes
+        return nbytes
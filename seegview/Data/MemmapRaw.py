@@ -0,0 +1,218 @@
+import configparser
+import hashlib
+import os
+
+import numpy as np
+from mne import channel_indices_by_type
+
+from seegview.config import cache_root
+
+_BV_DTYPES = {"INT_16": "<i2", "INT_32": "<i4", "IEEE_FLOAT_32": "<f4"}
+_BV_UNITS = {"v": 1.0, "mv": 1e-3, "µv": 1e-6, "μv": 1e-6, "uv": 1e-6, "nv": 1e-9}
+
+class MemmapRaw: 
+    """Out-of-core view of an mne Raw that was read with ``preload=False``.
+
+    Samples are read straight from a memory-mapped file, either the
+    BrainVision ``.eeg`` file described by ``header_fname`` or, for any other
+    format (.fif, .edf, ...), a channel-major float32 ``.npy`` cache that is
+    written once in chunks and reused afterwards. Only the pages that are
+    actually viewed become resident. Everything else (``info``,
+    ``annotations``, ``copy``, ...) is forwarded to the wrapped Raw.
+    """
+    def __init__( 
+            self, 
+            raw, 
+            header_fname: str | None = None, 
+            cache_dir: str | None = None, 
+            chunk_duration: float = 60.0
+    ): 
+        self.raw = raw
+        self.preload = False
+        self.n_times = int(raw.n_times)
+
+        if header_fname is not None and str(header_fname).endswith(".vhdr"): 
+            self._data, self._channel_axis, self._scales = _memmap_brainvision( 
+                header_fname, len(raw.ch_names)
+            )
+        else: 
+            if cache_dir is None: 
+                cache_dir = os.path.join(cache_root, "raw")
+            self._data = _memmap_cache(raw, cache_dir, chunk_duration)
+            self._channel_axis = 0
+            self._scales = None
+
+    def __getattr__(self, name): 
+        # Only called when the attribute is not found on MemmapRaw itself
+        if name == "raw": 
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def __getitem__(self, item): 
+        picks, time_slice = item
+        start, stop, _ = time_slice.indices(self.n_times)
+        data = self.get_data(picks = picks, start = start, stop = stop)
+        times = np.arange(start, stop)/self.info["sfreq"]
+        return data, times
+
+    def get_data( 
+            self, 
+            picks = None, 
+            start: int = 0, 
+            stop: int | None = None, 
+            return_times: bool = False
+    ): 
+        channels = self._pick_indices(picks)
+        start = max(int(start), 0)
+        stop = self.n_times if stop is None else min(int(stop), self.n_times)
+
+        if self._channel_axis == 0: 
+            data = self._data[channels, start:stop]
+        else: 
+            data = self._data[start:stop, channels].T
+        data = data.astype(np.float64)
+        if self._scales is not None: 
+            data *= self._scales[channels, np.newaxis]
+
+        if return_times: 
+            return data, np.arange(start, stop)/self.info["sfreq"]
+        return data
+
+    def _pick_indices(self, picks): 
+        if picks is None: 
+            return np.arange(len(self.ch_names))
+        if isinstance(picks, slice): 
+            return np.arange(len(self.ch_names))[picks]
+        if isinstance(picks, (str, int, np.integer)): 
+            picks = [picks]
+        by_type = channel_indices_by_type(self.info)
+        channels = []
+        for pick in picks: 
+            if isinstance(pick, str) and pick not in self.ch_names and pick in by_type: 
+                channels.extend(by_type[pick])
+            elif isinstance(pick, str): 
+                channels.append(self.ch_names.index(pick))
+            else: 
+                channels.append(int(pick))
+        return np.asarray(channels, dtype = int)
+
+
+def _memmap_brainvision(header_fname, n_channels): 
+    with open(header_fname, "rb") as f: 
+        content = f.read()
+    try: 
+        text = content.decode("utf-8")
+    except UnicodeDecodeError: 
+        text = content.decode("latin-1")
+    # The first line is the format identifier, not an ini section
+    text = text.split("\n", 1)[1]
+
+    cfg = configparser.ConfigParser( 
+        interpolation = None, 
+        strict = False, 
+        comment_prefixes = (";",)
+    )
+    cfg.read_string(text)
+
+    n_header_channels = cfg.getint("Common Infos", "NumberOfChannels")
+    if n_header_channels != n_channels: 
+        raise ValueError( 
+            f"{header_fname} describes {n_header_channels} channels, expected {n_channels}"
+        )
+    binary_format = cfg.get("Binary Infos", "BinaryFormat").strip()
+    if binary_format not in _BV_DTYPES: 
+        raise NotImplementedError(f"BinaryFormat {binary_format} cannot be memory-mapped")
+    dtype = np.dtype(_BV_DTYPES[binary_format])
+
+    data_fname = os.path.join( 
+        os.path.dirname(header_fname), 
+        cfg.get("Common Infos", "DataFile").strip()
+    )
+    n_times = os.path.getsize(data_fname) // (dtype.itemsize * n_channels)
+
+    orientation = cfg.get("Common Infos", "DataOrientation", fallback = "MULTIPLEXED")
+    if orientation.strip().upper() == "VECTORIZED": 
+        shape, channel_axis = (n_channels, n_times), 0
+    else: 
+        shape, channel_axis = (n_times, n_channels), 1
+    data = np.memmap(data_fname, dtype = dtype, mode = "r", shape = shape)
+
+    scales = np.ones(n_channels)
+    for i in range(n_channels): 
+        fields = cfg.get("Channel Infos", f"Ch{i + 1}", fallback = "").split(",")
+        resolution = float(fields[2]) if len(fields) > 2 and fields[2].strip() else 1.0
+        unit = fields[3].strip().lower() if len(fields) > 3 else "µv"
+        scales[i] = resolution * _BV_UNITS.get(unit, 1.0)
+    return data, channel_axis, scales
+
+
+def _memmap_cache(raw, cache_dir, chunk_duration): 
+    os.makedirs(cache_dir, exist_ok = True)
+    cache_fname = os.path.join(cache_dir, f"{raw_fingerprint(raw)}.npy")
+    if not os.path.exists(cache_fname): 
+        _convert_to_cache(raw, cache_fname, chunk_duration)
+    return np.load(cache_fname, mmap_mode = "r")
+
+
+def _convert_to_cache(raw, cache_fname, chunk_duration): 
+    # Written chunk by chunk so that conversion never needs the whole recording
+    tmp_fname = cache_fname + ".tmp.npy"
+    n_channels, n_times = len(raw.ch_names), int(raw.n_times)
+    out = np.lib.format.open_memmap( 
+        tmp_fname, 
+        mode = "w+", 
+        dtype = np.float32, 
+        shape = (n_channels, n_times)
+    )
+    step = max(int(chunk_duration * raw.info["sfreq"]), 1)
+    for start in range(0, n_times, step): 
+        stop = min(start + step, n_times)
+        out[:, start:stop] = raw.get_data(start = start, stop = stop)
+    out.flush()
+    del out
+    os.replace(tmp_fname, cache_fname)
+
+
+def raw_fingerprint(raw, key: str | None = None, chunk_duration: float = 60.0): 
+    """Hash identifying the samples of ``raw``, for on-disk caches.
+
+    Recordings backed by files are identified by their files' names, sizes
+    and modification times, the span read from them and the processing
+    recorded in ``info`` (filters, active projectors, custom reference), so
+    that a lazy and a preloaded read of one file share their caches. Only
+    recordings that live in memory alone have their samples hashed. Callers
+    that modify samples in ways ``info`` does not record pass their own
+    ``key`` instead.
+    """
+    if key is not None: 
+        return hashlib.sha1(str(key).encode()).hexdigest()
+
+    digest = hashlib.sha1()
+    on_disk = False
+    for fname in getattr(raw, "filenames", ()): 
+        if fname is None: 
+            continue
+        fname = str(fname)
+        digest.update(fname.encode())
+        if os.path.exists(fname): 
+            on_disk = True
+            stat = os.stat(fname)
+            digest.update(f"{stat.st_size}-{stat.st_mtime_ns}".encode())
+    digest.update(",".join(raw.ch_names).encode())
+    digest.update(f"{raw.n_times}-{raw.info['sfreq']}".encode())
+    # Crops of a file at different offsets share everything else
+    digest.update(f"{getattr(raw, 'first_samp', 0)}-{getattr(raw, 'last_samp', 0)}".encode())
+    digest.update(repr(list(getattr(raw, "_last_samps", ()))).encode())
+    info = raw.info
+    digest.update(f"{info.get('highpass')}-{info.get('lowpass')}-{info.get('custom_ref_applied')}".encode())
+    for proj in info.get("projs", ()): 
+        if proj["active"]: 
+            digest.update(proj["desc"].encode())
+            digest.update(np.ascontiguousarray(proj["data"]["data"]).tobytes())
+
+    if not on_disk: 
+        step = max(int(chunk_duration * info["sfreq"]), 1)
+        for start in range(0, int(raw.n_times), step): 
+            data = raw.get_data(start = start, stop = start + step)
+            digest.update(np.ascontiguousarray(data).tobytes())
+    return digest.hexdigest()
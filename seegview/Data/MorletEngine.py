@@ -0,0 +1,222 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.fft import fft, ifft, next_fast_len
+from mne.time_frequency import morlet
+
+class MorletEngine: 
+    """On-demand Morlet power of a Raw-like recording.
+
+    Instead of transforming the whole recording upfront, power is computed
+    per (channel, tile) the first time it is viewed, and kept in an LRU tile
+    cache. Each tile is one FFT convolution of the tile's samples, padded by
+    half the longest wavelet on each side, with the wavelet spectra computed
+    once. The output matches ``raw.compute_tfr("morlet", freqs, decim = decim)``
+    and exposes the ``ch_names``, ``freqs``, ``sfreq`` and ``times`` of a TFR.
+    """
+    def __init__( 
+            self, 
+            raw, 
+            freqs, 
+            n_cycles: float = 7.0, 
+            decim: int = 1, 
+            zero_mean: bool = True, 
+            tile_duration: float = 10.0, 
+            max_bytes: int = 256 * 2**20, 
+            dtype = np.float32
+    ): 
+        if decim < 1: 
+            raise ValueError("decim must be a positive integer")
+        self.raw = raw
+        self.ch_names = raw.ch_names
+        self.freqs = np.asarray(freqs, dtype = float)
+        self.n_cycles = n_cycles
+        self.zero_mean = zero_mean
+        self.decim = int(decim)
+        self.raw_sfreq = raw.info["sfreq"]
+        self.sfreq = self.raw_sfreq / self.decim
+        self.dtype = np.dtype(dtype)
+        self.streaming = getattr(raw, "streaming", False)
+
+        wavelets = morlet(self.raw_sfreq, self.freqs, n_cycles, zero_mean = zero_mean)
+        # Offsets of the 'same' convolution within the full one, per frequency
+        self._offsets = np.array([(len(w) - 1) // 2 for w in wavelets])
+        self.pad = max(len(w) for w in wavelets) // 2 + 1
+
+        # Tiles are a whole number of output samples
+        self.tile_size = max(int(tile_duration * self.sfreq), 1)
+        segment_size = self.tile_size * self.decim + 2 * self.pad
+        self.n_fft = next_fast_len(segment_size + max(len(w) for w in wavelets) - 1)
+        self._wavelet_ffts = np.stack([fft(w, self.n_fft) for w in wavelets]).astype(np.complex64)
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def n_times(self): 
+        n_times = int(self.raw.n_times)
+        if self.streaming: 
+            # Only expose power whose whole wavelet support has arrived
+            n_times = max(n_times - self.pad, 0)
+        return -(-n_times // self.decim)
+
+    @property
+    def times(self): 
+        return np.arange(self.n_times) / self.sfreq
+
+    def get(self, ch: int, start: int, stop: int, cache: bool = True): 
+        """Power of channel ``ch``, (n_freqs, stop - start), in output samples.
+        Background passes set ``cache`` to False to leave the tile cache to
+        the viewed windows."""
+        start = min(max(start, 0), self.n_times)
+        stop = min(max(stop, start), self.n_times)
+        if stop == start: 
+            return np.empty((len(self.freqs), 0), dtype = self.dtype)
+        tiles = range(start // self.tile_size, (stop - 1) // self.tile_size + 1)
+        parts = [self._get_tile(int(ch), t, cache) for t in tiles]
+        offset = tiles[0] * self.tile_size
+        power = parts[0] if len(parts) == 1 else np.concatenate(parts, axis = -1)
+        return power[:, start - offset:stop - offset]
+
+    def has_tile(self, ch: int, t: int): 
+        with self._lock: 
+            return (ch, t) in self._tiles
+
+    def clear(self): 
+        with self._lock: 
+            self._tiles.clear()
+            self.nbytes = 0
+
+    def preview(self, freq_step: int = 4, margin: float = 4.0): 
+        """A much cheaper engine over the same output samples, for previews.
+
+        It keeps every ``freq_step``-th frequency and runs on the recording
+        averaged over blocks of ``factor`` samples, the largest divisor of
+        ``decim`` that keeps the sampling rate above ``margin`` times the
+        highest frequency.
+        """
+        factor = max( 
+            (q for q in range(1, self.decim + 1)
+             if not self.decim % q and self.raw_sfreq / q >= margin * self.freqs.max()), 
+            default = 1
+        )
+        n_cycles = self.n_cycles
+        if np.ndim(n_cycles): 
+            n_cycles = np.asarray(n_cycles)[::freq_step]
+        return MorletEngine( 
+            _AveragedRaw(self.raw, factor) if factor > 1 else self.raw, 
+            self.freqs[::freq_step], 
+            n_cycles = n_cycles, 
+            decim = self.decim // factor, 
+            zero_mean = self.zero_mean, 
+            tile_duration = self.tile_size / self.sfreq, 
+            max_bytes = 0, 
+            dtype = self.dtype
+        )
+
+    def _get_tile(self, ch, t, cache = True): 
+        key = (ch, t)
+        with self._lock: 
+            tile = self._tiles.get(key)
+            if tile is not None: 
+                self._tiles.move_to_end(key)
+                return tile
+
+        tile = self._compute_tile(ch, t)
+        # The last tile of a live stream is still growing
+        if not cache: 
+            return tile
+        if not self.streaming or (t + 1) * self.tile_size <= self.n_times: 
+            with self._lock: 
+                self._insert(key, tile)
+        return tile
+
+    def _compute_tile(self, ch, t): 
+        segment, n_out = tile_segment( 
+            lambda start, stop: self.raw.get_data(picks = [ch], start = start, stop = stop)[0], 
+            int(self.raw.n_times), 
+            t, 
+            self.tile_size, 
+            self.decim, 
+            self.pad
+        )
+        power = tile_power(segment, n_out, **self.kernel)
+        power.setflags(write = False)
+        return power
+
+    @property
+    def kernel(self): 
+        """Everything ``tile_power`` needs, small enough to send to workers."""
+        return { 
+            "wavelet_ffts": self._wavelet_ffts, 
+            "offsets": self._offsets, 
+            "pad": self.pad, 
+            "decim": self.decim, 
+            "dtype": self.dtype
+        }
+
+    def _insert(self, key, tile): 
+        if key in self._tiles: 
+            return
+        self._tiles[key] = tile
+        self.nbytes += tile.nbytes
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1: 
+            _, evicted = self._tiles.popitem(last = False)
+            self.nbytes -= evicted.nbytes
+
+
+def tile_segment(read, n_samples: int, t: int, tile_size: int, decim: int, pad: int): 
+    """The padded input segment of tile ``t`` and its number of output
+    samples. ``read(start, stop)`` returns the samples of the channel."""
+    n_out = min(tile_size, -(-n_samples // decim) - t * tile_size)
+    first = t * tile_size * decim - pad
+    last = first + tile_size * decim + 2 * pad
+
+    # Zero outside the recording, as in compute_tfr
+    segment = np.zeros(last - first, dtype = np.float32)
+    read_start = max(first, 0)
+    read_stop = min(last, n_samples)
+    if read_stop > read_start: 
+        segment[read_start - first:read_stop - first] = np.nan_to_num(read(read_start, read_stop))
+    return segment, n_out
+
+
+def tile_power(segment, n_out, wavelet_ffts, offsets, pad, decim, dtype = np.float32): 
+    """Morlet power of the ``n_out`` output samples of a padded segment."""
+    n_fft = wavelet_ffts.shape[-1]
+    spectra = ifft(fft(segment, n_fft)[np.newaxis] * wavelet_ffts, axis = -1)
+    indices = pad + decim * np.arange(n_out)
+    coefs = np.take_along_axis( 
+        spectra, 
+        indices[np.newaxis] + offsets[:, np.newaxis], 
+        axis = -1
+    )
+    return (coefs.real**2 + coefs.imag**2).astype(dtype)
+
+
+class _AveragedRaw: 
+    # The means of blocks of ``factor`` samples, a cheap low-pass and decimation
+    streaming = False
+
+    def __init__(self, raw, factor): 
+        self.raw = raw
+        self.factor = factor
+        self.ch_names = raw.ch_names
+        self.info = {"sfreq": raw.info["sfreq"] / factor}
+        self.n_times = -(-int(raw.n_times) // factor)
+
+    def get_data(self, picks, start, stop): 
+        data = self.raw.get_data( 
+            picks = picks, 
+            start = start * self.factor, 
+            stop = min(stop * self.factor, int(self.raw.n_times))
+        )
+        n_out = -(-data.shape[-1] // self.factor)
+        padded = np.full(data.shape[:-1] + (n_out * self.factor,), np.nan)
+        padded[..., :data.shape[-1]] = data
+        means = np.nanmean(padded.reshape(data.shape[:-1] + (n_out, self.factor)), axis = -1)
+        # Wavelets are L2 normalized, power scales with the sampling rate
+        return means * np.sqrt(self.factor)
@@ -0,0 +1,155 @@
+import threading
+
+import numpy as np
+
+from seegview.Data.BlockCache import BlockCache, CachedChannel, Prefetcher
+from seegview.Data.StreamSource import StreamChannel
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_sample_store(raw, dtype = None): 
+    """Return the process-wide SampleStore for ``raw``, creating it if needed.
+
+    Stores are shared by every widget reading the same recording with the
+    same dtype, so opening another widget costs no extra sample memory.
+    """
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    key = (id(raw), dtype.str)
+    with _stores_lock: 
+        store = _stores.get(key)
+        if store is None: 
+            store = SampleStore(raw, dtype)
+            _stores[key] = store
+    return store
+
+
+class SampleStore: 
+    """Reference counted, read-only per-channel sample rows of a Raw.
+
+    Widgets ``acquire`` the channels they display and ``release`` them when
+    they no longer need them. Rows are loaded on first acquisition and dropped
+    once nobody holds them anymore. When the Raw is preloaded with a matching
+    dtype, rows are views into ``raw._data`` and no samples are copied at all.
+    Otherwise rows read through an LRU BlockCache whose Prefetcher can be
+    driven by a TimeManager, or straight from the ring buffer of a live
+    StreamSource.
+    """
+    def __init__(self, raw, dtype = np.float64): 
+        self.raw = raw
+        self.dtype = np.dtype(dtype)
+
+        self.ch_names = raw.ch_names
+        self.sfreq = raw.info["sfreq"]
+        # Live sources keep growing while they are displayed
+        self.streaming = getattr(raw, "streaming", False)
+
+        self._key = (id(raw), self.dtype.str)
+        self._rows = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+        self.cache = None
+        self.prefetcher = None
+        if not self.streaming and not getattr(raw, "preload", False): 
+            self.cache = BlockCache(raw, dtype = self.dtype)
+            self.prefetcher = Prefetcher(self.cache, lambda: self.loaded_channels)
+
+    @property
+    def n_times(self): 
+        return int(self.raw.n_times)
+
+    def acquire(self, picks = None): 
+        channels = self._pick_indices(picks)
+        with self._lock: 
+            missing = [ch for ch in channels if ch not in self._rows]
+            if missing: 
+                self._load(missing)
+            for ch in channels: 
+                self._counts[ch] = self._counts.get(ch, 0) + 1
+        return channels
+
+    def release(self, picks = None): 
+        channels = self._pick_indices(picks)
+        with self._lock: 
+            for ch in channels: 
+                if ch not in self._counts: 
+                    continue
+                self._counts[ch] -= 1
+                if self._counts[ch] <= 0: 
+                    del self._counts[ch]
+                    del self._rows[ch]
+            empty = not self._counts
+        if empty: 
+            with _stores_lock: 
+                removed = _stores.get(self._key) is self
+                if removed: 
+                    del _stores[self._key]
+            # A later get_sample_store builds a new store, with its own thread
+            if removed and self.prefetcher is not None: 
+                self.prefetcher.stop()
+                self.cache.clear()
+
+    def channel(self, ch: int): 
+        return self._rows[ch]
+
+    def get(self, channels, start: int, stop: int): 
+        channels = [int(ch) for ch in channels]
+        start = max(start, 0)
+        stop = min(stop, self.n_times)
+        if self.cache is not None: 
+            # Fill the missing blocks of all channels at once
+            self.cache.load(channels, self.cache.block_range(start, stop))
+        return np.stack([self._rows[ch][start:stop] for ch in channels])
+
+    def _load(self, channels): 
+        if self.streaming: 
+            for ch in channels: 
+                self._rows[ch] = StreamChannel(self.raw, ch)
+            return
+
+        if self.cache is not None: 
+            # Out-of-core, rows read blocks on access and nothing is loaded
+            for ch in channels: 
+                self._rows[ch] = CachedChannel(self.cache, ch)
+            return
+
+        row_data = self.raw._data
+        if row_data.dtype != self.dtype: 
+            row_data = row_data[channels].astype(self.dtype)
+            row_data.setflags(write = False)
+            for i, ch in enumerate(channels): 
+                self._rows[ch] = row_data[i]
+            return
+
+        # Zero-copy, just read-only views into the preloaded Raw
+        for ch in channels: 
+            row = row_data[ch]
+            row.setflags(write = False)
+            self._rows[ch] = row
+
+    def _pick_indices(self, picks): 
+        if picks is None: 
+            return list(range(len(self.ch_names)))
+        if isinstance(picks, (str, int, np.integer)): 
+            picks = [picks]
+        return [
+            self.ch_names.index(pick) if isinstance(pick, str) else int(pick)
+            for pick in picks
+        ]
+
+    @property
+    def loaded_channels(self): 
+        with self._lock: 
+            return sorted(self._rows)
+
+    @property
+    def nbytes(self): 
+        # In-memory rows only, rows sharing a base buffer are counted once
+        bases = {}
+        for row in self._rows.values(): 
+            if not isinstance(row, np.ndarray): 
+                continue
+            base = row.base if row.base is not None else row
+            bases[id(base)] = base.nbytes
+        return sum(bases.values())
@@ -0,0 +1,79 @@
+import numpy as np
+
+class SlidingWindow: 
+    """Ring-buffered window over a long array, along its last axis.
+
+    ``get(start, stop)`` only fetches the part of [start, stop) that was not
+    already held from the previous call, so scrolling costs in proportion to
+    the scroll step rather than to the window length. The ring is mirrored
+    (every sample is written at ``i`` and ``i + capacity``), which makes any
+    held window a contiguous view of the buffer without copying.
+
+    ``fetch(start, stop)`` must return an array whose last axis has length
+    ``stop - start``. Changing ``key`` (channel, scaling, ...) invalidates
+    what is held. ``length`` may be a callable for sources that grow, such
+    as a live stream.
+    """
+    def __init__(self, fetch, length: int, growth: float = 2.0): 
+        self.fetch = fetch
+        self.length = length
+        # Capacity relative to the window length, leaves room to scroll back
+        self.growth = growth
+
+        self.key = None
+        self.start = 0
+        self.stop = 0
+        self.capacity = 0
+        self._buffer = None
+
+    def get(self, start: int, stop: int, key = None): 
+        length = self.length() if callable(self.length) else self.length
+        start = min(max(start, 0), length)
+        stop = min(max(stop, start), length)
+        n = stop - start
+
+        if ( 
+            self._buffer is None
+            or key != self.key
+            or n > self.capacity
+            or stop <= self.start
+            or start >= self.stop
+        ): 
+            self._reset(start, stop, key)
+        else: 
+            if start < self.start: 
+                self._write(start, self.fetch(start, self.start))
+            if stop > self.stop: 
+                self._write(self.stop, self.fetch(self.stop, stop))
+            held_start = min(start, self.start)
+            held_stop = max(stop, self.stop)
+            if held_stop - held_start > self.capacity: 
+                held_start, held_stop = start, stop
+            self.start, self.stop = held_start, held_stop
+
+        first = start % self.capacity
+        return self._buffer[..., first:first + n]
+
+    def invalidate(self): 
+        self.key = None
+        self._buffer = None
+
+    def _reset(self, start, stop, key): 
+        data = np.asarray(self.fetch(start, stop))
+        n = stop - start
+        self.capacity = max(int(n * self.growth), 1)
+        self._buffer = np.empty( 
+            data.shape[:-1] + (2 * self.capacity,), 
+            dtype = data.dtype
+        )
+        self.key = key
+        self._write(start, data)
+        self.start, self.stop = start, stop
+
+    def _write(self, start, data): 
+        n = data.shape[-1]
+        if not n: 
+            return
+        indices = np.arange(start, start + n) % self.capacity
+        self._buffer[..., indices] = data
+        self._buffer[..., indices + self.capacity] = data
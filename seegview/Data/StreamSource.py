@@ -0,0 +1,248 @@
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+import mne
+
+class RingBuffer: 
+    """Latest ``capacity`` samples of a multichannel stream.
+
+    Samples are addressed by their absolute index since the start of the
+    stream. Samples that were overwritten, or not received yet, read as NaN.
+    """
+    def __init__(self, n_channels: int, capacity: int, dtype = np.float32): 
+        if capacity <= 0: 
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self._data = np.full((n_channels, capacity), np.nan, dtype = dtype)
+        self.n_written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def first_available(self): 
+        return max(self.n_written - self.capacity, 0)
+
+    @property
+    def nbytes(self): 
+        return self._data.nbytes
+
+    def write(self, block): 
+        block = np.asarray(block, dtype = self._data.dtype)
+        if block.ndim != 2 or block.shape[0] != self._data.shape[0]: 
+            raise ValueError("block must have shape (n_channels, n_samples)")
+        n = block.shape[1]
+        if n > self.capacity: 
+            # Only the tail of a very long block can be held
+            block = block[:, -self.capacity:]
+        with self._lock: 
+            start = self.n_written + n - block.shape[1]
+            indices = np.arange(start, start + block.shape[1]) % self.capacity
+            self._data[:, indices] = block
+            self.n_written += n
+
+    def read(self, channels, start: int, stop: int): 
+        start = max(start, 0)
+        stop = max(stop, start)
+        out = np.full((len(channels), stop - start), np.nan, dtype = self._data.dtype)
+        with self._lock: 
+            first = max(start, self.first_available)
+            last = min(stop, self.n_written)
+            if last > first: 
+                indices = np.arange(first, last) % self.capacity
+                out[:, first - start:last - start] = self._data[np.ix_(channels, indices)]
+        return out
+
+
+class StreamSource: 
+    """Raw-like view of a live acquisition, backed by a bounded RingBuffer.
+
+    A producer thread appends samples as they arrive, and widgets read the
+    stream like a Raw whose ``n_times`` keeps growing. Only the last
+    ``buffer_duration`` seconds are held, so memory does not grow with the
+    length of the session. Subclasses implement ``_read``, returning raw
+    bytes of float32 samples interleaved by channel (or None to stop), or
+    samples can be pushed directly with ``push``.
+    """
+    streaming = True
+    preload = False
+
+    def __init__( 
+            self, 
+            ch_names, 
+            sfreq: float, 
+            ch_types = "seeg", 
+            buffer_duration: float = 600.0, 
+            dtype = np.float32
+    ): 
+        self.info = mne.create_info(list(ch_names), sfreq, ch_types)
+        self.ch_names = self.info.ch_names
+        self.annotations = mne.Annotations([], [], [])
+        self.buffer = RingBuffer( 
+            len(self.ch_names), 
+            max(int(buffer_duration * sfreq), 1), 
+            dtype = dtype
+        )
+
+        self._pending = b""
+        self._running = False
+        self._thread = None
+
+    @property
+    def n_times(self): 
+        return self.buffer.n_written
+
+    @property
+    def times(self): 
+        return np.arange(self.n_times) / self.info["sfreq"]
+
+    def push(self, block): 
+        self.buffer.write(block)
+
+    def get_data(self, picks = None, start: int = 0, stop: int | None = None, return_times = False): 
+        if stop is None: 
+            stop = self.n_times
+        data = self.buffer.read(self._pick_indices(picks), start, stop)
+        if return_times: 
+            return data, np.arange(max(start, 0), max(start, 0) + data.shape[1]) / self.info["sfreq"]
+        return data
+
+    def start(self): 
+        if self._running: 
+            return
+        self._running = True
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def stop(self): 
+        self._running = False
+        if self._thread is not None: 
+            self._thread.join(timeout = 1.0)
+            self._thread = None
+
+    def _run(self): 
+        frame_size = len(self.ch_names) * 4
+        while self._running: 
+            chunk = self._read()
+            if chunk is None: 
+                break
+            self._pending += chunk
+            n_frames = len(self._pending) // frame_size
+            if not n_frames: 
+                continue
+            frames = np.frombuffer(self._pending[:n_frames * frame_size], dtype = "<f4")
+            self._pending = self._pending[n_frames * frame_size:]
+            self.push(frames.reshape(n_frames, len(self.ch_names)).T)
+        self._running = False
+
+    def _read(self): 
+        raise NotImplementedError
+
+    def _pick_indices(self, picks): 
+        if picks is None: 
+            return list(range(len(self.ch_names)))
+        if isinstance(picks, (str, int, np.integer)): 
+            picks = [picks]
+        return [
+            self.ch_names.index(pick) if isinstance(pick, str) else int(pick)
+            for pick in picks
+        ]
+
+
+class SocketStreamSource(StreamSource): 
+    """Reads float32 frames from a TCP socket, e.g. an acquisition bridge."""
+    def __init__(self, host: str, port: int, *args, chunk_size: int = 2**16, **kwargs): 
+        super().__init__(*args, **kwargs)
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+        self._socket = None
+
+    def start(self): 
+        if self._socket is None: 
+            self._socket = socket.create_connection((self.host, self.port))
+        super().start()
+
+    def stop(self): 
+        self._running = False
+        if self._socket is not None: 
+            # Unblocks the producer thread's recv, which close alone does not
+            try: 
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError: 
+                pass
+        # Joined before the socket goes, the thread never sees it closed
+        super().stop()
+        if self._socket is not None: 
+            self._socket.close()
+            self._socket = None
+
+    def _read(self): 
+        sock = self._socket
+        if sock is None: 
+            return None
+        try: 
+            chunk = sock.recv(self.chunk_size)
+        except OSError: 
+            return None
+        # An empty read means the peer closed the connection
+        return chunk or None
+
+
+class FileStreamSource(StreamSource): 
+    """Tails a growing file of float32 frames, a stand-in for a live device."""
+    def __init__(self, fname, *args, poll_interval: float = 0.02, chunk_size: int = 2**16, **kwargs): 
+        super().__init__(*args, **kwargs)
+        self.fname = fname
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self._file = None
+
+    def start(self): 
+        if self._file is None: 
+            self._file = open(self.fname, "rb")
+        super().start()
+
+    def stop(self): 
+        super().stop()
+        if self._file is not None: 
+            self._file.close()
+            self._file = None
+
+    def _read(self): 
+        while self._running: 
+            chunk = self._file.read(self.chunk_size)
+            if chunk: 
+                return chunk
+            if not os.path.exists(self.fname): 
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+
+class StreamChannel: 
+    """Sliceable single channel of a StreamSource, indexed by absolute sample."""
+    def __init__(self, source: StreamSource, ch: int): 
+        self.source = source
+        self.ch = ch
+        self.dtype = source.buffer.dtype
+
+    @property
+    def shape(self): 
+        return (self.source.n_times,)
+
+    def __len__(self): 
+        return self.source.n_times
+
+    def __getitem__(self, item): 
+        if isinstance(item, slice): 
+            start, stop, step = item.indices(len(self))
+            return self.source.buffer.read([self.ch], start, stop)[0, ::step]
+        indices = np.asarray(item)
+        if not indices.size: 
+            return np.empty(indices.shape, dtype = self.dtype)
+        first = int(indices.min())
+        data = self.source.buffer.read([self.ch], first, int(indices.max()) + 1)[0]
+        return data[indices - first]
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from seegview.config import cache_root
+from seegview.Data.MemmapRaw import raw_fingerprint
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRStore import TFRStore
+
+_FORMAT_VERSION = 2
+
+class TFRCache: 
+    """MorletEngine power persisted in a content-addressed on-disk cache.
+
+    The cache directory is named after a hash of the recording, its
+    channels and the TFR parameters. It holds the power as a memory-mapped
+    TFRStore, plus which (channel, tile) have been computed. Tiles are
+    computed by the engine the first time they are read and written
+    through, so a later session on the same data reads them from disk
+    without loading the TFR into memory. ``data_key`` replaces the
+    recording's fingerprint, for samples modified in ways its ``info`` does
+    not record.
+    """
+    streaming = False
+
+    def __init__( 
+            self, 
+            engine: MorletEngine, 
+            dtype: str = "float32", 
+            cache_dir: str | None = None, 
+            data_key: str | None = None
+    ): 
+        if engine.streaming: 
+            raise ValueError("live streams cannot be cached")
+        if cache_dir is None: 
+            cache_dir = os.path.join(cache_root, "tfr")
+        self.engine = engine
+        self.ch_names = engine.ch_names
+        self.freqs = engine.freqs
+        self.sfreq = engine.sfreq
+        self.n_times = engine.n_times
+        self.tile_size = engine.tile_size
+
+        self.key = tfr_cache_key(engine, dtype, data_key)
+        self.path = os.path.join(cache_dir, self.key)
+        if not os.path.exists(os.path.join(self.path, "meta.json")): 
+            _create(self.path, engine, dtype)
+        self.store, self.done = _open(self.path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str): 
+        """Open an existing entry without its engine, to write tiles that
+        are computed elsewhere, e.g. in worker processes."""
+        cache = cls.__new__(cls)
+        cache.engine = None
+        cache.key = os.path.basename(os.path.normpath(path))
+        cache.path = path
+        cache.store, cache.done = _open(path)
+        cache.ch_names = cache.store.ch_names
+        cache.freqs = cache.store.freqs
+        cache.sfreq = cache.store.sfreq
+        cache.n_times = cache.store.n_times
+        cache.tile_size = cache.store.block_size
+        cache._lock = threading.Lock()
+        return cache
+
+    @property
+    def times(self): 
+        return np.arange(self.n_times) / self.sfreq
+
+    @property
+    def n_tiles(self): 
+        return self.done.shape[1]
+
+    @property
+    def complete(self): 
+        return bool(self.done.all())
+
+    def get(self, ch: int, start: int, stop: int, cache: bool = True): 
+        """Float32 power of channel ``ch``, (n_freqs, stop - start). With
+        ``cache`` False, missing tiles are computed but not persisted."""
+        start = min(max(start, 0), self.n_times)
+        stop = min(max(stop, start), self.n_times)
+        if stop == start: 
+            return self.store.get(ch, start, stop)
+        tiles = range(start // self.tile_size, (stop - 1) // self.tile_size + 1)
+        if cache: 
+            for t in tiles: 
+                self.fill_tile(int(ch), t)
+            return self.store.get(ch, start, stop)
+
+        parts = []
+        for t in tiles: 
+            tile_start = max(t * self.tile_size, start)
+            tile_stop = min((t + 1) * self.tile_size, stop)
+            if self.done[ch, t]: 
+                parts.append(self.store.get(ch, tile_start, tile_stop))
+            else: 
+                parts.append(self.engine.get(int(ch), tile_start, tile_stop, cache = False))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis = -1)
+
+    def has_tile(self, ch: int, t: int): 
+        return bool(self.done[ch, t])
+
+    def fill_tile(self, ch: int, t: int): 
+        if self.done[ch, t]: 
+            return
+        start = t * self.tile_size
+        power = self.engine.get(ch, start, min(start + self.tile_size, self.n_times), cache = False)
+        self.write_tile(ch, t, power)
+
+    def write_tile(self, ch: int, t: int, power): 
+        """Store the power of tile ``t`` of channel ``ch``, computed elsewhere."""
+        with self._lock: 
+            if self.done[ch, t]: 
+                return
+            self.store.write(ch, t * self.tile_size, power)
+            # Flushed before being marked done, a crash never leaves a done
+            # tile without its power
+            self.flush()
+            self.done[ch, t] = True
+            self.done.flush()
+
+    def fill(self, channels = None): 
+        """Compute every missing tile of ``channels``, all when None."""
+        if channels is None: 
+            channels = range(len(self.ch_names))
+        for ch in channels: 
+            for t in range(self.n_tiles): 
+                self.fill_tile(ch, t)
+        self.flush()
+
+    def flush(self): 
+        for array in (self.store.data, self.store.log_min, self.store.log_max, self.done): 
+            array.flush()
+
+    def clear(self): 
+        """Delete this TFR from the cache."""
+        self.store = None
+        self.done = None
+        shutil.rmtree(self.path, ignore_errors = True)
+
+
+def tfr_cache_key(engine: MorletEngine, dtype: str = "float32", data_key: str | None = None): 
+    key = hashlib.sha1()
+    key.update(raw_fingerprint(engine.raw, data_key).encode())
+    key.update(json.dumps({
+        "version": _FORMAT_VERSION, 
+        "ch_names": list(engine.ch_names), 
+        "freqs": engine.freqs.tolist(), 
+        # Scalar or per frequency, ints or floats, all hash alike
+        "n_cycles": np.broadcast_to(np.asarray(engine.n_cycles, dtype = float), engine.freqs.shape).tolist(), 
+        "decim": engine.decim, 
+        "zero_mean": engine.zero_mean, 
+        "tile_size": engine.tile_size, 
+        "dtype": dtype
+    }).encode())
+    return key.hexdigest()
+
+
+def _create(path, engine, dtype): 
+    # Built aside and renamed, so a half created entry is never opened
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors = True)
+    os.makedirs(tmp_path)
+
+    n_channels, n_freqs, n_times = len(engine.ch_names), len(engine.freqs), engine.n_times
+    np.lib.format.open_memmap( 
+        os.path.join(tmp_path, "power.npy"), 
+        mode = "w+", 
+        dtype = dtype, 
+        shape = (n_channels, n_freqs, n_times)
+    ).flush()
+    # Quantization ranges per tile, tiles are computed in any order
+    n_tiles = -(-n_times // engine.tile_size)
+    for name in ("log_min", "log_max"): 
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.full((n_channels, n_freqs, n_tiles), np.nan, dtype = np.float32))
+    np.save(os.path.join(tmp_path, "done.npy"), np.zeros((n_channels, n_tiles), dtype = bool))
+
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f: 
+        json.dump({
+            "version": _FORMAT_VERSION, 
+            "ch_names": list(engine.ch_names), 
+            "freqs": engine.freqs.tolist(), 
+            "sfreq": engine.sfreq, 
+            "n_times": n_times, 
+            "tile_size": engine.tile_size, 
+            "dtype": dtype
+        }, f)
+    shutil.rmtree(path, ignore_errors = True)
+    os.replace(tmp_path, path)
+
+
+def _open(path): 
+    with open(os.path.join(path, "meta.json")) as f: 
+        meta = json.load(f)
+
+    def load(name): 
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode = "r+")
+
+    store = TFRStore( 
+        meta["ch_names"], 
+        meta["freqs"], 
+        meta["sfreq"], 
+        meta["n_times"], 
+        dtype = meta["dtype"], 
+        data = load("power"), 
+        log_min = load("log_min"), 
+        log_max = load("log_max"), 
+        block_size = meta["tile_size"]
+    )
+    return store, load("done")
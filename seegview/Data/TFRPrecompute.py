@@ -0,0 +1,156 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from seegview.Data.MorletEngine import MorletEngine, tile_power, tile_segment
+from seegview.Data.TFRCache import TFRCache
+
+def precompute_tfr( 
+        cache: TFRCache, 
+        channels = None, 
+        n_jobs: int | None = None, 
+        max_shared_bytes: int = 2**30, 
+        tiles_per_task: int = 32, 
+        progress = None
+): 
+    """Compute every missing tile of ``channels`` of a TFRCache in parallel.
+
+    Channels are processed in batches whose samples fit ``max_shared_bytes``.
+    Each batch is read once into shared memory, which the workers map
+    instead of receiving pickled samples. Tasks are runs of up to
+    ``tiles_per_task`` missing tiles of one channel, which the workers write
+    to the cache themselves, so no power crosses process boundaries and the
+    TFR never has to fit in memory. ``progress(n_done, n_total)`` is called
+    in tiles after every task.
+    """
+    engine = cache.engine
+    if channels is None: 
+        channels = range(len(cache.ch_names))
+    channels = [ch for ch in channels if not cache.done[ch].all()]
+    if n_jobs is None: 
+        n_jobs = os.cpu_count() or 1
+    if tiles_per_task < 1: 
+        raise ValueError("tiles_per_task must be a positive integer")
+
+    n_total = sum(int((~cache.done[ch]).sum()) for ch in channels)
+    n_done = 0
+    n_times = int(engine.raw.n_times)
+    batch_size = max(max_shared_bytes // (4 * max(n_times, 1)), 1)
+    # Pending writes reach the file before workers map it
+    cache.flush()
+
+    with ProcessPoolExecutor( 
+            max_workers = n_jobs, 
+            initializer = _init_worker, 
+            initargs = (engine.kernel, cache.path)
+    ) as pool: 
+        for first in range(0, len(channels), batch_size): 
+            batch = channels[first:first + batch_size]
+            shm = shared_memory.SharedMemory(create = True, size = max(4 * len(batch) * n_times, 1))
+            try: 
+                samples = np.ndarray((len(batch), n_times), dtype = np.float32, buffer = shm.buf)
+                _read_samples(engine.raw, batch, samples)
+
+                futures = []
+                for row, ch in enumerate(batch): 
+                    missing = np.flatnonzero(~cache.done[ch]).tolist()
+                    for i in range(0, len(missing), tiles_per_task): 
+                        tiles = missing[i:i + tiles_per_task]
+                        futures.append(pool.submit(_compute_tiles, shm.name, samples.shape, row, ch, tiles))
+                for future in as_completed(futures): 
+                    n_done += future.result()
+                    if progress is not None: 
+                        progress(n_done, n_total)
+                del samples
+            finally: 
+                shm.close()
+                shm.unlink()
+
+
+def _read_samples(raw, channels, out, chunk_duration = 60.0): 
+    # Chunked, so that no float64 copy of the whole batch is made
+    step = max(int(chunk_duration * raw.info["sfreq"]), 1)
+    for start in range(0, out.shape[1], step): 
+        stop = min(start + step, out.shape[1])
+        out[:, start:stop] = raw.get_data(picks = list(channels), start = start, stop = stop)
+
+
+# Worker side, one kernel and cache per process and the current batch mapped once
+_kernel = None
+_cache = None
+_shared = {}
+
+def _init_worker(kernel, cache_path): 
+    global _kernel, _cache
+    _kernel = kernel
+    _cache = TFRCache.open(cache_path)
+
+
+def _attach(name, shape): 
+    if name not in _shared: 
+        for shm, _ in _shared.values(): 
+            shm.close()
+        _shared.clear()
+        shm = shared_memory.SharedMemory(name = name)
+        _shared[name] = (shm, np.ndarray(shape, dtype = np.float32, buffer = shm.buf))
+    return _shared[name][1]
+
+
+def _compute_tiles(name, shape, row, ch, tiles): 
+    samples = _attach(name, shape)[row]
+    for t in tiles: 
+        segment, n_out = tile_segment( 
+            lambda start, stop: samples[start:stop], 
+            len(samples), 
+            t, 
+            _cache.tile_size, 
+            _kernel["decim"], 
+            _kernel["pad"]
+        )
+        _cache.write_tile(ch, t, tile_power(segment, n_out, **_kernel))
+    return len(tiles)
+
+
+if __name__ == "__main__": 
+    import mne
+
+    parser = argparse.ArgumentParser( 
+        description = "Precompute the Morlet TFR of a recording into the seegview cache"
+    )
+    parser.add_argument("fname", help = "recording, any format mne.io.read_raw reads")
+    parser.add_argument("--fmin", type = float, default = 2.0)
+    parser.add_argument("--fmax", type = float, default = 51.0)
+    parser.add_argument("--fstep", type = float, default = 1.0)
+    parser.add_argument("--n-cycles", type = float, default = 7.0)
+    parser.add_argument("--decim", type = int, default = 100)
+    parser.add_argument("--dtype", default = "float32")
+    parser.add_argument("--picks", nargs = "*", default = None, help = "channel names, all by default")
+    parser.add_argument("--n-jobs", type = int, default = None)
+    parser.add_argument("--cache-dir", default = None)
+    args = parser.parse_args()
+
+    raw = mne.io.read_raw(args.fname, preload = False, verbose = False)
+    engine = MorletEngine( 
+        raw, 
+        freqs = np.arange(args.fmin, args.fmax + args.fstep / 2, args.fstep), 
+        n_cycles = args.n_cycles, 
+        decim = args.decim
+    )
+    cache = TFRCache(engine, dtype = args.dtype, cache_dir = args.cache_dir)
+    channels = None
+    if args.picks: 
+        channels = [raw.ch_names.index(name) for name in args.picks]
+
+    start_time = time.monotonic()
+
+    def report(n_done, n_total): 
+        if n_done == n_total or not n_done % 100: 
+            elapsed = time.monotonic() - start_time
+            print(f"{n_done}/{n_total} tiles, {elapsed:.1f} s", flush = True)
+
+    precompute_tfr(cache, channels = channels, n_jobs = args.n_jobs, progress = report)
+    print(f"Done: {cache.path}")
@@ -0,0 +1,134 @@
+import numpy as np
+
+POOLING_MODES = ("mean", "max")
+
+class TFRPyramid: 
+    """Multi-resolution time-frequency power of a single channel.
+
+    Level k pools power over bins of ``base_bin * factor**k`` time samples,
+    by mean or max. Levels are built lazily, in chunks of ``chunk_bins``
+    bins, from ``fetch(start, stop)`` returning (n_freqs, stop - start)
+    power, so only the parts of the recording that are viewed are pooled.
+    """
+    def __init__( 
+            self, 
+            fetch, 
+            n_times: int, 
+            pooling: str = "mean", 
+            base_bin: int = 4, 
+            factor: int = 4, 
+            min_bins: int = 256, 
+            chunk_bins: int = 256
+    ): 
+        if pooling not in POOLING_MODES: 
+            raise ValueError(f"pooling must be one of {POOLING_MODES}")
+        self.fetch = fetch
+        self.n_times = n_times
+        self.pooling = pooling
+        self.base_bin = base_bin
+        self.factor = factor
+        self.chunk_bins = chunk_bins
+
+        self.bin_sizes = [base_bin]
+        while -(-n_times // self.bin_sizes[-1]) > min_bins: 
+            self.bin_sizes.append(self.bin_sizes[-1] * factor)
+
+        self._chunks = [{} for _ in self.bin_sizes]
+
+    def select_level(self, n_samples: int, n_pixels: int): 
+        # Coarsest level that still leaves at least one bin per pixel
+        samples_per_pixel = n_samples / max(n_pixels, 1)
+        level = None
+        for k, bin_size in enumerate(self.bin_sizes): 
+            if bin_size <= samples_per_pixel: 
+                level = k
+        return level
+
+    def image(self, start: int, stop: int, n_pixels: int): 
+        """Return (first_sample, last_sample, pooled power) covering
+        [start, stop), or None when the window is zoomed in enough that
+        the power should be drawn as is."""
+        start = max(start, 0)
+        stop = min(stop, self.n_times)
+        if stop <= start: 
+            return None
+        level = self.select_level(stop - start, n_pixels)
+        if level is None: 
+            return None
+
+        bin_size = self.bin_sizes[level]
+        first_bin = start // bin_size
+        last_bin = -(-stop // bin_size)
+        first_chunk = first_bin // self.chunk_bins
+        last_chunk = (last_bin - 1) // self.chunk_bins
+        parts = [self._get_chunk(level, c) for c in range(first_chunk, last_chunk + 1)]
+        pooled = parts[0] if len(parts) == 1 else np.concatenate(parts, axis = -1)
+        offset = first_chunk * self.chunk_bins
+        pooled = pooled[:, first_bin - offset:last_bin - offset]
+        return first_bin * bin_size, min(last_bin * bin_size, self.n_times), pooled
+
+    def invalidate(self, start: int, stop: int): 
+        """Drop the pooled chunks covering [start, stop), at every level,
+        e.g. when the power there has been refined."""
+        for bin_size, chunks in zip(self.bin_sizes, self._chunks): 
+            span = bin_size * self.chunk_bins
+            for c in range(start // span, (stop - 1) // span + 1): 
+                chunks.pop(c, None)
+
+    def _get_chunk(self, level, c): 
+        chunk = self._chunks[level].get(c)
+        if chunk is not None: 
+            return chunk
+
+        bin_size = self.bin_sizes[level]
+        first_bin = c * self.chunk_bins
+        n_bins = self.chunk_bins
+        if level == 0: 
+            start = first_bin * bin_size
+            data = np.asarray(self.fetch(start, min(start + n_bins * bin_size, self.n_times)))
+            chunk = self._pool(data, self.base_bin, 1, self.n_times - start)
+        else: 
+            # Built from the factor chunks below, themselves built on demand
+            lower = [
+                self._get_chunk(level - 1, c * self.factor + i)
+                for i in range(self.factor)
+                if (c * self.factor + i) * self.chunk_bins * self.bin_sizes[level - 1] < self.n_times
+            ]
+            lower = lower[0] if len(lower) == 1 else np.concatenate(lower, axis = -1)
+            lower_size = self.bin_sizes[level - 1]
+            chunk = self._pool( 
+                lower, 
+                self.factor, 
+                lower_size, 
+                self.n_times - first_bin * bin_size
+            )
+        chunk = chunk.astype(np.float32, copy = False)
+        self._chunks[level][c] = chunk
+        return chunk
+
+    def _pool(self, data, factor, sample_size, n_samples): 
+        # data holds bins of sample_size samples, the last one possibly partial
+        n_in = data.shape[-1]
+        n_out = -(-n_in // factor)
+        padded = n_out * factor
+        if self.pooling == "max": 
+            if padded > n_in: 
+                data = np.concatenate( 
+                    [data, np.full((data.shape[0], padded - n_in), -np.inf, dtype = data.dtype)], 
+                    axis = -1
+                )
+            return data.reshape(data.shape[0], n_out, factor).max(axis = -1)
+
+        # Bins are weighted by the number of samples they cover
+        weights = np.minimum(n_samples - np.arange(n_in) * sample_size, sample_size).astype(float)
+        weights = np.concatenate([weights, np.zeros(padded - n_in)])
+        data = np.concatenate( 
+            [data, np.zeros((data.shape[0], padded - n_in), dtype = data.dtype)], 
+            axis = -1
+        )
+        sums = (data * weights).reshape(data.shape[0], n_out, factor).sum(axis = -1)
+        return sums / weights.reshape(n_out, factor).sum(axis = -1)
+
+    @property
+    def nbytes(self): 
+        return sum(chunk.nbytes for chunks in self._chunks for chunk in chunks.values())
@@ -0,0 +1,151 @@
+import numpy as np
+
+TFR_DTYPES = ("float32", "float16", "uint16", "uint8")
+
+class TFRStore: 
+    """Compact (n_channels, n_freqs, n_times) storage of TFR power.
+
+    float32 keeps power as is. float16 keeps log10 power, as power itself
+    underflows half precision. uint16 and uint8 quantize log10 power
+    linearly between a floor and a maximum per channel, frequency and block
+    of ``block_size`` samples (the whole recording by default). The floor
+    is a low percentile, as the troughs of wavelet power reach arbitrarily
+    small values; power below it is clipped to it. A block's range is taken
+    from the first write that covers it whole, so blocks written in any
+    order are quantized alike.
+    ``get`` always returns float32 power, so display transforms such as dB
+    run on the visible slice only. ``data`` can be a preallocated array of
+    the storage dtype, e.g. a memmap.
+    """
+    streaming = False
+
+    def __init__( 
+            self, 
+            ch_names, 
+            freqs, 
+            sfreq: float, 
+            n_times: int, 
+            dtype: str = "float32", 
+            data = None, 
+            log_min = None, 
+            log_max = None, 
+            block_size: int | None = None
+    ): 
+        if dtype not in TFR_DTYPES: 
+            raise ValueError(f"dtype must be one of {TFR_DTYPES}")
+        self.ch_names = list(ch_names)
+        self.freqs = np.asarray(freqs, dtype = float)
+        self.sfreq = sfreq
+        self.n_times = int(n_times)
+        self.dtype = dtype
+
+        shape = (len(self.ch_names), len(self.freqs), self.n_times)
+        if data is None: 
+            data = np.zeros(shape, dtype = dtype)
+        elif data.shape != shape or data.dtype != np.dtype(dtype): 
+            raise ValueError(f"data must be a {dtype} array of shape {shape}")
+        self.data = data
+
+        # Quantization range of log10 power, NaN until a block is written
+        self.block_size = max(int(block_size or self.n_times), 1)
+        range_shape = shape[:2] + (-(-self.n_times // self.block_size),)
+        if log_min is None: 
+            log_min = np.full(range_shape, np.nan, dtype = np.float32)
+        if log_max is None: 
+            log_max = np.full(range_shape, np.nan, dtype = np.float32)
+        self.log_min = log_min
+        self.log_max = log_max
+
+    @classmethod
+    def from_tfr(cls, tf, dtype: str = "float32"): 
+        """Convert an mne TFR channel by channel, without a full size copy."""
+        store = cls(tf.ch_names, tf.freqs, tf.sfreq, tf.data.shape[-1], dtype = dtype)
+        for ch in range(len(store.ch_names)): 
+            store.set_channel(ch, tf.data[ch])
+        return store
+
+    @property
+    def quantized(self): 
+        return np.issubdtype(np.dtype(self.dtype), np.integer)
+
+    @property
+    def times(self): 
+        return np.arange(self.n_times) / self.sfreq
+
+    @property
+    def nbytes(self): 
+        return self.data.nbytes + self.log_min.nbytes + self.log_max.nbytes
+
+    def set_channel(self, ch: int, power): 
+        """Store the power of a whole channel, (n_freqs, n_times)."""
+        self.write(ch, 0, power)
+
+    def write(self, ch: int, start: int, power): 
+        """Store power of channel ``ch`` from sample ``start`` on."""
+        power = np.asarray(power)
+        stop = start + power.shape[-1]
+        if self.quantized: 
+            for b in range(start // self.block_size, -(-stop // self.block_size)): 
+                block_start = b * self.block_size
+                block_stop = min(block_start + self.block_size, self.n_times)
+                if start <= block_start and block_stop <= stop: 
+                    self.log_min[ch, :, b], self.log_max[ch, :, b] = _log_range( 
+                        power[:, block_start - start:block_stop - start]
+                    )
+                elif np.isnan(self.log_min[ch, :, b]).any(): 
+                    # Partial write before the block range is known, leave
+                    # a decade of room on either side of it
+                    low, high = _log_range(power[:, max(block_start - start, 0):block_stop - start])
+                    self.log_min[ch, :, b] = low - 1
+                    self.log_max[ch, :, b] = high + 1
+        self.data[ch, :, start:stop] = self._encode(ch, power, start)
+
+    def get(self, ch: int, start: int, stop: int, cache: bool = True): 
+        """Float32 power of channel ``ch``, (n_freqs, stop - start)."""
+        start = min(max(start, 0), self.n_times)
+        stop = min(max(stop, start), self.n_times)
+        return self._decode(ch, self.data[ch, :, start:stop], start)
+
+    def _encode(self, ch, power, start): 
+        if self.dtype == "float32": 
+            return power
+        log_power = _log10(power)
+        if self.dtype == "float16": 
+            return log_power
+        n_levels = np.iinfo(self.dtype).max
+        low, scale = self._scale(ch, start, start + power.shape[-1])
+        codes = np.rint((log_power - low) / scale)
+        return np.clip(np.nan_to_num(codes), 0, n_levels)
+
+    def _decode(self, ch, values, start): 
+        if self.dtype == "float32": 
+            return np.asarray(values)
+        if self.dtype == "float16": 
+            return np.power(10, values, dtype = np.float32)
+        low, scale = self._scale(ch, start, start + values.shape[-1])
+        log_power = low + values * scale
+        return np.power(10, log_power, dtype = np.float32)
+
+    def _scale(self, ch, start, stop): 
+        # (n_freqs, stop - start) floor and step of every sample's block
+        blocks = np.arange(start, stop) // self.block_size
+        first = start // self.block_size
+        last = -(-stop // self.block_size)
+        low = np.asarray(self.log_min[ch, :, first:last])
+        high = np.asarray(self.log_max[ch, :, first:last])
+        span = high - low
+        span = np.where(span > 0, span, 1.0)
+        scale = (span / np.iinfo(self.dtype).max).astype(np.float32)
+        return low[:, blocks - first], scale[:, blocks - first]
+
+
+def _log_range(power, floor_percentile = 0.1): 
+    log_power = _log10(power)
+    return ( 
+        np.nanpercentile(log_power, floor_percentile, axis = -1), 
+        np.nanmax(log_power, axis = -1)
+    )
+
+
+def _log10(power): 
+    return np.log10(np.maximum(power, np.finfo(np.float32).tiny), dtype = np.float32)
@@ -1,26 +1,59 @@
+import zlib
+
 from PyQt5.QtCore import QObject, pyqtSignal
 import pyqtgraph as pf
 from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QInputDialog
 
 import pyqtgraph as pg
 
 import numpy as np
 
+from seegview.Data.AnnotationIndex import AnnotationIndex
+from seegview.Data.AnnotationJournal import AnnotationJournal
+from seegview.Widgets.AnnotationDensityItem import AnnotationDensityItem
+
 class AnnotationsManager(QObject): 
     
     def __init__(
             self, 
             annotations, 
             current_time, 
-            window_duration):
+            window_duration, 
+            max_density: float = 0.05, 
+            n_labels: int = 3, 
+            journal: AnnotationJournal | None = None, 
+            edit_description: str = "BAD", 
+            compact_every: int = 1000, 
+            selected_descriptions = None, 
+            filter_display: bool = True): 
         super().__init__()
+        # With a journal, annotations are replayed from it and can be edited
+        # in the plots, each edit being appended to it
+        self.journal = journal
+        if journal is not None: 
+            annotations = journal.load(annotations)
+        self.edit_description = edit_description
+        self.compact_every = compact_every
         self.annotations = annotations
+        # Visible-range and navigation queries, instead of scanning every annotation
+        self.index = None
+        self._index_key = None
+        if annotations is not None: 
+            self.index = AnnotationIndex.from_annotations(annotations)
+            self._index_key = _annotations_key(annotations)
         self.plots = {}
         self.display_annotations = True
 
         self.current_time = current_time
         self.window_duration = window_duration
 
+        # Above max_density annotations per pixel, a plot draws them all as
+        # one AnnotationDensityItem, labelling the n_labels nearest the cursor
+        self.max_density = max_density
+        self.n_labels = n_labels
+        self.visible = (np.empty(0), np.empty(0), np.empty(0, dtype = object))
+
         self.line_params = dict(            
             angle = 90, 
             pen = pg.mkPen(color = "b", width = 2, style = Qt.DashLine), 
@@ -33,6 +66,14 @@ class AnnotationsManager(QObject):
                 movable = False
             )
 
+        # Navigation goes through the annotations of the selected
+        # descriptions only, None selects all, and with filter_display
+        # only those are drawn. Selected last, selecting redraws
+        self.selected_descriptions = None
+        self.filter_display = filter_display
+        if selected_descriptions is not None: 
+            self.select_descriptions(selected_descriptions)
+
     
     def register_plot(
             self, 
@@ -41,44 +82,190 @@ class AnnotationsManager(QObject):
 
         if plot_name is None: 
             plot_name = str(plot_widget)
+        self.unregister_plot(plot_name)
         
+        # Kept to be disconnected, the scene would otherwise keep calling
+        # into the manager for a plot it no longer knows
+        slots = {
+            "sigMouseMoved": lambda pos, plot_name = plot_name: self._on_mouse_moved(plot_name, pos), 
+            "sigMouseClicked": lambda event, plot_name = plot_name: self._on_mouse_clicked(plot_name, event)
+        }
         self.plots[plot_name] = {
             "widget": plot_widget, 
             "lines": [], 
-            "regions": []
+            "labels": [], 
+            "regions": [], 
+            "density": None, 
+            "cursor": None, 
+            "slots": slots
         }
+        scene = plot_widget.scene()
+        for signal, slot in slots.items(): 
+            getattr(scene, signal).connect(slot)
 
     def unregister_plot(self, plot_name):
         if plot_name in self.plots:
             self._clear_annotations(plot_name)
-            del self.plots[plot_name]
+            plot_data = self.plots.pop(plot_name)
+            for signal, slot in plot_data["slots"].items(): 
+                try: 
+                    getattr(plot_data["widget"].scene(), signal).disconnect(slot)
+                except (TypeError, RuntimeError): 
+                    # Already disconnected, or the plot is gone
+                    pass
     
 
     def toggle_annotations(self): 
         self.display_annotations = not self.display_annotations
         self.redraw_annotations()
 
+    def select_descriptions(self, descriptions = None): 
+        if isinstance(descriptions, str): 
+            descriptions = [descriptions]
+        if descriptions is not None: 
+            descriptions = [str(description) for description in descriptions]
+            if not descriptions: 
+                raise ValueError("descriptions must not be empty, use None to select all")
+        self.selected_descriptions = descriptions
+        self.redraw_annotations()
+
+    def cycle_descriptions(self, step: int = 1): 
+        """Select the next description, all of them coming after the last."""
+        if self.annotations is None: 
+            return
+        choices = [None] + [[description] for description in self._get_index().descriptions]
+        current = choices.index(self.selected_descriptions) if self.selected_descriptions in choices else 0
+        self.select_descriptions(choices[(current + step) % len(choices)])
+
     
     def _to_next_annotation(self): 
         if self.annotations is None or not self.display_annotations: 
             return
-        onsets = self.annotations.onset
-        # Assume already sorted
+        # Have the annotation onset be at the middle of the display screen
         curr_mid_window_time = self.current_time + self.window_duration/2
-        next_annotation_indices = np.where(onsets > curr_mid_window_time)[0]
-        if not len(next_annotation_indices): 
+        onset = self._get_index().next_onset(curr_mid_window_time, self.selected_descriptions)
+        return self._centered_on(onset)
+
+    def _to_previous_annotation(self): 
+        if self.annotations is None or not self.display_annotations: 
             return
-        next_annotation_index = next_annotation_indices[0]
-        '''
-        self.current_time = onsets[next_annotation_index] - 0.5*self.window_duration
-        # Have the annotation onset be at the middle of the display screen
-        self.current_time = np.max(self.current_time, 0)
+        curr_mid_window_time = self.current_time + self.window_duration/2
+        onset = self._get_index().previous_onset(curr_mid_window_time, self.selected_descriptions)
+        return self._centered_on(onset)
+
+    def _to_nth_annotation(self, n: int): 
+        if self.annotations is None or not self.display_annotations: 
+            return
+        return self._centered_on(self._get_index().nth_onset(n, self.selected_descriptions))
+
+    def _centered_on(self, onset): 
+        if onset is None: 
+            return
+        return max(onset - 0.5*self.window_duration, 0.0)
+
+    # The index is fetched before the annotations change, it would
+    # otherwise be rebuilt from the already edited annotations
+    def add_annotation(self, onset: float, duration: float, description: str, ch_names = (), extras = None): 
+        index = self._get_index()
+        self.annotations.append(onset, duration, description, ch_names = [list(ch_names)], extras = [extras])
+        index.insert(onset, duration, description)
+        if self.journal is not None: 
+            self.journal.add(onset, duration, description, ch_names, extras)
+        self._edited()
+
+    def remove_annotation(self, index: int): 
+        onset, duration, description, ch_names, extras = self._get_annotation(index)
+        annotation_index = self._get_index()
+        self.annotations.delete(index)
+        annotation_index.remove(onset, duration, description)
+        if self.journal is not None: 
+            self.journal.delete(onset, duration, description, ch_names, extras)
+        self._edited()
+
+    def relabel_annotation(self, index: int, new_description: str): 
+        onset, duration, description, ch_names, extras = self._get_annotation(index)
+        annotation_index = self._get_index()
+        # Replaced, as descriptions are a fixed-width string array
+        self.annotations.delete(index)
+        self.annotations.append(onset, duration, new_description, ch_names = [list(ch_names)], extras = [extras])
+        annotation_index.remove(onset, duration, description)
+        annotation_index.insert(onset, duration, new_description)
+        if self.journal is not None: 
+            self.journal.relabel(onset, duration, description, new_description, ch_names, extras)
+        self._edited()
+
+    def save(self, wait: bool = False): 
+        """Compact the journal and export its events.tsv, if any."""
+        if self.journal is not None: 
+            self.journal.compact(self.annotations, wait = wait)
+
+    def close(self): 
+        if self.journal is not None: 
+            self.save(wait = True)
+            self.journal.close()
+
+    def _edited(self): 
+        # The index was updated along with the annotations
+        self._index_key = _annotations_key(self.annotations)
+        if self.journal is not None and self.journal.n_edits >= self.compact_every: 
+            self.save()
         self.redraw_annotations()
-        '''
-        # Temporary Fix
-        current_time = onsets[next_annotation_index] - 0.5*self.window_duration
-        current_time = np.max(current_time, 0)
-        return current_time
+
+    def _get_annotation(self, index): 
+        return ( 
+            float(self.annotations.onset[index]), 
+            float(self.annotations.duration[index]), 
+            str(self.annotations.description[index]), 
+            tuple(self.annotations.ch_names[index]), 
+            self.annotations.extras[index]
+        )
+
+    def _nearest_annotation(self, time, tolerance): 
+        onsets = self.annotations.onset
+        i = np.searchsorted(onsets, time)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(onsets)]
+        if not candidates: 
+            return None
+        nearest = min(candidates, key = lambda j: abs(onsets[j] - time))
+        return nearest if abs(onsets[nearest] - time) <= tolerance else None
+
+    def _on_mouse_clicked(self, plot_name, event): 
+        # Double-click adds an annotation, with Shift deletes the nearest
+        # one and with Ctrl relabels it
+        plot_data = self.plots.get(plot_name)
+        if plot_data is None or self.journal is None or not event.double() or not self.display_annotations: 
+            return
+        view_box = plot_data["widget"].getViewBox()
+        if not view_box.sceneBoundingRect().contains(event.scenePos()): 
+            return
+        time = view_box.mapSceneToView(event.scenePos()).x()
+        modifiers = event.modifiers()
+        event.accept()
+        if not modifiers & (Qt.ShiftModifier | Qt.ControlModifier): 
+            self.add_annotation(time, 0.0, self.edit_description)
+            return
+        index = self._nearest_annotation(time, 5*self.window_duration/self._plot_width(plot_data))
+        if index is None: 
+            return
+        if modifiers & Qt.ShiftModifier: 
+            self.remove_annotation(index)
+            return
+        new_description, ok = QInputDialog.getText( 
+            plot_data["widget"], 
+            "Relabel annotation", 
+            "Description", 
+            text = str(self.annotations.description[index])
+        )
+        if ok and new_description: 
+            self.relabel_annotation(index, new_description)
+
+    def _get_index(self): 
+        # Annotations edited behind the manager's back are indexed again
+        key = _annotations_key(self.annotations)
+        if self.index is None or key != self._index_key: 
+            self.index = AnnotationIndex.from_annotations(self.annotations)
+            self._index_key = key
+        return self.index
 
     def update_annotations(
             self, 
@@ -96,58 +283,131 @@ class AnnotationsManager(QObject):
     ):
         if self.annotations is None: 
             return
-        self._clear_annotations()
         if not self.display_annotations: 
+            self._hide_annotations()
             return
         
         end_time = self.current_time + self.window_duration
 
-        # Get all the annotations
-        annotations = self.annotations
-        onsets, durations, descs = annotations.onset, annotations.duration, annotations.description
-        ends = onsets + durations
         # Get all the annotations visible
-        mask_onset_valid = onsets <= end_time
-        mask_end_valid = ends >= self.current_time
-        valid_mask = np.logical_and(mask_onset_valid, mask_end_valid) 
-        if not np.any(valid_mask): 
-            return
-        onsets, durations, descs = onsets[valid_mask], durations[valid_mask], descs[valid_mask]
+        descriptions = self.selected_descriptions if self.filter_display else None
+        onsets, ends, descs = self._get_index().visible(self.current_time, end_time, descriptions)
         # Trim what is necessary
-        onsets[onsets <= self.current_time] = self.current_time
-        ends[ends >= end_time] = end_time
-        # Plot these 
-        for onset, end, description in zip(onsets, ends, descs):
-            duration = end - onset
-            for plot_name, plot_data in self.plots.items(): 
-                self._add_annotation_to_plot(
-                    plot_data, onset, duration, description
-                )
-
-    def _add_annotation_to_plot(
+        onsets = np.maximum(onsets, self.current_time)
+        ends = np.minimum(ends, end_time)
+
+        self.visible = (onsets, ends, descs)
+        for plot_data in self.plots.values(): 
+            if len(onsets) > self.max_density*self._plot_width(plot_data): 
+                self._draw_density(plot_data)
+            else: 
+                self._draw_items(plot_data)
+
+    def _draw_items(self, plot_data): 
+        # Items are pooled per plot, moved and relabelled instead of recreated
+        onsets, ends, descs = self.visible
+        if plot_data["density"] is not None: 
+            plot_data["density"].hide()
+        n_regions = 0
+        for i, (onset, end, description) in enumerate(zip(onsets, ends, descs)): 
+            self._place_line(plot_data, i, onset, description)
+            if end > onset: 
+                self._place_region(plot_data, n_regions, onset, end)
+                n_regions += 1
+        for line in plot_data["lines"][len(onsets):]: 
+            line.hide()
+        for region in plot_data["regions"][n_regions:]: 
+            region.hide()
+
+    def _draw_density(self, plot_data): 
+        onsets, ends, _ = self.visible
+        if plot_data["density"] is None: 
+            plot_data["density"] = AnnotationDensityItem()
+            plot_data["widget"].addItem(plot_data["density"])
+        plot_data["density"].show()
+        plot_data["density"].setData(onsets, ends)
+        for region in plot_data["regions"]: 
+            region.hide()
+        self._draw_labels(plot_data)
+
+    def _draw_labels(self, plot_data): 
+        # Labelled lines for the annotations nearest the cursor only
+        onsets, _, descs = self.visible
+        cursor = plot_data["cursor"]
+        if cursor is None or not self.current_time <= cursor <= self.current_time + self.window_duration: 
+            cursor = self.current_time + self.window_duration/2
+        i = np.searchsorted(onsets, cursor)
+        candidates = np.arange(max(i - self.n_labels, 0), min(i + self.n_labels, len(onsets)))
+        nearest = np.sort(candidates[np.argsort(np.abs(onsets[candidates] - cursor), kind = "stable")[:self.n_labels]])
+        for k, index in enumerate(nearest): 
+            self._place_line(plot_data, k, onsets[index], descs[index])
+        for line in plot_data["lines"][len(nearest):]: 
+            line.hide()
+
+    def _on_mouse_moved(self, plot_name, pos): 
+        plot_data = self.plots.get(plot_name)
+        if plot_data is None or plot_data["density"] is None or not plot_data["density"].isVisible(): 
+            return
+        plot_data["cursor"] = plot_data["widget"].getViewBox().mapSceneToView(pos).x()
+        self._draw_labels(plot_data)
+
+    def _plot_width(self, plot_data): 
+        width = int(plot_data["widget"].getViewBox().width())
+        if width <= 0: 
+            width = plot_data["widget"].width()
+        return max(width, 1)
+
+    def _place_line(
             self, 
             plot_data, 
+            index, 
             onset, 
-            duration, 
             description
     ):
-        if self.annotations is None and not self.display_annotations: 
+        lines = plot_data["lines"]
+        if index == len(lines): 
+            line = pg.InfiniteLine(
+                pos = onset,
+                label = description,
+                **self.line_params
+            )
+            plot_data["widget"].addItem(line)
+            lines.append(line)
+            plot_data["labels"].append(description)
             return
-        line = pg.InfiniteLine(
-            pos = onset,
-            label = description,
-            **self.line_params
-        )
-        plot_data["widget"].addItem(line)
-        plot_data["lines"].append(line)
+        line = lines[index]
+        # Shown first, hidden labels are not updated
+        line.show()
+        line.setPos(onset)
+        if plot_data["labels"][index] != description: 
+            line.label.setFormat(description)
+            plot_data["labels"][index] = description
 
-        if duration > onset: 
+    def _place_region(
+            self, 
+            plot_data, 
+            index, 
+            onset, 
+            end
+    ):
+        regions = plot_data["regions"]
+        if index == len(regions): 
             region = pg.LinearRegionItem(
-                values = [onset, onset + duration], 
+                values = [onset, end], 
                 **self.region_params
             )
             plot_data["widget"].addItem(region)
-            plot_data["regions"].append(region)
+            regions.append(region)
+            return
+        region = regions[index]
+        region.show()
+        region.setRegion([onset, end])
+
+    def _hide_annotations(self): 
+        for plot_data in self.plots.values(): 
+            for item in plot_data["lines"] + plot_data["regions"] + [plot_data["density"]]: 
+                if item is not None: 
+                    item.hide()
     
     def _clear_annotations(self, plot_name = None):
         available_plot_names = list(self.plots.keys())
@@ -161,7 +421,20 @@ class AnnotationsManager(QObject):
             for line in plot_data["lines"]: 
                 plot_data["widget"].removeItem(line)
             plot_data["lines"] = []
+            plot_data["labels"] = []
             for region in plot_data["regions"]: 
                 plot_data["widget"].removeItem(region)
             plot_data["regions"] = []
-    
\ No newline at end of file
+            if plot_data["density"] is not None: 
+                plot_data["widget"].removeItem(plot_data["density"])
+                plot_data["density"] = None
+
+
+def _annotations_key(annotations): 
+    # Checksums of the arrays, cheap next to indexing them again
+    return ( 
+        len(annotations), 
+        zlib.crc32(np.ascontiguousarray(annotations.onset)), 
+        zlib.crc32(np.ascontiguousarray(annotations.duration)), 
+        zlib.crc32(np.ascontiguousarray(annotations.description))
+    )
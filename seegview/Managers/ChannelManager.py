@@ -15,9 +15,14 @@ class ChannelManager(QWidget):
     def __init__(
             self, 
             ch_names: list[str], 
-            initial_channel: int = 0): 
+            initial_channel: int = 0, 
+            scheduler = None): 
         super().__init__()
 
+        # Shared with the TimeManager so that channel and time changes are
+        # drawn in the same frame
+        self.scheduler = scheduler
+
         self.ch_names = ch_names
         self.n_channels = len(ch_names)
         self.current_channel = initial_channel
@@ -52,7 +57,8 @@ class ChannelManager(QWidget):
         if not hasattr(widget, "_update_display"): 
             raise ValueError("widget must have an _update_display method")
         self.channel_name_changed.connect(
-            lambda chan_name: widget._update_display(
+            lambda chan_name: self._schedule(
+                widget._update_display, 
                 curr_channel_name = chan_name
             )
         )
@@ -60,6 +66,12 @@ class ChannelManager(QWidget):
         widget._update_display(curr_channel_name = self.curr_chan_name)
 
 
+    def _schedule(self, callback, **kwargs): 
+        if self.scheduler is None: 
+            callback(**kwargs)
+        else: 
+            self.scheduler.schedule(callback, **kwargs)
+
     def redraw_channel_label(self): 
         self.ch_label.setText(
             f"Channel: {self.curr_chan_name}({self.current_channel + 1}/{len(self.ch_names)})"
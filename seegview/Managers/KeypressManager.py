@@ -8,7 +8,13 @@ DEFAULT_KEYBINDINGS = {
     Qt.Key_Home: ('time_manager', 'zoom_in', [0.8], {}),
     Qt.Key_End: ('time_manager', 'zoom_out', [1.25], {}),
     Qt.Key_Return: ('time_manager', 'to_next_annotation', [], {}),
+    Qt.Key_Backspace: ('time_manager', 'to_previous_annotation', [], {}),
+    Qt.Key_PageUp: ('time_manager', 'to_nth_annotation', [0], {}),
+    Qt.Key_PageDown: ('time_manager', 'to_nth_annotation', [-1], {}),
+    Qt.Key_BracketRight: ('annot_manager', 'cycle_descriptions', [1], {}),
+    Qt.Key_BracketLeft: ('annot_manager', 'cycle_descriptions', [-1], {}),
     Qt.Key_Delete: ('annot_manager', 'toggle_annotations', [], {}),
+    Qt.Key_F: ('time_manager', 'toggle_follow', [], {}),
 }
 
 class KeybindingManager: 
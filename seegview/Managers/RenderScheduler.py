@@ -0,0 +1,54 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+class RenderScheduler(QObject): 
+    """Coalesces display updates and runs them at most once per frame.
+
+    Managers ``schedule`` an update callback with keyword arguments instead of
+    calling it. Updates to the same callback that arrive within a frame are
+    merged, the latest value of each argument winning, so stale intermediate
+    states (e.g. from key autorepeat) are never drawn.
+    """
+    def __init__(self, target_fps: float = 60.0): 
+        super().__init__()
+        self.set_target_fps(target_fps)
+
+        self.pending = {}
+        self._last_flush = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    @property
+    def frame_interval(self): 
+        return 1.0 / self.target_fps
+
+    def set_target_fps(self, target_fps: float): 
+        if target_fps <= 0: 
+            raise ValueError("target_fps must be positive")
+        self.target_fps = target_fps
+
+    def schedule(self, callback, **kwargs): 
+        pending_kwargs = self.pending.setdefault(callback, {})
+        pending_kwargs.update(kwargs)
+        if not self.timer.isActive(): 
+            elapsed = time.monotonic() - self._last_flush
+            delay = max(self.frame_interval - elapsed, 0.0)
+            self.timer.start(int(delay * 1000))
+
+    def flush(self): 
+        self.timer.stop()
+        pending, self.pending = self.pending, {}
+        # A failing update does not drop the others of the frame, the first
+        # error is raised once they have all run
+        errors = []
+        for callback, kwargs in pending.items(): 
+            try: 
+                callback(**kwargs)
+            except Exception as error: 
+                errors.append(error)
+        self._last_flush = time.monotonic()
+        if errors: 
+            raise errors[0]
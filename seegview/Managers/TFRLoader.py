@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+class TFRLoader(QObject): 
+    """Computes the tiles of an on-demand TFR source off the GUI thread.
+
+    ``request`` replaces the queue with the (channel, tile) the view is
+    missing, most urgent first. Every queued tile is first computed by the
+    ``preview`` engine, a coarse pass whose rows are repeated onto the full
+    frequencies, then by the source itself. ``tile_ready(channel, tile,
+    final)`` is emitted for both, and ``progress(n_done, n_total)`` counts
+    the final tiles since the loader was last idle.
+    """
+    tile_ready = pyqtSignal(int, int, bool)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, source, preview = None, max_previews: int = 2048): 
+        super().__init__()
+        self.source = source
+        self.tile_size = source.tile_size
+        self.preview = preview
+        self.rows = None
+        if preview is not None: 
+            # Nearest preview frequency of every frequency
+            self.rows = np.abs(source.freqs[:, np.newaxis] - preview.freqs[np.newaxis]).argmin(axis = 1)
+        self.max_previews = max_previews
+        self._previews = OrderedDict()
+
+        self._queue = []
+        self.n_done = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def request(self, tiles): 
+        tiles = list(dict.fromkeys(tiles))
+        with self._lock: 
+            self._queue = tiles
+            if tiles: 
+                self._wake.set()
+
+    def stop(self): 
+        with self._lock: 
+            self._stopping = True
+            self._wake.set()
+        # Returns once the tile being computed, if any, is done
+        self._thread.join(timeout = 1.0)
+
+    def get_preview(self, ch: int, t: int, start: int, stop: int): 
+        """Preview of samples [start, stop) of tile ``t``, relative to the
+        tile, or NaN where there is none yet."""
+        with self._lock: 
+            tile = self._previews.get((ch, t))
+            if tile is not None: 
+                self._previews.move_to_end((ch, t))
+        if tile is None: 
+            return np.full((len(self.source.freqs), stop - start), np.nan, dtype = np.float32)
+        return tile[self.rows, start:stop]
+
+    def _run(self): 
+        while True: 
+            self._wake.wait()
+            with self._lock: 
+                if self._stopping: 
+                    return
+                job = self._next()
+                if job is None: 
+                    self._wake.clear()
+                    self.n_done = 0
+                    continue
+            ch, t, final = job
+
+            start = t * self.tile_size
+            stop = min(start + self.tile_size, self.source.n_times)
+            if final: 
+                if not self.source.has_tile(ch, t): 
+                    self.source.get(ch, start, stop)
+                with self._lock: 
+                    if (ch, t) in self._queue: 
+                        self._queue.remove((ch, t))
+                    self.n_done += 1
+                    n_done, n_total = self.n_done, self.n_done + len(self._queue)
+                self.progress.emit(n_done, n_total)
+            else: 
+                tile = self.preview.get(ch, start, stop, cache = False)
+                with self._lock: 
+                    self._previews[(ch, t)] = tile
+                    while len(self._previews) > self.max_previews: 
+                        self._previews.popitem(last = False)
+            self.tile_ready.emit(ch, t, final)
+
+    def _next(self): 
+        # Previews of the whole queue first, they are much cheaper
+        if self.preview is not None: 
+            for ch, t in self._queue: 
+                if (ch, t) not in self._previews and not self.source.has_tile(ch, t): 
+                    return ch, t, False
+        if self._queue: 
+            return self._queue[0] + (True,)
+        return None
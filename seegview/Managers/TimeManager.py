@@ -1,5 +1,6 @@
-from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 from seegview.Managers.AnnotationsManager import AnnotationsManager
+from seegview.Managers.RenderScheduler import RenderScheduler
 
 class TimeManager(QObject): 
     # Signals
@@ -9,7 +10,8 @@ class TimeManager(QObject):
             self, 
             initial_time: float = 0.0, 
             initial_duration: float = 10.0, 
-            max_time: float | None = None
+            max_time: float | None = None, 
+            target_fps: float | None = 60.0
     ): 
         super().__init__()
         self.current_time = initial_time
@@ -21,16 +23,28 @@ class TimeManager(QObject):
         self.min_duration = 0.5
 
         self.widgets = []
+        self.prefetchers = []
 
         self.annot_manager = None
 
+        # Redraws are coalesced and rate limited, None redraws on every change
+        self.scheduler = None
+        if target_fps is not None: 
+            self.scheduler = RenderScheduler(target_fps)
+
+        # Follow mode, keeps the window on the newest samples of a live source
+        self.follow_source = None
+        self.follow_timer = QTimer(self)
+        self.follow_timer.timeout.connect(self._follow)
+
     def register_widget(self, widget): 
         if not hasattr(widget, "_update_display"): 
             raise ValueError("widget must have an _update_display method")
         self.widgets.append(widget)
 
         self.time_params_changed.connect(
-            lambda t, d: widget._update_display(
+            lambda t, d: self._schedule(
+                widget._update_display, 
                 curr_time = t, 
                 window_duration = d
             )
@@ -38,6 +52,11 @@ class TimeManager(QObject):
 
         self.widgets.append(widget)
 
+        # Out-of-core widgets get the blocks ahead of them loaded in the background
+        store = getattr(widget, "store", None)
+        if store is not None and store.prefetcher is not None: 
+            self.register_prefetcher(store.prefetcher)
+
         # TEMPORARY FIX, need to fix later by having a more unified representation
 
         if hasattr(widget, "setXLink"): 
@@ -78,6 +97,21 @@ class TimeManager(QObject):
                 )
             )
 
+    def _schedule(self, callback, **kwargs): 
+        if self.scheduler is None: 
+            callback(**kwargs)
+        else: 
+            self.scheduler.schedule(callback, **kwargs)
+
+    def register_prefetcher(self, prefetcher): 
+        if not hasattr(prefetcher, "on_time_params_changed"): 
+            raise ValueError("prefetcher must have an on_time_params_changed method")
+        if prefetcher in self.prefetchers: 
+            return
+        self.prefetchers.append(prefetcher)
+        self.time_params_changed.connect(prefetcher.on_time_params_changed)
+        prefetcher.on_time_params_changed(self.current_time, self.window_duration)
+
     def register_annotations_manager(self, manager: AnnotationsManager): 
         if not hasattr(manager, "update_annotations"): 
             raise ValueError("manager must have a update_annotations method")
@@ -85,7 +119,8 @@ class TimeManager(QObject):
             raise ValueError("manager must have a _to_next_annotation method")
         self.annot_manager = manager
         self.time_params_changed.connect(
-            lambda t, d: manager.update_annotations(
+            lambda t, d: self._schedule(
+                manager.update_annotations, 
                 current_time = t, 
                 window_duration = d
             )
@@ -102,8 +137,52 @@ class TimeManager(QObject):
         current_time = self.annot_manager._to_next_annotation()
         if current_time is not None: 
             self.set_time(current_time)
+
+    def to_previous_annotation(self): 
+        if self.annot_manager is None or not self.annot_manager.display_annotations: 
+            return
+        current_time = self.annot_manager._to_previous_annotation()
+        if current_time is not None: 
+            self.set_time(current_time)
+
+    def to_nth_annotation(self, n: int): 
+        if self.annot_manager is None or not self.annot_manager.display_annotations: 
+            return
+        current_time = self.annot_manager._to_nth_annotation(n)
+        if current_time is not None: 
+            self.set_time(current_time)
         
 
+    @property
+    def following(self): 
+        return self.follow_timer.isActive()
+
+    def start_follow(self, source = None, interval: float = 0.05): 
+        if source is not None: 
+            self.follow_source = source
+        if self.follow_source is None: 
+            raise ValueError("no source to follow")
+        if interval <= 0: 
+            raise ValueError("interval must be positive")
+        self.follow_timer.start(int(interval * 1000))
+        self._follow()
+
+    def stop_follow(self): 
+        self.follow_timer.stop()
+
+    def toggle_follow(self): 
+        if self.following: 
+            self.stop_follow()
+        elif self.follow_source is not None: 
+            self.start_follow()
+
+    def _follow(self): 
+        self.max_time = self._head_time()
+        self.set_time(max(self.max_time - self.window_duration, self.min_time))
+
+    def _head_time(self): 
+        return self.follow_source.n_times / self.follow_source.info["sfreq"]
+
     def set_time(self, new_time: float): 
         if new_time is None: 
             return
@@ -121,16 +200,21 @@ class TimeManager(QObject):
         if new_duration is None: 
             return
         new_duration = max(self.min_duration, new_duration)
-        if self.max_time is not None: 
-            new_duration = min(self.max_time, new_duration)
+        # A followed stream keeps growing, its head does not bound the window
+        if self.max_time is not None and not self.following: 
+            new_duration = max(min(self.max_time, new_duration), self.min_duration)
         
         if new_duration != self.window_duration: 
             self.window_duration = new_duration
 
-            if self.max_time is not None: 
-                max_valid_time = self.max_time - self.window_duration
+            if self.following: 
+                # Keeps the newest samples at the right edge
+                self.max_time = self._head_time()
+                self.current_time = max(self.max_time - self.window_duration, self.min_time)
+            elif self.max_time is not None: 
+                max_valid_time = max(self.max_time - self.window_duration, self.min_time)
                 if self.current_time > max_valid_time: 
-                    self.current_time = self.set_time(max_valid_time)
+                    self.current_time = max_valid_time
                     
             self.time_params_changed.emit(self.current_time, self.window_duration)
 
@@ -138,6 +222,8 @@ class TimeManager(QObject):
         self.set_time(self.current_time + self.window_duration * prop)
     
     def scroll_backward(self, prop = 0.25): 
+        # Looking back at a live stream pauses following it
+        self.stop_follow()
         self.set_time(self.current_time - self.window_duration * prop)
 
     def zoom_in(self, prop = 0.8): 
@@ -1,6 +1,17 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import mne
 import numpy as np
+try: 
+    from mne._fiff.pick import _picks_to_idx
+except ImportError: 
+    # mne < 1.6
+    from mne.io.pick import _picks_to_idx
 
+from scipy.fft import rfft
+from scipy.signal import get_window
 from scipy.stats import norm
 
 
@@ -29,28 +40,345 @@ def welch_with_CI(freqs, psds, CI_func = jackknife_CI_z_score, alpha = 0.95):
     return freqs, psd, bias, lower, upper
     
 
-def get_psds(raw, picks, psd_func, fs, onsets, ends, n_jobs, dB, fmax): 
+def get_psds(raw, picks, psd_func, fs, onsets, ends, n_jobs, dB, fmax, max_batch_bytes = 2**27): 
+    """Welch windows of every (onset, end) segment, (n_channels, n_freqs,
+    n_windows), in segment order, written into one preallocated array.
+
+    Segments close to each other are read from ``raw`` together, at most
+    ``max_batch_bytes`` at a time unless a segment is larger. With
+    ``psd_array_welch``, the windows of all segments are transformed
+    together in batches of at most ``max_batch_bytes``, spread over
+    ``n_jobs`` threads. Any other ``psd_func`` is called once per batch of
+    equal-length segments.
+    """
+    onsets = np.asarray(onsets, dtype = int)
+    ends = np.asarray(ends, dtype = int)
+    if not len(onsets): 
+        raise ValueError("at least one segment is needed")
+    n_fft = int(fs*3)
+    if np.any(ends - onsets < n_fft): 
+        raise ValueError(f"every segment must hold at least n_fft = {n_fft} samples")
+
+    # Without overlap, each segment holds length // n_fft windows
+    n_windows = (ends - onsets)//n_fft
+    offsets = np.concatenate([[0], np.cumsum(n_windows)])
+    segments = _read_segments(raw, picks, onsets, ends, max_bytes = max_batch_bytes)
+    n_workers = n_jobs if n_jobs is not None and n_jobs > 0 else os.cpu_count() or 1
+
+    if psd_func is mne.time_frequency.psd_array_welch and all(np.isfinite(segment).all() for segment in segments): 
+        freqs, psds = _welch_segments(segments, n_windows, offsets, fs, n_fft, fmax, n_workers, max_batch_bytes)
+    else: 
+        freqs, psds = _psd_func_segments(segments, offsets, psd_func, fs, n_fft, fmax, n_workers, n_jobs, max_batch_bytes)
+
+    if dB: 
+        np.log10(psds, out = psds)
+        psds *= 20
+    return freqs, psds
+
+def _welch_segments(segments, n_windows, offsets, fs, n_fft, fmax, n_workers, max_batch_bytes): 
+    # Same as psd_array_welch: Hamming windows without overlap, mean
+    # removed, one-sided density
+    freqs = np.arange(n_fft//2 + 1)*(fs/n_fft)
+    freqs = freqs[freqs <= fmax]
+    window = get_window("hamming", n_fft)
+    scale = np.full(len(freqs), 2/(fs*np.sum(window**2)))
+    scale[0] /= 2
+    if n_fft % 2 == 0 and len(freqs) == n_fft//2 + 1: 
+        scale[-1] /= 2
+
+    n_channels = segments[0].shape[0]
+    psds = np.empty((n_channels, len(freqs), offsets[-1]))
+
+    # Runs of consecutive segments, of at most max_batch_bytes of windows
+    window_bytes = 8*n_channels*n_fft
+    batches = []
+    first = 0
+    for i in range(len(segments)): 
+        if i > first and (offsets[i + 1] - offsets[first])*window_bytes > max_batch_bytes: 
+            batches.append((first, i))
+            first = i
+    batches.append((first, len(segments)))
 
-    psds_to_concat = [] 
-    for onset, end in zip(onsets, ends): 
-        data = raw.get_data(picks = picks, start = onset, stop = end)
-        psds_period, freqs = psd_func(
-            data, 
-            sfreq = fs,
-            n_fft = int(fs*3),
-            fmax = fmax,
+    def compute(batch): 
+        first, last = batch
+        windows = np.concatenate([ 
+            segments[i][:, :n_windows[i]*n_fft].reshape(n_channels, n_windows[i], n_fft)
+            for i in range(first, last)
+        ], axis = 1)
+        windows -= windows.mean(axis = -1, keepdims = True)
+        windows *= window
+        spectra = rfft(windows, axis = -1)[..., :len(freqs)]
+        power = np.square(spectra.real) + np.square(spectra.imag)
+        psds[..., offsets[first]:offsets[last]] = np.swapaxes(power*scale, 1, 2)
+
+    with ThreadPoolExecutor(max_workers = min(n_workers, len(batches))) as pool: 
+        list(pool.map(compute, batches))
+    return freqs, psds
+
+def _psd_func_segments(segments, offsets, psd_func, fs, n_fft, fmax, n_workers, n_jobs, max_batch_bytes): 
+    lengths = np.array([segment.shape[-1] for segment in segments])
+    groups = []
+    for length in np.unique(lengths): 
+        indices = np.flatnonzero(lengths == length)
+        batch_size = max(max_batch_bytes//(8*segments[indices[0]].size or 1), 1)
+        groups.extend(indices[i:i + batch_size] for i in range(0, len(indices), batch_size))
+
+    def compute(indices, n_jobs): 
+        return psd_func(
+            np.stack([segments[i] for i in indices]), 
+            sfreq = fs, 
+            n_fft = n_fft, 
+            fmax = fmax, 
             average = False, 
             output = "power", 
             n_jobs = n_jobs)
-        psds_to_concat.append(psds_period)
-    
-    psds = np.concat(psds_to_concat, axis = -1)
-    if dB: 
-        psds = 20*np.log10(psds)
+
+    # Several groups are spread over threads, a single one over psd_func's jobs
+    n_workers = min(n_workers, len(groups))
+    psds = None
+    with ThreadPoolExecutor(max_workers = n_workers) as pool: 
+        results = pool.map(compute, groups, [1 if n_workers > 1 else n_jobs]*len(groups))
+        for indices, (group_psds, freqs) in zip(groups, results): 
+            if psds is None: 
+                psds = np.empty(group_psds.shape[1:-1] + (offsets[-1],))
+            for k, i in enumerate(indices): 
+                psds[..., offsets[i]:offsets[i + 1]] = group_psds[k]
     return freqs, psds
 
+def _read_segments(raw, picks, onsets, ends, max_gap = None, max_bytes = 2**27): 
+    # One read per run of segments less than max_gap samples apart, of at
+    # most max_bytes
+    if max_gap is None: 
+        max_gap = int(raw.info["sfreq"])
+    # As get_data picks them, without reading any sample
+    n_channels = len(_picks_to_idx(raw.info, picks, "all", exclude = ()))
+    max_samples = max(max_bytes//(8*n_channels or 1), 1)
+    order = np.argsort(onsets, kind = "stable")
+    segments = [None]*len(onsets)
+    first = 0
+    while first < len(order): 
+        last = first + 1
+        start = onsets[order[first]]
+        stop = ends[order[first]]
+        while ( 
+            last < len(order) 
+            and onsets[order[last]] - stop <= max_gap 
+            and max(stop, ends[order[last]]) - start <= max_samples
+        ): 
+            stop = max(stop, ends[order[last]])
+            last += 1
+        data = raw.get_data(picks = picks, start = start, stop = stop)
+        for i in order[first:last]: 
+            segments[i] = data[:, onsets[i] - start:ends[i] - start]
+        first = last
+    return segments
+
 def get_jackknife_psds(psds):
     n = psds.shape[-1]
     summed_psds = np.sum(psds, axis = -1)
     jackknife_data = summed_psds[..., np.newaxis] - psds
-    return jackknife_data/(n-1)
\ No newline at end of file
+    return jackknife_data/(n-1)
+
+def jackknife_CI_from_sums(n, sums, sums_of_squares, alpha = 0.95): 
+    # Leave-one-out means average back to the mean, so the jackknife bias is
+    # zero and its variance reduces to (Q - n*mean**2)/(n*(n-1))
+    psd = sums/n
+    if n < 2: 
+        return psd, np.zeros_like(psd), psd, psd
+    jackknife_var = np.maximum(sums_of_squares - n*np.square(psd), 0)/(n*(n-1))
+    CI_width = norm.ppf((1-alpha)/2 + alpha)*np.sqrt(jackknife_var)
+    return psd, np.zeros_like(psd), psd - CI_width, psd + CI_width
+
+
+class JackknifeAccumulator: 
+    """Streaming ``welch_with_CI`` over PSD segments that do not fit in memory.
+
+    ``update`` takes (..., n_segments) power one chunk at a time and merges
+    its count, mean and sum of squared deviations (Welford, Chan et al.),
+    which give the mean and the z-score jackknife CI exactly in O(n_channels
+    x n_freqs) memory. The percentile CI needs quantiles of the segments:
+    with ``n_bins``, a histogram of log10 power is kept per row, its range
+    set from the first chunk widened by ``margin`` decades.
+    """
+    def __init__(self, n_bins: int | None = None, margin: float = 2.0): 
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+        self.n_bins = n_bins
+        self.margin = margin
+        self.hists = None
+        self.log_min = None
+        self.bin_width = None
+
+    def update(self, psds): 
+        psds = np.asarray(psds, dtype = np.float64)
+        n_b = psds.shape[-1]
+        if not n_b: 
+            return
+        mean_b = psds.mean(axis = -1)
+        m2_b = np.sum(np.square(psds - mean_b[..., np.newaxis]), axis = -1)
+        if self.mean is None: 
+            self.n, self.mean, self.m2 = n_b, mean_b, m2_b
+        else: 
+            n = self.n + n_b
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta*(n_b/n)
+            self.m2 = self.m2 + m2_b + np.square(delta)*(self.n*n_b/n)
+            self.n = n
+        if self.n_bins is not None: 
+            self._update_hists(psds)
+
+    def welch_with_CI(self, freqs, CI_func = jackknife_CI_z_score, alpha = 0.95): 
+        """Same output as ``welch_with_CI`` on all segments seen so far."""
+        if not self.n: 
+            raise ValueError("no segments were accumulated")
+        psd = self.mean
+        bias = np.zeros_like(psd)
+        if CI_func is jackknife_CI_z_score: 
+            # The jackknife variance of the mean is m2/(n*(n-1))
+            CI_width = 0
+            if self.n > 1: 
+                CI_width = norm.ppf((1-alpha)/2 + alpha)*np.sqrt(self.m2/(self.n*(self.n-1)))
+            lower, upper = psd - CI_width, psd + CI_width
+        elif CI_func is jackknife_CI_percentile: 
+            # Leave-one-out means decrease with the segment left out, so
+            # their q-quantile is that of the segments at 1 - q
+            lower_q = (1-alpha)/2
+            low_segment, high_segment = self.quantiles([1 - lower_q, lower_q])
+            lower = (self.n*psd - low_segment)/max(self.n - 1, 1)
+            upper = (self.n*psd - high_segment)/max(self.n - 1, 1)
+        else: 
+            raise ValueError("CI_func must be jackknife_CI_z_score or jackknife_CI_percentile")
+        return freqs, psd, bias, lower, upper
+
+    def quantiles(self, q): 
+        """Approximate quantiles of the segments, (len(q), ...)."""
+        if self.hists is None: 
+            raise ValueError("quantiles need n_bins")
+        cumulative = np.cumsum(self.hists, axis = -1)
+        result = []
+        for quantile in q: 
+            # Rank as in np.percentile, placed uniformly within its bin
+            rank = quantile*(self.n - 1)
+            bins = np.argmax(cumulative > rank, axis = -1)
+            counts = np.take_along_axis(self.hists, bins[..., np.newaxis], axis = -1)[..., 0]
+            before = np.take_along_axis(cumulative, bins[..., np.newaxis], axis = -1)[..., 0] - counts
+            position = bins + (rank - before + 0.5)/np.maximum(counts, 1)
+            result.append(10**(self.log_min + position*self.bin_width))
+        return np.array(result)
+
+    def _update_hists(self, psds): 
+        log_psds = np.log10(np.maximum(psds, np.finfo(np.float64).tiny))
+        if self.hists is None: 
+            low = log_psds.min(axis = -1) - self.margin
+            high = log_psds.max(axis = -1) + self.margin
+            self.log_min = low
+            self.bin_width = (high - low)/self.n_bins
+            self.hists = np.zeros(psds.shape[:-1] + (self.n_bins,), dtype = np.int64)
+        indices = np.floor((log_psds - self.log_min[..., np.newaxis])/self.bin_width[..., np.newaxis])
+        indices = np.clip(indices, 0, self.n_bins - 1).astype(np.int64)
+        n_rows = self.hists[..., 0].size
+        offsets = np.arange(n_rows).reshape(indices.shape[:-1] + (1,))*self.n_bins
+        self.hists += np.bincount( 
+            (indices + offsets).ravel(), 
+            minlength = n_rows*self.n_bins
+        ).reshape(self.hists.shape)
+
+class WindowedSpectrum: 
+    """Mean spectrum and jackknife z-score CI of any time window of a
+    (n_freqs, n_times) power array, from cumulative sums along time.
+
+    ``fetch(start, stop)`` returns the power of [start, stop). The sums and
+    sums of squares of every chunk of ``chunk_size`` samples are kept once
+    the chunk has been read, and the cumulative sums within a chunk for the
+    ``max_chunks`` most recently used chunks only, as only the chunks at
+    the edges of a window need them. A window costs O(n_freqs) once its
+    chunks are known, whatever the length of the recording. Gives the same
+    result as ``welch_with_CI`` with ``jackknife_CI_z_score``.
+    """
+    def __init__(self, fetch, n_times, chunk_size = 4096, max_chunks = 8): 
+        self.fetch = fetch
+        self.n_times = n_times
+        self.chunk_size = chunk_size
+        self.max_chunks = max(max_chunks, 2)
+
+        n_chunks = -(-n_times // chunk_size)
+        self._prefix = OrderedDict()
+        # (sums, sums_of_squares) of each chunk, stacked for range sums
+        self._totals = None
+        self._done = np.zeros(n_chunks, dtype = bool)
+
+    def window_sums(self, start, stop): 
+        start = max(start, 0)
+        stop = min(stop, self.n_times)
+        if stop <= start: 
+            return 0, None, None
+        first = start//self.chunk_size
+        last = (stop - 1)//self.chunk_size
+        for c in range(first + 1, last): 
+            if not self._done[c]: 
+                self._read_chunk(c)
+
+        first_prefix = self._get_prefix(first)
+        start_offset = start - first*self.chunk_size
+        if first == last: 
+            sums = first_prefix[..., stop - first*self.chunk_size] - first_prefix[..., start_offset]
+        else: 
+            last_prefix = self._get_prefix(last)
+            sums = ( 
+                first_prefix[..., -1] - first_prefix[..., start_offset]
+                + self._totals[first + 1:last].sum(axis = 0)
+                + last_prefix[..., stop - last*self.chunk_size]
+            )
+        return stop - start, sums[0], sums[1]
+
+    def spectrum_with_CI(self, start, stop, alpha = 0.95): 
+        """Return (psd, bias, lower, upper) of the window [start, stop)."""
+        n, sums, sums_of_squares = self.window_sums(start, stop)
+        if not n: 
+            return None
+        return jackknife_CI_from_sums(n, sums, sums_of_squares, alpha)
+
+    def invalidate(self, start, stop): 
+        """Forget the chunks covering [start, stop), rebuilt when next needed."""
+        for c in range(max(start, 0)//self.chunk_size, (min(stop, self.n_times) - 1)//self.chunk_size + 1): 
+            self._prefix.pop(c, None)
+            self._done[c] = False
+
+    @property
+    def nbytes(self): 
+        nbytes = sum(prefix.nbytes for prefix in self._prefix.values())
+        if self._totals is not None: 
+            nbytes += self._totals.nbytes
+        return nbytes
+
+    def _get_prefix(self, c): 
+        prefix = self._prefix.get(c)
+        if prefix is not None: 
+            self._prefix.move_to_end(c)
+            return prefix
+        return self._read_chunk(c, keep_prefix = True)
+
+    def _read_chunk(self, c, keep_prefix = False): 
+        start = c*self.chunk_size
+        data = np.asarray(self.fetch(start, min(start + self.chunk_size, self.n_times)), dtype = np.float64)
+        if self._totals is None: 
+            self._totals = np.zeros((len(self._done), 2, data.shape[0]))
+        if not keep_prefix: 
+            # Inside a window, only the chunk's totals are needed
+            self._totals[c, 0] = data.sum(axis = -1)
+            self._totals[c, 1] = np.square(data).sum(axis = -1)
+            self._done[c] = True
+            return None
+
+        # (2, n_freqs, n + 1), sums then sums of squares, starting at zero
+        prefix = np.zeros((2, data.shape[0], data.shape[1] + 1))
+        np.cumsum(data, axis = -1, out = prefix[0, :, 1:])
+        np.cumsum(np.square(data), axis = -1, out = prefix[1, :, 1:])
+        self._totals[c] = prefix[..., -1]
+        self._done[c] = True
+        self._prefix[c] = prefix
+        while len(self._prefix) > self.max_chunks: 
+            self._prefix.popitem(last = False)
+        return prefix
@@ -0,0 +1,70 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import QLineF, QRectF
+from PyQt5.QtGui import QColor
+
+class AnnotationDensityItem(pg.GraphicsObject): 
+    """Every visible annotation of a plot, drawn as a single item.
+
+    Onsets are binned into one column per screen pixel. Occupied columns
+    are drawn as vertical lines, more opaque the more onsets they hold, in
+    ``n_levels`` steps. Columns covered by an annotation's duration are
+    shaded. Painting costs O(plot width) whatever the number of annotations.
+    """
+    def __init__(self, color = (0, 0, 255), region_alpha: int = 60, n_levels: int = 4): 
+        super().__init__()
+        self.color = color
+        self.region_brush = pg.mkBrush(*color, region_alpha)
+        self.n_levels = n_levels
+        self.onsets = np.empty(0)
+        self.ends = np.empty(0)
+
+    def setData(self, onsets, ends): 
+        self.onsets = np.asarray(onsets, dtype = float)
+        self.ends = np.asarray(ends, dtype = float)
+        self.update()
+
+    def boundingRect(self): 
+        # Always spans the view, like an InfiniteLine
+        rect = self.viewRect()
+        return QRectF() if rect is None else rect
+
+    def viewRangeChanged(self): 
+        self.prepareGeometryChange()
+        super().viewRangeChanged()
+
+    def paint(self, painter, *args): 
+        rect = self.viewRect()
+        view_box = self.getViewBox()
+        if rect is None or view_box is None or not len(self.onsets) or rect.width() <= 0: 
+            return
+        n_columns = max(int(view_box.width()), 1)
+        left = rect.left()
+        column_width = rect.width()/n_columns
+
+        def to_columns(times): 
+            return np.clip(((times - left)/column_width).astype(int), 0, n_columns - 1)
+
+        # Shaded runs of columns covered by a duration
+        spans = self.ends > self.onsets
+        if spans.any(): 
+            covering = np.zeros(n_columns + 1, dtype = int)
+            np.add.at(covering, to_columns(self.onsets[spans]), 1)
+            np.add.at(covering, to_columns(self.ends[spans]) + 1, -1)
+            covered = np.concatenate([[False], np.cumsum(covering[:-1]) > 0, [False]])
+            edges = np.flatnonzero(np.diff(covered.astype(int)))
+            painter.setPen(pg.mkPen(None))
+            painter.setBrush(self.region_brush)
+            for first, last in zip(edges[::2], edges[1::2]): 
+                painter.drawRect(QRectF(left + first*column_width, rect.top(), (last - first)*column_width, rect.height()))
+
+        counts = np.bincount(to_columns(self.onsets), minlength = n_columns)
+        occupied = np.flatnonzero(counts)
+        levels = np.ceil(counts[occupied]/counts.max()*self.n_levels).astype(int)
+        for level in range(1, self.n_levels + 1): 
+            columns = occupied[levels == level]
+            if not len(columns): 
+                continue
+            painter.setPen(pg.mkPen(QColor(*self.color, int(255*level/self.n_levels)), width = 1))
+            xs = left + (columns + 0.5)*column_width
+            painter.drawLines([QLineF(x, rect.top(), x, rect.bottom()) for x in xs])
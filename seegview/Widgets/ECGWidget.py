@@ -7,6 +7,8 @@ from brainheart.enums.ecg_annotations_enum import ECG_Annotations
 from mne import channel_indices_by_type
 
 from seegview.Widgets.pens import Colors, get_ecg_style, is_peak_channel, is_continuous_channel
+from seegview.Data.SampleStore import get_sample_store
+from seegview.Data.SlidingWindow import SlidingWindow
 
 from PyQt5.QtWidgets import (
     QVBoxLayout, 
@@ -25,6 +27,7 @@ class ECGWidget(QWidget):
             window_duration = 10.0, 
             show_peaks = True,
             show_artifacts = True,
+            dtype = None,
     ): 
         super().__init__()
         ecg_ch_indices_in_raw = channel_indices_by_type(raw.info)["ecg"]
@@ -39,7 +42,10 @@ class ECGWidget(QWidget):
         self.show_peaks = show_peaks
         self.show_artifacts = show_artifacts
 
-        raw_data = raw.get_data(return_times = False)
+        # Only the ECG channels are held, and they are shared with any
+        # other widget reading this recording
+        self.store = get_sample_store(raw, dtype = dtype)
+        self.acquired_channels = []
 
         self.left_axis_channels = {}
         self.right_axis_channels = {}
@@ -54,7 +60,8 @@ class ECGWidget(QWidget):
             if not chan_name in raw.ch_names: 
                 continue
             chan_index = raw.ch_names.index(chan_name)
-            data = raw_data[chan_index, :].flatten()
+            self.acquired_channels += self.store.acquire([chan_index])
+            data = self.store.channel(chan_index)
             style = get_ecg_style(chan_name)
             
             chan_info = {
@@ -62,7 +69,11 @@ class ECGWidget(QWidget):
                 "style": style, 
                 "line_item": None, 
                 "scatter_item": None, 
-                "visible": True
+                "visible": True, 
+                # Only the newly exposed edge is read when scrolling
+                "window": _make_window(data), 
+                # Peak sample indices, found once on first display
+                "peak_indices": None
             }
 
             if is_peak_channel(chan_name) or "Onset" in chan_name or "Offset" in chan_name:
@@ -77,7 +88,13 @@ class ECGWidget(QWidget):
         
         # Data to use for y-value of the peaks
         ecg_index = _select_single_ecg_channel(raw)
-        self.y_value_peaks = raw_data[ecg_index, :].flatten()
+        self.acquired_channels += self.store.acquire([ecg_index])
+        self.y_value_peaks = self.store.channel(ecg_index)
+
+        self.times_window = SlidingWindow(
+            lambda start, stop: np.arange(start, stop)/self.sfreq, 
+            self.store.n_times
+        )
 
         self._setup_ui()
         self.redraw()
@@ -236,20 +253,17 @@ class ECGWidget(QWidget):
         start_idx = int(self.curr_time * self.sfreq)
         end_idx = int((self.curr_time + self.window_duration)*self.sfreq)
 
-        n_samples = end_idx - start_idx
-        times = self.curr_time + np.arange(
-            n_samples
-        )/self.sfreq
+        times = self.times_window.get(start_idx, end_idx)
 
         # Update the continuous Channels
         for chan_name, chan_data in self.left_axis_channels.items():
-            trace = chan_data["data"][start_idx:end_idx]
+            trace = chan_data["window"].get(start_idx, end_idx)
             line_item = chan_data["line_item"]
             if line_item is not None: 
                 line_item.setData(times, trace)
         
         for chan_name, chan_data in self.right_axis_channels.items():
-            trace = chan_data["data"][start_idx:end_idx]
+            trace = chan_data["window"].get(start_idx, end_idx)
             line_item = chan_data["line_item"]
             if line_item is not None: 
                 line_item.setData(times, trace)
@@ -263,11 +277,14 @@ class ECGWidget(QWidget):
                 scatter_item.setData([], [])
                 continue
             
-            peak_data = chan_data["data"][start_idx:end_idx]
-            peak_indices = np.where(peak_data)[0]
+            if chan_data["peak_indices"] is None: 
+                chan_data["peak_indices"] = np.flatnonzero(chan_data["data"][:])
+            all_peak_indices = chan_data["peak_indices"]
+            first, last = np.searchsorted(all_peak_indices, [start_idx, end_idx])
+            peak_indices = all_peak_indices[first:last]
             if len(peak_indices): 
-                peak_times = times[peak_indices]
-                peak_values = self.y_value_peaks[start_idx + peak_indices]
+                peak_times = peak_indices/self.sfreq
+                peak_values = self.y_value_peaks[peak_indices]
                 scatter_item.setData(peak_times, peak_values)
             else: 
                 scatter_item.setData([], [])
@@ -284,3 +301,15 @@ class ECGWidget(QWidget):
     def get_plot_widget(self): 
         return self.plot_widget
 
+    def release(self): 
+        # Embedded widgets never get a closeEvent, their browser calls this
+        self.store.release(self.acquired_channels)
+        self.acquired_channels = []
+
+    def closeEvent(self, event): 
+        self.release()
+        super().closeEvent(event)
+
+
+def _make_window(data): 
+    return SlidingWindow(lambda start, stop: data[start:stop], len(data))
@@ -1,6 +1,10 @@
 import pyqtgraph as pg
 import numpy as np
 
+from seegview.Data.SampleStore import get_sample_store
+from seegview.Data.ChannelScaling import ChannelScaler, SCALING_MODES
+from seegview.Data.SlidingWindow import SlidingWindow
+
 # Temporary Fix
 non_selected_pen = pg.mkPen(color= (255//2, 255//2, 255//2), width = 1)
 selected_pen = pg.mkPen(color= (255, 255, 255), width = 1)
@@ -17,11 +21,18 @@ class MultipleTimeWidget(pg.PlotWidget):
             curr_channel, 
             curr_time, 
             window_duration, 
-            num_traces
+            num_traces, 
+            dtype = None, 
+            batched: bool = True, 
+            scaling: str = "global", 
+            scaler: ChannelScaler | None = None
     ): 
         super().__init__()
         
         self.raw = raw
+        # Only the displayed channels are held in the shared store
+        self.store = get_sample_store(raw, dtype = dtype)
+        self.acquired_channels = []
         
         self.ch_names = raw.ch_names
         self.sfreq = raw.info["sfreq"]
@@ -34,6 +45,28 @@ class MultipleTimeWidget(pg.PlotWidget):
 
         self.num_traces = num_traces
 
+        # Draw every trace in one curve instead of one item per channel
+        self.batched = batched
+        self._batch_x = None
+        self._batch_y = None
+
+        # Robust amplitude scales, computed once in the background
+        if scaling not in SCALING_MODES: 
+            raise ValueError(f"scaling must be one of {SCALING_MODES}")
+        self.scaling = scaling
+        if scaler is None and not self.store.streaming: 
+            scaler = ChannelScaler(raw)
+        # None for live streams, traces are then scaled from the window itself
+        self.scaler = scaler
+        # Distance between traces, in robust standard deviations
+        self.trace_spacing = 5.0
+
+        # (times, offset traces) of the window, only the new edge is read on scroll
+        self.window = SlidingWindow(self._fetch_window, lambda: self.store.n_times)
+        self._window_channels = None
+        self._window_gains = None
+        self._window_offsets = None
+
         self._setup_ui()
 
     def _setup_ui(self): 
@@ -43,6 +76,12 @@ class MultipleTimeWidget(pg.PlotWidget):
 
     def _set_line_items(self): 
         self.line_items = []
+        if self.batched: 
+            self.batch_item = pg.PlotCurveItem(pen = non_selected_pen)
+            self.selected_item = pg.PlotCurveItem(pen = selected_pen)
+            self.addItem(self.batch_item)
+            self.addItem(self.selected_item)
+            return
         for i in range(self.num_traces): 
             self.line_items.append(self.plot([], []))
     
@@ -52,7 +91,8 @@ class MultipleTimeWidget(pg.PlotWidget):
             curr_channel: int | None = None,
             curr_time: float | None = None, 
             window_duration: float | None = None,
-            num_traces: int | None = None
+            num_traces: int | None = None, 
+            scaling: str | None = None
     ): 
         if curr_channel_name is not None: 
             if curr_channel_name in self.ch_names: 
@@ -62,27 +102,67 @@ class MultipleTimeWidget(pg.PlotWidget):
         if curr_channel is not None: 
             self.curr_channel = curr_channel
         if curr_time is not None: 
+            self.curr_time = curr_time
+        if window_duration is not None: 
             self.window_duration = window_duration
         if num_traces is not None: 
             self.num_traces = num_traces
+        if scaling is not None: 
+            self.set_scaling(scaling, redraw = False)
         self.redraw()
+
+    def set_scaling(self, scaling: str, redraw: bool = True): 
+        if scaling not in SCALING_MODES: 
+            raise ValueError(f"scaling must be one of {SCALING_MODES}")
+        self.scaling = scaling
+        if redraw: 
+            self.redraw()
     
     def redraw(
             self
     ): 
         start_idx_raw = int(self.curr_time*self.sfreq)
         end_idx_raw = int((self.curr_time + self.window_duration)*self.sfreq)
-        times = self.curr_time + np.arange(end_idx_raw - start_idx_raw)/self.sfreq
         
         # Modify this later, this is just a proof of concept for now    
         curr_channels = self._get_current_channels()
-        raw_traces, _ = self.raw[curr_channels, start_idx_raw: end_idx_raw]
+        self._acquire_channels(curr_channels)
         # Now need to offset
-        offset = np.max(np.std(raw_traces, axis = -1)) * 2
-        offsets = np.arange(self.num_traces) * offset
-        offsets = offsets[:, None]
+        scales = None
+        reference_scale = None
+        if self.scaler is not None: 
+            scales = self.scaler.get_scales(curr_channels, self.scaling)
+            reference_scale = self.scaler.get_reference_scale()
+        if scales is None or reference_scale is None or not reference_scale > 0: 
+            # Background pass has not produced anything yet, live stream, or
+            # mostly flat channels whose median scale is zero
+            raw_traces = self.store.get(curr_channels, start_idx_raw, end_idx_raw)
+            times = np.arange(start_idx_raw, start_idx_raw + raw_traces.shape[-1])/self.sfreq
+            offset = np.max(np.std(raw_traces, axis = -1)) * 2 if raw_traces.shape[-1] else 1.0
+            if not offset > 0: 
+                offset = 1.0
+            offsets = np.arange(len(curr_channels))[:, None] * offset
+            raw_traces_offset = raw_traces - offsets
+        else: 
+            gains = np.ones(len(curr_channels))
+            if self.scaling != "global": 
+                # Bring every trace to the reference scale, flat channels are left as is
+                scales = np.where(scales > 0, scales, reference_scale)
+                gains = reference_scale / scales
+            self._window_channels = curr_channels
+            self._window_gains = gains[:, None]
+            self._window_offsets = np.arange(len(curr_channels))[:, None] * self.trace_spacing * reference_scale
+            window = self.window.get(
+                start_idx_raw, 
+                end_idx_raw, 
+                key = (tuple(curr_channels), tuple(gains), reference_scale)
+            )
+            times, raw_traces_offset = window[0], window[1:]
+
+        if self.batched: 
+            self._draw_batched(times, raw_traces_offset, curr_channels)
+            return
 
-        raw_traces_offset = raw_traces - offsets
         for i in range(self.num_traces): 
             if curr_channels[i] == self.curr_channel: 
                 pen = selected_pen
@@ -93,10 +173,56 @@ class MultipleTimeWidget(pg.PlotWidget):
                 times, 
                 raw_traces_offset[i, :])
             self.line_items[i].setPen(pen)
-        
-    
+
+    def _fetch_window(self, start, stop): 
+        traces = self.store.get(self._window_channels, start, stop)
+        window = np.empty((len(traces) + 1, stop - start))
+        window[0] = np.arange(start, stop)/self.sfreq
+        window[1:] = traces * self._window_gains - self._window_offsets
+        return window
+
+    def _draw_batched(self, times, traces, curr_channels): 
+        n_traces, n_times = traces.shape
+        if self._batch_x is None or self._batch_x.shape != (n_traces, n_times + 1): 
+            # One trailing NaN per trace breaks the curve between traces
+            self._batch_x = np.full((n_traces, n_times + 1), np.nan)
+            self._batch_y = np.full((n_traces, n_times + 1), np.nan)
+        self._batch_x[:, :n_times] = times
+        self._batch_y[:, :n_times] = traces
+
+        selected = np.flatnonzero(curr_channels == self.curr_channel)
+        if len(selected): 
+            # Redrawn on top of the batch by its own item
+            self.selected_item.setData(times, traces[selected[0]])
+        else: 
+            self.selected_item.setData([], [])
+
+        self.batch_item.setData(
+            self._batch_x.ravel(), 
+            self._batch_y.ravel(), 
+            connect = "finite"
+        )
+
     def _get_current_channels(self): 
         # Try to display the selected in the middle
         start_channel = self.curr_channel - self.num_traces//2
         start_channel = max(start_channel, 0)
-        return np.arange(self.num_traces) + start_channel
\ No newline at end of file
+        return np.arange(self.num_traces) + start_channel
+
+    def _acquire_channels(self, channels): 
+        channels = [int(ch) for ch in channels]
+        if channels == self.acquired_channels: 
+            return
+        # Acquire before releasing so that rows still shown are never reloaded
+        self.store.acquire(channels)
+        self.store.release(self.acquired_channels)
+        self.acquired_channels = channels
+
+    def release(self): 
+        # Embedded widgets never get a closeEvent, their browser calls this
+        self.store.release(self.acquired_channels)
+        self.acquired_channels = []
+
+    def closeEvent(self, event): 
+        self.release()
+        super().closeEvent(event)
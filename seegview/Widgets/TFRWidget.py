@@ -1,8 +1,16 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QProgressBar
+from PyQt5.QtCore import QTimer
 import pyqtgraph as pg
 import numpy as np
 
-from seegview.Widgets.Analysis import welch_with_CI
+from seegview.Widgets.Analysis import welch_with_CI, WindowedSpectrum
+from seegview.Data.SlidingWindow import SlidingWindow
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRPyramid import TFRPyramid, POOLING_MODES
+from seegview.Data.LevelStats import LevelStats, LEVEL_MODES
+from seegview.Data.TFRStore import TFRStore
+from seegview.Data.TFRCache import TFRCache
+from seegview.Managers.TFRLoader import TFRLoader
 
 class TFRWidget(QWidget): 
     def __init__(
@@ -11,18 +19,72 @@ class TFRWidget(QWidget):
             curr_channel, 
             curr_time, 
             window_duration, 
-            dB = False
+            dB = False, 
+            pooling: str = "mean", 
+            levels: str = "channel", 
+            level_stats: LevelStats | None = None, 
+            per_frequency_levels: bool = False
     ): 
         super().__init__()
-        self.data = tf.data
+        # A MorletEngine computes power on demand, for the viewed windows only,
+        # a TFRStore decodes it from compact storage and a TFRCache from disk,
+        # computing what is missing. An mne TFR is read as is
+        self.source = tf if isinstance(tf, (MorletEngine, TFRStore, TFRCache)) else None
+        self.data = None if self.source is not None else tf.data
         self.times = tf.times
         self.freqs = tf.freqs
         self.sfreq_tf = tf.sfreq
 
         self.ch_names = tf.ch_names
 
+        # Applied to the visible slice at draw time
         self.dB = dB
 
+        # Time-pooled power, built lazily for the channels that are shown
+        if pooling not in POOLING_MODES: 
+            raise ValueError(f"pooling must be one of {POOLING_MODES}")
+        self.pooling = pooling
+        self.pyramids = {}
+
+        # Cumulative sums of the current channel, for the spectrum panel
+        self.spectrum = None
+        self.spectrum_channel = None
+
+        self.window = SlidingWindow( 
+            self._fetch_window, 
+            len(self.times) if self.source is None else lambda: self.source.n_times
+        )
+
+        # Colour levels from histograms built in the background, for the
+        # displayed channel first
+        if levels not in LEVEL_MODES: 
+            raise ValueError(f"levels must be one of {LEVEL_MODES}")
+        self.levels = levels
+        self.per_frequency_levels = per_frequency_levels
+        self._owns_level_stats = level_stats is None and not self._streaming()
+        if self._owns_level_stats: 
+            level_stats = LevelStats( 
+                lambda channel, start, stop: self._fetch(channel, start, stop, cache = False), 
+                n_channels = len(self.ch_names), 
+                n_freqs = len(self.freqs), 
+                n_times = len(self.times), 
+                chunk_size = int(30 * self.sfreq_tf), 
+                # On-demand power is only sampled, not computed everywhere
+                n_chunks = 16 if isinstance(self.source, (MorletEngine, TFRCache)) else None, 
+                per_frequency = per_frequency_levels
+            )
+        self.level_stats = level_stats
+
+        # On-demand power is computed in the background, the view shows
+        # a coarse preview of the tiles that are not there yet
+        self.loader = None
+        self.pending = set()
+        if isinstance(self.source, (MorletEngine, TFRCache)) and not self._streaming(): 
+            engine = self.source if isinstance(self.source, MorletEngine) else self.source.engine
+            self.loader = TFRLoader(self.source, engine.preview())
+            self.loader.tile_ready.connect(self._on_tile_ready)
+            self.loader.progress.connect(self._on_progress)
+
         # Current States
         self.curr_channel = curr_channel
         self.curr_time = curr_time
@@ -34,8 +96,10 @@ class TFRWidget(QWidget):
     def _setup_ui(
             self
     ): 
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
         layout = QHBoxLayout()
-        self.setLayout(layout)
+        main_layout.addLayout(layout)
 
         # Time-Frequency Widget
 
@@ -75,6 +139,19 @@ class TFRWidget(QWidget):
 
         self._setup_tfr_range()
 
+        # Tiles still being computed, hidden when there are none
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumHeight(12)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.hide()
+        main_layout.addWidget(self.progress_bar)
+
+        # Refined tiles arrive in bursts, redrawn at most every 50 ms
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(50)
+        self.refresh_timer.timeout.connect(self.redraw)
+
     
     def _update_display(
             self, 
@@ -82,6 +159,8 @@ class TFRWidget(QWidget):
             curr_channel: int | None = None,
             curr_time: float | None = None, 
             window_duration: float | None = None,
+            pooling: str | None = None, 
+            levels: str | None = None
     ): 
         # Exact same as for the time plotting
         if curr_channel_name is not None: 
@@ -95,34 +174,95 @@ class TFRWidget(QWidget):
             self.curr_time = curr_time 
         if window_duration is not None: 
             self.window_duration = window_duration
+        if pooling is not None: 
+            self.set_pooling(pooling, redraw = False)
+        if levels is not None: 
+            self.set_levels(levels, redraw = False)
         self.redraw()
 
+    def set_pooling(self, pooling: str, redraw: bool = True): 
+        if pooling not in POOLING_MODES: 
+            raise ValueError(f"pooling must be one of {POOLING_MODES}")
+        self.pooling = pooling
+        if redraw: 
+            self.redraw()
+
+    def set_levels(self, levels: str, redraw: bool = True): 
+        if levels not in LEVEL_MODES: 
+            raise ValueError(f"levels must be one of {LEVEL_MODES}")
+        self.levels = levels
+        if redraw: 
+            self.redraw()
 
     def redraw(self): 
         start_idx = int(self.curr_time * self.sfreq_tf)
         end_idx = int((self.curr_time + self.window_duration)*self.sfreq_tf)    
-        end_idx = min(end_idx, len(self.times))
+        end_idx = min(end_idx, self._n_times())
 
-        time_slice = slice(start_idx, end_idx)
-        tfr_data = self.data[self.curr_channel, :, time_slice]
+        image = None
+        pyramid = self._get_pyramid(self.curr_channel)
+        if pyramid is not None: 
+            image = pyramid.image(start_idx, end_idx, self._get_pixel_width())
+        if image is not None: 
+            # Zoomed out, at most a few bins per pixel are uploaded
+            first_idx, last_idx, tfr_data = image
+        else: 
+            tfr_data = self.window.get(start_idx, end_idx, key = self.curr_channel)
+            first_idx = max(start_idx, 0)
+            last_idx = first_idx + tfr_data.shape[-1]
+        if tfr_data.shape[-1] == 0: 
+            # Nothing to draw yet, as on a stream no sample has reached
+            self.image_item.clear()
+            self.plot_tfr_widget.setXRange(self.curr_time, self.curr_time + self.window_duration, padding = 0)
+            return
 
-        self.image_item.setImage(tfr_data.T, autoLevels = False)
+        image_data = self._transform(tfr_data)
+        levels = None
+        if self.level_stats is not None: 
+            if self.per_frequency_levels: 
+                frequency_levels = self.level_stats.get_frequency_levels(self.curr_channel)
+                if frequency_levels is not None: 
+                    # Every frequency row is brought to its own [0, 1] range
+                    frequency_levels = self._transform(frequency_levels)
+                    low, high = frequency_levels[:, :1], frequency_levels[:, 1:]
+                    image_data = (image_data - low)/(high - low)
+                    levels = (0.0, 1.0)
+            if levels is None: 
+                levels = self.level_stats.get_levels( 
+                    self.curr_channel, 
+                    self.levels, 
+                    first_idx, 
+                    last_idx
+                )
+                if levels is not None: 
+                    levels = self._transform(np.array(levels))
+        if levels is None and np.isfinite(image_data).any(): 
+            # Histograms not ready yet
+            levels = np.nanpercentile(image_data, [1, 99])
+        if levels is None: 
+            levels = (0.0, 1.0)
 
-        vmin = np.percentile(tfr_data, 1)
-        vmax = np.percentile(tfr_data, 99)
+        self.image_item.setImage(image_data.T, autoLevels = False)
+        self.image_item.setLevels(levels)
 
-        self.image_item.setLevels([vmin, vmax])
-
-        # Now update the Power Spectrum
-        _, psd, _, lower, upper = welch_with_CI(None, tfr_data)
-        self.power_spectrum_item.setData(psd, self.freqs)
-        self.spectrum_lower.setData(lower, self.freqs)
-        self.spectrum_upper.setData(upper, self.freqs)
+        # Now update the Power Spectrum, over the full resolution window
+        spectrum = self._get_spectrum()
+        result = None
+        if spectrum is not None: 
+            result = spectrum.spectrum_with_CI(first_idx, last_idx)
+        if result is None and tfr_data.shape[-1] >= 2: 
+            # The jackknife needs two columns, an empty stream has none
+            result = welch_with_CI(None, tfr_data)[1:]
+        if result is not None: 
+            psd, _, lower, upper = result
+            self.power_spectrum_item.setData(self._transform(psd), self.freqs)
+            self.spectrum_lower.setData(self._transform(lower), self.freqs)
+            self.spectrum_upper.setData(self._transform(upper), self.freqs)
 
         self.image_item.setRect(
-            self.curr_time, # x position (time) 
+            first_idx/self.sfreq_tf, # x position (time) 
             self.freqs[0], # y position (freq)
-            self.window_duration,  # width in time
+            (last_idx - first_idx)/self.sfreq_tf,  # width in time
             self.freqs[-1] - self.freqs[0] # height in freq
         )
 
@@ -132,7 +272,125 @@ class TFRWidget(QWidget):
             padding = 0
         )
 
-    
+        if self.loader is not None: 
+            self._request_tiles(first_idx, last_idx)
+
+    def _request_tiles(self, start, stop): 
+        # Missing tiles of the channel shown, those in view first
+        center = (start + stop) // 2 // self.source.tile_size
+        tiles = sorted( 
+            (tile for tile in self.pending if tile[0] == self.curr_channel), 
+            key = lambda tile: abs(tile[1] - center)
+        )
+        self.loader.request(tiles)
+
+    def _on_tile_ready(self, channel, t, final): 
+        if (channel, t) not in self.pending: 
+            return
+        if final: 
+            self.pending.discard((channel, t))
+        start = t * self.source.tile_size
+        stop = min(start + self.source.tile_size, self._n_times())
+        for (pyramid_channel, _), pyramid in self.pyramids.items(): 
+            if pyramid_channel == channel: 
+                pyramid.invalidate(start, stop)
+        if self.spectrum is not None and self.spectrum_channel == channel: 
+            self.spectrum.invalidate(start, stop)
+        if channel == self.curr_channel: 
+            self.window.invalidate()
+            if not self.refresh_timer.isActive(): 
+                self.refresh_timer.start()
+
+    def _on_progress(self, n_done, n_total): 
+        self.progress_bar.setMaximum(max(n_total, 1))
+        self.progress_bar.setValue(n_done)
+        self.progress_bar.setVisible(n_done < n_total)
+
+    def _fetch_window(self, start, stop): 
+        return self._fetch_view(self.curr_channel, start, stop)
+
+    def _fetch_view(self, channel, start, stop): 
+        # Never computes on the GUI thread, tiles that are not ready are
+        # previewed and queued for the loader
+        if self.loader is None: 
+            return self._fetch(channel, start, stop)
+        tile_size = self.source.tile_size
+        start = min(max(start, 0), self._n_times())
+        stop = min(max(stop, start), self._n_times())
+        parts = []
+        for t in range(start // tile_size, (stop - 1) // tile_size + 1): 
+            first = max(start, t * tile_size)
+            last = min(stop, (t + 1) * tile_size)
+            if self.source.has_tile(channel, t): 
+                parts.append(self.source.get(channel, first, last))
+            else: 
+                self.pending.add((channel, t))
+                parts.append(self.loader.get_preview(channel, t, first - t * tile_size, last - t * tile_size))
+        if not parts: 
+            return np.empty((len(self.freqs), 0), dtype = np.float32)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis = -1)
+
+    def _fetch(self, channel, start, stop, cache = True): 
+        if self.source is not None: 
+            return self.source.get(channel, start, stop, cache = cache)
+        return self.data[channel, :, start:stop]
+
+    def _transform(self, power): 
+        if not self.dB: 
+            return power
+        return 20*np.log10(np.maximum(power, np.finfo(np.float32).tiny))
+
+    def _n_times(self): 
+        return len(self.times) if self.source is None else self.source.n_times
+
+    def _streaming(self): 
+        return self.source is not None and self.source.streaming
+
+    def _get_pyramid(self, channel): 
+        if self._streaming(): 
+            # A live stream keeps growing, pyramids are only built for recordings
+            return None
+        key = (channel, self.pooling)
+        if key not in self.pyramids: 
+            n_times = self._n_times()
+            self.pyramids[key] = TFRPyramid( 
+                lambda start, stop: self._fetch_view(channel, start, stop), 
+                n_times, 
+                pooling = self.pooling
+            )
+        return self.pyramids[key]
+
+    def _get_spectrum(self): 
+        if self._streaming(): 
+            return None
+        if self.spectrum is None or self.spectrum_channel != self.curr_channel: 
+            channel = self.curr_channel
+            n_times = self._n_times()
+            self.spectrum = WindowedSpectrum( 
+                lambda start, stop: self._fetch_view(channel, start, stop), 
+                n_times
+            )
+            self.spectrum_channel = channel
+        return self.spectrum
+
+    def release(self): 
+        # Embedded widgets never get a closeEvent, their browser calls this
+        self.refresh_timer.stop()
+        if self.loader is not None: 
+            self.loader.stop()
+        if self._owns_level_stats: 
+            self.level_stats.stop()
+
+    def closeEvent(self, event): 
+        self.release()
+        super().closeEvent(event)
+
+    def _get_pixel_width(self): 
+        width = int(self.plot_tfr_widget.getViewBox().width())
+        if width <= 0: 
+            width = self.plot_tfr_widget.width()
+        return max(width, 1)
+
     def _setup_tfr_range(self): 
         # (x, y) is bottom-left corner
         
@@ -1,23 +1,35 @@
 import pyqtgraph as pg
 import numpy as np
 
+from seegview.Data.EnvelopePyramid import EnvelopePyramid
+from seegview.Data.SampleStore import get_sample_store
+from seegview.Data.SlidingWindow import SlidingWindow
+
 class TimeWidget(pg.PlotWidget): 
     def __init__(
             self, 
             raw, 
             curr_channel, 
             curr_time, 
-            window_duration): 
+            window_duration, 
+            dtype = None): 
         super().__init__()
 
-        self.data = raw.get_data(
-            return_times = False
-        )
+        # Shared with every other widget reading this recording
+        self.store = get_sample_store(raw, dtype = dtype)
+        self.store.acquire([curr_channel])
+        self.released = False
         self.ch_names = raw.ch_names
         self.sfreq = raw.info["sfreq"]
 
         self.curr_channel = curr_channel
 
+        # Min/Max envelope of the shown channel, built lazily. Dropped with
+        # the channel, as it holds on to its samples
+        self.pyramids = {}
+        # Raw (times, samples) of the window, only the new edge is read on scroll
+        self.window = SlidingWindow(self._fetch_window, lambda: self.store.n_times)
+
         # Window Parameters
         self.curr_time = curr_time
         self.window_duration = window_duration
@@ -42,7 +54,10 @@ class TimeWidget(pg.PlotWidget):
                 curr_channel = self.ch_names.index(curr_channel_name)
             else: 
                 curr_channel = None
-        if curr_channel is not None: 
+        if curr_channel is not None and curr_channel != self.curr_channel: 
+            self.store.acquire([curr_channel])
+            self.store.release([self.curr_channel])
+            self.pyramids.pop(self.curr_channel, None)
             self.curr_channel = curr_channel
         if curr_time is not None: 
             self.curr_time = curr_time 
@@ -55,7 +70,52 @@ class TimeWidget(pg.PlotWidget):
     ): 
         start_idx_raw = int(self.curr_time*self.sfreq)
         end_idx_raw = int((self.curr_time + self.window_duration)*self.sfreq)
-        times = self.curr_time + np.arange(end_idx_raw - start_idx_raw)/self.sfreq
-        raw_trace = self.data[self.curr_channel, start_idx_raw:end_idx_raw].flatten()
+
+        envelope = None
+        if not self.store.streaming: 
+            # A live stream keeps growing, envelopes are only built for recordings
+            envelope = self._get_pyramid(self.curr_channel).envelope(
+                start_idx_raw, 
+                end_idx_raw, 
+                self._get_pixel_width()
+            )
+        if envelope is not None: 
+            positions, trace = envelope
+            self.line_item.setData(positions/self.sfreq, trace)
+            return
+
+        times, raw_trace = self.window.get(
+            start_idx_raw, 
+            end_idx_raw, 
+            key = self.curr_channel
+        )
         self.line_item.setData(times, raw_trace)
-        
+
+    def _fetch_window(self, start, stop): 
+        window = np.empty((2, stop - start))
+        window[0] = np.arange(start, stop)/self.sfreq
+        window[1] = self.store.channel(self.curr_channel)[start:stop]
+        return window
+
+    def _get_pyramid(self, channel): 
+        if channel not in self.pyramids: 
+            self.pyramids[channel] = EnvelopePyramid(self.store.channel(channel))
+        return self.pyramids[channel]
+
+    def _get_pixel_width(self): 
+        width = int(self.getViewBox().width())
+        if width <= 0: 
+            width = self.width()
+        return max(width, 1)
+
+    def release(self): 
+        # Embedded widgets never get a closeEvent, their browser calls this
+        if not self.released: 
+            self.store.release([self.curr_channel])
+            self.pyramids.clear()
+            self.window.invalidate()
+            self.released = True
+
+    def closeEvent(self, event): 
+        self.release()
+        super().closeEvent(event)
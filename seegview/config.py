@@ -1,5 +1,9 @@
+import os
+
 # A file to store all the paths used for the demo 
 # Replace these values following the instructions in the README.md
 
 bids_root = r"D:/DABI/StimulationDataset"
-freesurfer_root = r"D:\DABI\StimulationDataset\derivatives\freesurf"
\ No newline at end of file
+freesurfer_root = r"D:\DABI\StimulationDataset\derivatives\freesurf"
+# Where seegview keeps its on-disk caches (converted recordings, TFRs, ...)
+cache_root = os.path.join(os.path.expanduser("~"), ".cache", "seegview")
@@ -2,8 +2,9 @@ import mne_bids
 import mne
 
 from seegview.config import bids_root
+from seegview.Data.MemmapRaw import MemmapRaw
 
-def load(index = 1):
+def load(index = 1, lazy = False):
     ext = "vhdr" #extension for the recording
     subject = "4r3o" #sample
     sess = "postimp"
@@ -22,5 +23,8 @@ def load(index = 1):
     bids_path = bids_paths.match()[index]
     #Load
     raw = mne_bids.read_raw_bids(bids_path)
+    if lazy: 
+        # Samples stay on disk and are memory-mapped on access
+        return MemmapRaw(raw, header_fname = bids_path.fpath)
     raw.load_data()
-    return raw
\ No newline at end of file
+    return raw
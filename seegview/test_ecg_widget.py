@@ -112,6 +112,11 @@ class ECGTestWindow(QMainWindow):
             # Close window
             self.close()
 
+    def closeEvent(self, event):
+        if hasattr(self, "ecg_widget"):
+            self.ecg_widget.release()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,98 @@
+"""
+test_stream_viewer.py - Live view of a simulated sEEG acquisition
+
+A background thread appends synthetic float32 frames to a file, which a
+FileStreamSource tails. F toggles following the newest samples, Left pauses.
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication, QMainWindow
+
+from seegview.Data.StreamSource import FileStreamSource
+from seegview.Widgets.MultipleTimeWidget import MultipleTimeWidget
+from seegview.Managers.TimeManager import TimeManager
+from seegview.Managers.KeypressManager import KeybindingManager
+
+
+def simulate_device(fname, n_channels, sfreq, block_duration = 0.05):
+    rng = np.random.default_rng(0)
+    n = int(sfreq * block_duration)
+    sample = 0
+    with open(fname, "ab") as f:
+        while True:
+            t = (sample + np.arange(n)) / sfreq
+            block = 1e-5 * (np.sin(2 * np.pi * 8 * t) + rng.standard_normal((n_channels, n)))
+            f.write(block.T.astype("<f4").tobytes())
+            f.flush()
+            sample += n
+            time.sleep(block_duration)
+
+
+class StreamViewer(QMainWindow):
+    def __init__(self, source, window_duration = 10.0, num_traces = 8):
+        super().__init__()
+        self.source = source
+
+        self.time_manager = TimeManager(
+            initial_time = 0.0,
+            initial_duration = window_duration,
+            max_time = 0.0
+        )
+
+        self.widget = MultipleTimeWidget(
+            raw = source,
+            curr_channel = 0,
+            curr_time = 0.0,
+            window_duration = window_duration,
+            num_traces = num_traces
+        )
+        self.setCentralWidget(self.widget)
+        self.time_manager.register_widget(self.widget)
+        self.time_manager.start_follow(source)
+
+        self.keybinding_manager = KeybindingManager(self)
+
+        self.setWindowTitle("Stream Viewer")
+        self.resize(1200, 800)
+
+    def keyPressEvent(self, event):
+        if not self.keybinding_manager.handle_key_press(event.key()):
+            super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        self.widget.release()
+        super().closeEvent(event)
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+
+    n_channels = 16
+    sfreq = 1000.0
+    fname = os.path.join(tempfile.mkdtemp(), "stream.f32")
+    open(fname, "wb").close()
+
+    threading.Thread(
+        target = simulate_device,
+        args = (fname, n_channels, sfreq),
+        daemon = True
+    ).start()
+
+    source = FileStreamSource(
+        fname,
+        [f"A{i + 1}" for i in range(n_channels)],
+        sfreq,
+        buffer_duration = 120.0
+    )
+    source.start()
+
+    viewer = StreamViewer(source)
+    viewer.show()
+
+    sys.exit(app.exec_())
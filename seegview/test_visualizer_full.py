@@ -6,6 +6,8 @@ from seegview.load_reference_dataset import load
 import numpy as np
 
 from seegview.Browsers.TFRBrowser import TFRBrowser
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRCache import TFRCache
 
 from seegview.Widgets.BrainSurfaceWidget import BrainSurfaceWidget
 from seegview.Widgets.MRISliceView import MRIViewer
@@ -24,8 +26,7 @@ raw = load(0)
 
 
 freqs = np.arange(50) + 2
-picks = np.arange(10) + 65
-tf = raw.copy().pick(picks).compute_tfr(method = "morlet", freqs = freqs, decim = 100)
+tf = TFRCache(MorletEngine(raw, freqs = freqs, decim = 100))
 
 tfr_browser = TFRBrowser(
     tf = tf,
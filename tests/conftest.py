@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+# Widgets are built without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope = "session")
+def qapp(): 
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,99 @@
+import functools
+import os
+import time
+
+import numpy as np
+import mne
+import pytest
+from mne.time_frequency import psd_array_welch
+
+from seegview.Data.AnalysisCache import AnalysisCache, _func_name
+from seegview.Widgets.Analysis import get_psds, welch_with_CI
+
+
+@pytest.fixture
+def raw(): 
+    info = mne.create_info(3, 1000.0, "seeg")
+    return mne.io.RawArray(np.random.default_rng(0).standard_normal((3, 60000)) * 1e-5, info, verbose = False)
+
+
+def _segments(): 
+    onsets = np.arange(0, 50000, 5000)
+    return onsets, onsets + 4000
+
+
+def test_hit_returns_the_result_without_computing(tmp_path): 
+    cache = AnalysisCache(tmp_path)
+    calls = []
+
+    def compute(): 
+        calls.append(1)
+        return np.arange(6.0).reshape(2, 3), np.array([1, 2])
+
+    first = cache.memoize("f", {"a": 1}, compute)
+    second = cache.memoize("f", {"a": 1}, compute)
+    assert len(calls) == 1
+    for got, expected in zip(second, first): 
+        np.testing.assert_array_equal(got, expected)
+        assert got.dtype == expected.dtype
+    cache.memoize("f", {"a": 2}, compute)
+    assert len(calls) == 2
+
+
+def test_dtype_is_opt_in(tmp_path): 
+    result = (np.ones((2, 2)), np.ones(2))
+    assert AnalysisCache(tmp_path).memoize("f", {}, lambda: result)[0].dtype == np.float64
+    stored = AnalysisCache(tmp_path, dtype = "float32").memoize("f", {}, lambda: result)
+    assert stored[0].dtype == np.float32 and stored[1].dtype == np.float64
+    assert len(AnalysisCache(tmp_path).info()["entries"]) == 2
+
+
+def test_least_recently_used_are_evicted(tmp_path): 
+    cache = AnalysisCache(tmp_path, max_bytes = 10**9)
+    for name in "abc": 
+        cache.memoize(name, {}, lambda: (np.zeros(10000),))
+        time.sleep(0.02)
+    # Reading "a" makes "b" the least recently used
+    cache.memoize("a", {}, lambda: pytest.fail("computed again"))
+    cache.max_bytes = 2 * os.path.getsize(cache._entries()[0][0]) + 100
+    cache.evict()
+    assert sorted(entry["name"] for entry in cache.info()["entries"]) == ["a", "c"]
+    cache.clear("a")
+    assert [entry["name"] for entry in cache.info()["entries"]] == ["c"]
+
+
+def test_psds_match_uncached(raw, tmp_path): 
+    cache = AnalysisCache(tmp_path)
+    onsets, ends = _segments()
+    args = (raw, None, psd_array_welch, 1000.0, onsets, ends, 1, False, 100)
+    expected = welch_with_CI(*get_psds(*args))
+    for _ in range(2): 
+        for got, want in zip(cache.psd_with_CI(*args), expected): 
+            np.testing.assert_allclose(got, want)
+
+
+def test_fingerprint_computed_once_per_raw(raw, tmp_path, monkeypatch): 
+    from seegview.Data import AnalysisCache as analysis_cache
+
+    calls = []
+    fingerprint = analysis_cache.raw_fingerprint
+    monkeypatch.setattr(analysis_cache, "raw_fingerprint", lambda *args: calls.append(1) or fingerprint(*args))
+    cache = AnalysisCache(tmp_path)
+    onsets, ends = _segments()
+    for fmax in (50, 100): 
+        cache.get_psds(raw, None, psd_array_welch, 1000.0, onsets, ends, 1, False, fmax)
+    assert len(calls) == 1
+    # Filtering in place changes the recording
+    before = cache._fingerprint(raw)
+    raw.filter(1.0, None, verbose = False)
+    assert cache._fingerprint(raw) != before
+    assert len(calls) == 2
+
+
+def test_function_names(): 
+    assert _func_name(psd_array_welch) == f"{psd_array_welch.__module__}.psd_array_welch"
+    assert _func_name(functools.partial(psd_array_welch, n_fft = 256)) != _func_name(functools.partial(psd_array_welch, n_fft = 512))
+    assert _func_name(lambda x: x, "mine") == "mine"
+    for func in (lambda x: x, functools.partial(psd_array_welch, window = np.ones(4))): 
+        with pytest.raises(ValueError): 
+            _func_name(func)
@@ -0,0 +1,112 @@
+import numpy as np
+import mne
+import pytest
+
+from seegview.Data.AnnotationIndex import AnnotationIndex
+from seegview.Managers.AnnotationsManager import AnnotationsManager
+
+DESCRIPTIONS = np.array(["BAD", "spike", "stim", "seizure"])
+
+
+def _random_annotations(rng, n): 
+    # Rounded onsets give ties, durations span zero to minutes
+    onsets = np.round(rng.uniform(0, 1000, n), 1)
+    durations = np.where(rng.random(n) < 0.3, 0.0, rng.exponential(2.0, n) ** 3)
+    descriptions = DESCRIPTIONS[rng.integers(0, len(DESCRIPTIONS), n)]
+    return onsets, durations, descriptions
+
+
+def _linear_visible(annotations, start, stop, descriptions = None): 
+    return sorted( 
+        (onset, onset + duration, description)
+        for onset, duration, description in annotations
+        if onset <= stop and onset + duration >= start
+        and (descriptions is None or description in descriptions)
+    )
+
+
+def _linear_onsets(annotations, descriptions = None): 
+    return np.sort([onset for onset, _, description in annotations if descriptions is None or description in descriptions])
+
+
+def _check(index, annotations, rng): 
+    assert len(index) == len(annotations)
+    assert index.descriptions == sorted({description for _, _, description in annotations})
+    for descriptions in (None, ["spike"], ["BAD", "stim"], ["missing"]): 
+        onsets = _linear_onsets(annotations, descriptions)
+        assert index.count(descriptions) == len(onsets)
+        for n in (0, 1, len(onsets) // 2, len(onsets) - 1, -1, -len(onsets), len(onsets), -len(onsets) - 1): 
+            expected = onsets[n] if -len(onsets) <= n < len(onsets) else None
+            assert index.nth_onset(n, descriptions) == expected
+        for start in rng.uniform(-50, 1050, 20): 
+            stop = start + rng.choice([0.0, 0.5, 10.0, 300.0])
+            onsets_found, ends_found, descriptions_found = index.visible(start, stop, descriptions)
+            assert np.all(np.diff(onsets_found) >= 0)
+            found = sorted(zip(onsets_found.tolist(), ends_found.tolist(), descriptions_found.tolist()))
+            assert found == _linear_visible(annotations, start, stop, descriptions)
+
+        # Times exactly on an onset are neither after nor before it
+        for time in np.concatenate([rng.uniform(-50, 1050, 20), onsets[:5]]): 
+            after = onsets[onsets > time]
+            before = onsets[onsets < time]
+            assert index.next_onset(time, descriptions) == (after[0] if len(after) else None)
+            assert index.previous_onset(time, descriptions) == (before[-1] if len(before) else None)
+
+
+def test_queries_match_a_linear_scan(): 
+    rng = np.random.default_rng(0)
+    onsets, durations, descriptions = _random_annotations(rng, 500)
+    index = AnnotationIndex(onsets, durations, descriptions)
+    _check(index, list(zip(onsets.tolist(), durations.tolist(), descriptions.tolist())), rng)
+
+
+def test_queries_match_a_linear_scan_after_edits(): 
+    rng = np.random.default_rng(1)
+    onsets, durations, descriptions = _random_annotations(rng, 300)
+    annotations = list(zip(onsets.tolist(), durations.tolist(), descriptions.tolist()))
+    index = AnnotationIndex(onsets, durations, descriptions)
+    for step in range(200): 
+        if rng.random() < 0.5 and annotations: 
+            annotation = annotations.pop(rng.integers(len(annotations)))
+            assert index.remove(*annotation)
+        else: 
+            new = _random_annotations(rng, int(rng.integers(1, 4)))
+            index.insert(*new)
+            annotations.extend(zip(new[0].tolist(), new[1].tolist(), new[2].tolist()))
+        if step % 40 == 0: 
+            _check(index, annotations, rng)
+    _check(index, annotations, rng)
+    assert not index.remove(-1.0, 0.0, "BAD")
+
+
+def test_removing_the_last_of_a_description_drops_it(): 
+    index = AnnotationIndex([1.0, 2.0], [0.0, 1.0], ["BAD", "spike"])
+    assert index.remove(2.0, 1.0, "spike")
+    assert index.descriptions == ["BAD"]
+    assert index.next_onset(0.0, ["spike"]) is None
+    assert index.nth_onset(0, ["spike"]) is None
+
+
+def test_description_queries_need_per_description(): 
+    index = AnnotationIndex([1.0], [0.0], ["BAD"], per_description = False)
+    assert index.next_onset(0.0) == 1.0
+    with pytest.raises(ValueError): 
+        index.next_onset(0.0, ["BAD"])
+
+
+def test_manager_indexes_external_edits_again(qapp): 
+    annotations = mne.Annotations([1.0, 5.0, 9.0], [0.0, 0.0, 0.0], ["BAD", "BAD", "BAD"])
+    manager = AnnotationsManager(annotations, current_time = 0.0, window_duration = 2.0)
+    assert manager._get_index().nth_onset(1) == 5.0
+
+    # Same length, other onsets and descriptions
+    annotations.onset[1] = 6.0
+    annotations.description[2] = "spike"
+    index = manager._get_index()
+    assert index.nth_onset(1) == 6.0
+    assert index.descriptions == ["BAD", "spike"]
+
+    # Edits through the manager keep the index it updated
+    manager.add_annotation(3.0, 0.0, "stim")
+    assert manager._get_index() is index
+    assert index.nth_onset(1) == 3.0
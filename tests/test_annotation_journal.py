@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+import mne
+
+from seegview.Data import AnnotationJournal as journal_module
+from seegview.Data.AnnotationJournal import AnnotationJournal
+
+
+def _entries(annotations): 
+    return sorted( 
+        (float(onset), float(duration), str(description), tuple(ch_names), tuple(sorted((extras or {}).items())))
+        for onset, duration, description, ch_names, extras in zip( 
+            annotations.onset, 
+            annotations.duration, 
+            annotations.description, 
+            annotations.ch_names, 
+            annotations.extras
+        )
+    )
+
+
+def _initial(): 
+    return mne.Annotations( 
+        [1.0, 2.5, 4.0], 
+        [0.0, 1.0, 0.5], 
+        ["BAD", "spike", "BAD"], 
+        ch_names = [[], ["A1"], []]
+    )
+
+
+def _edit(journal, annotations, op, *args, **kwargs): 
+    # Mirrors the manager, the journal and the annotations edited together
+    getattr(journal, op)(*args, **kwargs)
+    onset, duration, description = args[:3]
+    if op in ("delete", "relabel"): 
+        i = next( 
+            i for i, (o, d, desc) in enumerate(zip(annotations.onset, annotations.duration, annotations.description))
+            if o == onset and d == duration and desc == description
+        )
+        ch_names, extras = annotations.ch_names[i], annotations.extras[i]
+        annotations.delete(i)
+    if op == "add": 
+        annotations.append(onset, duration, description, ch_names = [list(kwargs.get("ch_names", ()))], extras = [kwargs.get("extras")])
+    if op == "relabel": 
+        annotations.append(onset, duration, args[3], ch_names = [list(ch_names)], extras = [extras])
+
+
+def test_new_journal_starts_from_the_annotations(tmp_path): 
+    journal = AnnotationJournal(str(tmp_path / "journal.jsonl"), fsync = False)
+    annotations = journal.load(_initial())
+    journal.close()
+    assert _entries(annotations) == _entries(_initial())
+    assert _entries(AnnotationJournal(str(tmp_path / "journal.jsonl")).load()) == _entries(_initial())
+
+
+def test_replay_matches_the_edited_annotations(tmp_path): 
+    path = str(tmp_path / "journal.jsonl")
+    journal = AnnotationJournal(path, fsync = False)
+    annotations = journal.load(_initial())
+    _edit(journal, annotations, "add", 7.0, 0.0, "stim", ch_names = ("A2",), extras = {"x": 1})
+    _edit(journal, annotations, "delete", 1.0, 0.0, "BAD")
+    _edit(journal, annotations, "relabel", 2.5, 1.0, "spike", "sharp wave", ch_names = ("A1",))
+    # Deleting an annotation twice only deletes it once
+    journal.delete(1.0, 0.0, "BAD")
+    journal.close()
+
+    replay = AnnotationJournal(path)
+    assert _entries(replay.load()) == _entries(annotations)
+    assert replay.n_edits == 4
+    replay.close()
+
+
+def test_torn_last_line_is_dropped(tmp_path): 
+    path = str(tmp_path / "journal.jsonl")
+    journal = AnnotationJournal(path, fsync = False)
+    annotations = journal.load(_initial())
+    _edit(journal, annotations, "add", 7.0, 0.0, "stim")
+    journal.add(8.0, 0.0, "stim")
+    journal.close()
+    # A crash in the middle of the last edit
+    with open(path, "rb") as f: 
+        data = f.read()
+    with open(path, "wb") as f: 
+        f.write(data[:-10])
+
+    journal = AnnotationJournal(path, fsync = False)
+    assert _entries(journal.load()) == _entries(annotations)
+    # The next edit starts a line of its own
+    _edit(journal, annotations, "add", 9.0, 0.0, "BAD")
+    journal.close()
+    assert _entries(AnnotationJournal(path).load()) == _entries(annotations)
+
+
+def test_edits_during_compaction_are_kept(tmp_path, monkeypatch): 
+    path = str(tmp_path / "journal.jsonl")
+    journal = AnnotationJournal(path, fsync = False)
+    annotations = journal.load(_initial())
+    for i in range(5): 
+        _edit(journal, annotations, "add", 10.0 + i, 0.0, "stim")
+
+    # Hold the compaction after it wrote the snapshot, until edits came in
+    snapshot_written = threading.Event()
+    resume = threading.Event()
+    write_synced = journal_module._write_synced
+
+    def blocking_write_synced(path, data, mode): 
+        write_synced(path, data, mode)
+        if mode == "wb" and not snapshot_written.is_set(): 
+            snapshot_written.set()
+            assert resume.wait(10)
+
+    monkeypatch.setattr(journal_module, "_write_synced", blocking_write_synced)
+    journal.compact(annotations.copy())
+    assert snapshot_written.wait(10)
+    _edit(journal, annotations, "delete", 10.0, 0.0, "stim")
+    _edit(journal, annotations, "relabel", 4.0, 0.5, "BAD", "artifact")
+    _edit(journal, annotations, "add", 20.0, 0.0, "stim")
+    resume.set()
+    journal._compaction.join()
+    assert journal.n_edits == 3
+
+    # Edits after the compaction go to the new file
+    _edit(journal, annotations, "add", 21.0, 0.0, "BAD")
+    journal.close()
+    replay = AnnotationJournal(path)
+    assert _entries(replay.load()) == _entries(annotations)
+    assert replay.n_edits == 4
+    replay.close()
+
+
+def test_events_export(tmp_path): 
+    path = str(tmp_path / "journal.jsonl")
+    events_fname = str(tmp_path / "events.tsv")
+    journal = AnnotationJournal(path, events_fname = events_fname, fsync = False, first_time = 0.5)
+    annotations = journal.load(_initial())
+    _edit(journal, annotations, "add", 7.1, 0.2, "two\twords\nsplit")
+    _edit(journal, annotations, "add", 8.0, 0.0, " \t")
+    journal.compact(annotations, wait = True)
+    journal.close()
+
+    with open(events_fname, encoding = "utf-8") as f: 
+        rows = [line.rstrip("\n").split("\t") for line in f]
+    assert rows[0] == ["onset", "duration", "trial_type"]
+    assert all(len(row) == 3 for row in rows)
+    expected = sorted(zip(annotations.onset - 0.5, annotations.duration, annotations.description))
+    got = sorted((float(onset), float(duration), description) for onset, duration, description in rows[1:])
+    assert len(got) == len(expected)
+    for (onset, duration, description), (expected_onset, expected_duration, _) in zip(got, expected): 
+        assert np.isclose(onset, expected_onset)
+        assert duration == expected_duration
+    assert {row[2] for row in rows[1:]} == {"BAD", "spike", "two words split", "n/a"}
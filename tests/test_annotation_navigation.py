@@ -0,0 +1,106 @@
+import numpy as np
+import mne
+import pytest
+
+from seegview.Managers.AnnotationsManager import AnnotationsManager
+
+DESCRIPTIONS = np.array(["BAD", "stim 3 mA", "stim 1 mA", "marker"])
+
+
+@pytest.fixture
+def annotations(): 
+    rng = np.random.default_rng(0)
+    n = 400
+    return mne.Annotations( 
+        np.round(rng.uniform(10, 2000, n), 2), 
+        np.where(rng.random(n) < 0.5, 0.0, rng.uniform(0, 20, n)), 
+        DESCRIPTIONS[rng.integers(0, len(DESCRIPTIONS), n)]
+    )
+
+
+def _manager(annotations, **kwargs): 
+    return AnnotationsManager(annotations, current_time = 0.0, window_duration = 10.0, **kwargs)
+
+
+def _onsets(annotations, descriptions): 
+    return np.sort([ 
+        onset for onset, description in zip(annotations.onset, annotations.description)
+        if descriptions is None or description in descriptions
+    ])
+
+
+def _walk(manager, step): 
+    # Times of the windows visited, pressing next (or previous) until the end
+    visited = []
+    while True: 
+        time = step()
+        if time is None: 
+            return visited
+        visited.append(time)
+        manager.current_time = time
+
+
+@pytest.mark.parametrize("descriptions", [None, ["stim 3 mA"], ["BAD", "marker"]])
+def test_navigation_matches_a_linear_scan(qapp, annotations, descriptions): 
+    manager = _manager(annotations, selected_descriptions = descriptions)
+    onsets = _onsets(annotations, descriptions)
+    half = manager.window_duration / 2
+    # Onsets are after the first half window, none is clamped to the start
+    expected = [onset - half for onset in np.unique(onsets)]
+
+    assert _walk(manager, manager._to_next_annotation) == expected
+    manager.current_time = 3000.0
+    assert _walk(manager, manager._to_previous_annotation) == expected[::-1]
+
+    for n in (0, 5, len(onsets) - 1, -1, -len(onsets)): 
+        assert manager._to_nth_annotation(n) == onsets[n] - half
+    assert manager._to_nth_annotation(len(onsets)) is None
+
+
+def test_display_is_filtered(qapp, annotations): 
+    manager = _manager(annotations, selected_descriptions = "stim 1 mA")
+    manager.update_annotations(current_time = 100.0, window_duration = 200.0)
+    onsets, ends, descs = manager.visible
+    assert set(descs) == {"stim 1 mA"}
+    expected = sorted( 
+        (max(onset, 100.0), min(onset + duration, 300.0))
+        for onset, duration, description in zip(annotations.onset, annotations.duration, annotations.description)
+        if description == "stim 1 mA" and onset <= 300.0 and onset + duration >= 100.0
+    )
+    assert expected
+    assert sorted(zip(onsets.tolist(), ends.tolist())) == expected
+
+    manager.filter_display = False
+    manager.redraw_annotations()
+    assert len(set(manager.visible[2])) == len(DESCRIPTIONS)
+    # Navigation stays filtered
+    manager.update_annotations(current_time = 0.0, window_duration = 10.0)
+    onset = manager._to_next_annotation() + 5.0
+    assert onset == _onsets(annotations, ["stim 1 mA"])[0]
+
+
+def test_cycle_descriptions(qapp, annotations): 
+    manager = _manager(annotations)
+    seen = []
+    for _ in range(len(DESCRIPTIONS) + 1): 
+        manager.cycle_descriptions()
+        seen.append(manager.selected_descriptions)
+    assert seen == [[description] for description in sorted(DESCRIPTIONS)] + [None]
+    manager.cycle_descriptions(-1)
+    assert manager.selected_descriptions == [sorted(DESCRIPTIONS)[-1]]
+
+    with pytest.raises(ValueError): 
+        manager.select_descriptions([])
+
+
+def test_navigation_follows_edits(qapp): 
+    annotations = mne.Annotations([10.0, 20.0, 30.0], [0.0, 0.0, 0.0], ["BAD", "stim", "BAD"])
+    manager = _manager(annotations, selected_descriptions = ["stim"])
+    assert manager._to_nth_annotation(-1) == 15.0
+
+    manager.add_annotation(40.0, 0.0, "stim")
+    assert manager._to_nth_annotation(-1) == 35.0
+    manager.relabel_annotation(0, "stim")
+    assert manager._to_nth_annotation(0) == 5.0
+    manager.remove_annotation(int(np.flatnonzero(manager.annotations.onset == 20.0)[0]))
+    assert manager._get_index().count(["stim"]) == 2
@@ -0,0 +1,51 @@
+import numpy as np
+import mne
+import pytest
+
+from seegview.Data.ChannelScaling import ChannelScaler, get_shaft_name
+
+
+def _raw(stds, n_times = 20000): 
+    ch_names = [f"LA{i + 1}" for i in range(len(stds) // 2)] + [f"RH'{i + 1}" for i in range(len(stds) - len(stds) // 2)]
+    info = mne.create_info(ch_names, 500.0, "seeg")
+    data = np.random.default_rng(0).standard_normal((len(stds), n_times)) * np.asarray(stds)[:, np.newaxis]
+    return mne.io.RawArray(data, info, verbose = False)
+
+
+@pytest.mark.parametrize("name, shaft", [("LA1", "LA"), ("RH'10", "RH'"), ("A_12", "A"), ("Fz", "Fz"), ("12", "12")])
+def test_shaft_name(name, shaft): 
+    assert get_shaft_name(name) == shaft
+
+
+def test_scales_are_robust_stds(): 
+    stds = np.array([1.0, 2.0, 4.0, 8.0])
+    raw = _raw(stds)
+    # An artifact in one chunk moves the chunk's scale, not the median
+    raw._data[0, 1000:1500] = 1e3
+    scaler = ChannelScaler(raw, start = False)
+    assert scaler.get_scales([0]) is None
+    scaler.compute()
+    assert scaler.done
+    np.testing.assert_allclose(scaler.get_scales(range(4), "channel"), stds, rtol = 0.05)
+    np.testing.assert_allclose(scaler.get_scales([0, 3], "global"), np.median(stds), rtol = 0.05)
+    np.testing.assert_allclose(scaler.get_scales([0, 3], "shaft"), [1.5, 6.0], rtol = 0.05)
+    with pytest.raises(ValueError): 
+        scaler.get_scales([0], "window")
+
+
+def test_flat_channels_keep_traces_apart(qapp): 
+    from seegview.Widgets.MultipleTimeWidget import MultipleTimeWidget
+
+    # Mostly flat, the median scale is zero
+    raw = _raw([0.0, 0.0, 0.0, 1.0])
+    scaler = ChannelScaler(raw, start = False)
+    scaler.compute()
+    assert scaler.get_reference_scale() == 0
+    widget = MultipleTimeWidget(raw, 0, 0.0, 5.0, 4, scaler = scaler)
+    try: 
+        widget.redraw()
+        _, y = widget.batch_item.getData()
+        means = [np.nanmean(trace) for trace in np.array_split(y, 4)]
+        assert len(np.unique(np.round(means, 6))) == 4
+    finally: 
+        widget.release()
@@ -0,0 +1,84 @@
+import functools
+
+import numpy as np
+import mne
+import pytest
+from mne.time_frequency import psd_array_welch
+
+from seegview.Widgets.Analysis import get_psds
+
+FS = 200.0
+
+
+@pytest.fixture
+def raw(): 
+    info = mne.create_info(["A1", "A2", "B1", "B2"], FS, "seeg")
+    return mne.io.RawArray(np.random.default_rng(0).standard_normal((4, 60000)) * 1e-5, info, verbose = False)
+
+
+def _segments(): 
+    # Unequal lengths, out of order and overlapping
+    onsets = np.array([30000, 0, 1000, 1200, 50000, 20000])
+    lengths = np.array([600, 1900, 700, 600, 3000, 1300])
+    return onsets, onsets + lengths
+
+
+def _reference(raw, picks, onsets, ends, fmax, dB = False): 
+    # One psd_array_welch call per segment, in segment order
+    n_fft = int(FS*3)
+    psds = []
+    for onset, end in zip(onsets, ends): 
+        psd, freqs = psd_array_welch( 
+            raw.get_data(picks, start = onset, stop = end), 
+            sfreq = FS, 
+            n_fft = n_fft, 
+            fmax = fmax, 
+            average = False, 
+            output = "power", 
+            verbose = False
+        )
+        psds.append(psd)
+    psds = np.concatenate(psds, axis = -1)
+    return freqs, 20*np.log10(psds) if dB else psds
+
+
+@pytest.mark.parametrize("max_batch_bytes", [2**27, 4*8*600])
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_batched_welch_matches_psd_array_welch(raw, max_batch_bytes, n_jobs): 
+    onsets, ends = _segments()
+    freqs, psds = get_psds(raw, None, psd_array_welch, FS, onsets, ends, n_jobs, False, 40, max_batch_bytes)
+    expected_freqs, expected = _reference(raw, None, onsets, ends, 40)
+    np.testing.assert_allclose(freqs, expected_freqs)
+    assert psds.shape == expected.shape == (4, len(freqs), int(np.sum((ends - onsets)//600)))
+    np.testing.assert_allclose(psds, expected, rtol = 1e-10)
+
+
+def test_picks_and_dB(raw): 
+    onsets, ends = _segments()
+    _, psds = get_psds(raw, ["B1", "A2"], psd_array_welch, FS, onsets, ends, 1, True, FS/2)
+    _, expected = _reference(raw, ["B1", "A2"], onsets, ends, FS/2, dB = True)
+    np.testing.assert_allclose(psds, expected, rtol = 1e-10)
+
+
+@pytest.mark.filterwarnings("ignore:Non-finite values")
+def test_other_psd_funcs_and_missing_samples(raw): 
+    onsets, ends = _segments()
+    expected_freqs, expected = _reference(raw, None, onsets, ends, 40)
+    # Any other function goes through psd_func itself
+    freqs, psds = get_psds(raw, None, functools.partial(psd_array_welch, verbose = False), FS, onsets, ends, 2, False, 40)
+    np.testing.assert_allclose(freqs, expected_freqs)
+    np.testing.assert_allclose(psds, expected, rtol = 1e-10)
+
+    # As do segments with NaNs, left to psd_array_welch
+    raw._data[0, 1100] = np.nan
+    _, psds = get_psds(raw, None, psd_array_welch, FS, onsets, ends, 1, False, 40)
+    _, expected = _reference(raw, None, onsets, ends, 40)
+    np.testing.assert_array_equal(np.isnan(psds), np.isnan(expected))
+    np.testing.assert_allclose(psds, expected, rtol = 1e-10)
+
+
+def test_bad_segments(raw): 
+    with pytest.raises(ValueError): 
+        get_psds(raw, None, psd_array_welch, FS, [], [], 1, False, 40)
+    with pytest.raises(ValueError): 
+        get_psds(raw, None, psd_array_welch, FS, [0, 1000], [600, 1599], 1, False, 40)
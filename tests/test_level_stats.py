@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+import mne
+
+from seegview.Data.LevelStats import LevelStats
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRCache import TFRCache
+
+
+def _power(n_channels = 3, n_freqs = 4, n_times = 6000): 
+    rng = np.random.default_rng(0)
+    gains = 10.0 ** np.arange(n_channels)
+    return rng.lognormal(size = (n_channels, n_freqs, n_times)) * gains[:, np.newaxis, np.newaxis]
+
+
+def _stats(power, **kwargs): 
+    fetched = []
+
+    def fetch(ch, start, stop): 
+        fetched.append(ch)
+        return power[ch, :, start:stop]
+
+    stats = LevelStats(fetch, power.shape[0], power.shape[1], power.shape[2], chunk_size = 1000, **kwargs)
+    return stats, fetched
+
+
+def _close(stats, levels, expected): 
+    # Quantiles are read off the bins, good to a bin in log10 power
+    np.testing.assert_allclose(np.log10(levels), np.log10(expected), atol = stats.bin_width)
+
+
+def test_levels_match_quantiles(): 
+    power = _power()
+    stats, _ = _stats(power, start = False)
+    stats.compute()
+    assert stats.done
+    _close(stats, stats.get_levels(1, "channel"), np.quantile(power[1], [0.01, 0.99]))
+    _close(stats, stats.get_levels(0, "global"), np.quantile(power, [0.01, 0.99]))
+    _close(stats, stats.get_levels(2, "window", 2000, 3000), np.quantile(power[2, :, 2000:3000], [0.01, 0.99]))
+
+
+def test_displayed_channel_first_and_lazily(): 
+    power = _power()
+    stats, fetched = _stats(power)
+    try: 
+        assert stats.get_levels(2) is None
+        deadline = time.monotonic() + 5
+        while not stats.chunk_done[2].all() and time.monotonic() < deadline: 
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert set(fetched) == {2}
+        assert stats.get_levels(2) is not None
+    finally: 
+        stats.stop()
+    assert stats._thread is None
+
+
+def test_per_frequency_levels(): 
+    power = _power(n_channels = 1)
+    power[0, 3] *= 100
+    stats, _ = _stats(power, start = False, per_frequency = True)
+    stats.compute()
+    levels = stats.get_frequency_levels(0)
+    assert levels.shape == (4, 2)
+    assert levels[3, 1] > 10 * levels[0, 1]
+
+
+def test_cache_get_without_persisting(tmp_path): 
+    info = mne.create_info(2, 256.0, "seeg")
+    raw = mne.io.RawArray(np.random.default_rng(1).standard_normal((2, 256 * 60)), info, verbose = False)
+    engine = MorletEngine(raw, freqs = np.arange(4.0, 20.0, 4.0), decim = 4)
+    cache = TFRCache(engine, cache_dir = tmp_path)
+    expected = engine.get(1, 0, engine.n_times)
+    np.testing.assert_allclose(cache.get(1, 0, engine.n_times, cache = False), expected)
+    assert not cache.done.any()
+    # Tiles on disk are read, the others computed
+    cache.get(1, 0, 10)
+    np.testing.assert_allclose(cache.get(1, 0, engine.n_times, cache = False), expected, rtol = 1e-6)
+    assert cache.done.sum() == 1
@@ -0,0 +1,86 @@
+import numpy as np
+import mne
+
+from seegview.Data.EnvelopePyramid import EnvelopePyramid
+from seegview.Data.MemmapRaw import MemmapRaw
+
+
+def _write_brainvision(tmp_path, samples, resolution = 0.1): 
+    # INT_16, multiplexed, the layout most amplifiers record in
+    n_channels = samples.shape[0]
+    (tmp_path / "rec.eeg").write_bytes(samples.T.astype("<i2").tobytes())
+    (tmp_path / "rec.vmrk").write_text( 
+        "Brain Vision Data Exchange Marker File, Version 1.0\n"
+        "[Common Infos]\nCodepage=UTF-8\nDataFile=rec.eeg\n"
+        "[Marker Infos]\nMk1=New Segment,,1,1,0\n"
+    )
+    channels = "".join(f"Ch{i + 1}=E{i + 1},,{resolution},µV\n" for i in range(n_channels))
+    (tmp_path / "rec.vhdr").write_text( 
+        "Brain Vision Data Exchange Header File Version 1.0\n"
+        "[Common Infos]\nCodepage=UTF-8\nDataFile=rec.eeg\nMarkerFile=rec.vmrk\n"
+        f"DataFormat=BINARY\nDataOrientation=MULTIPLEXED\nNumberOfChannels={n_channels}\n"
+        "SamplingInterval=2000\n"
+        "[Binary Infos]\nBinaryFormat=INT_16\n"
+        f"[Channel Infos]\n{channels}", 
+        encoding = "utf-8"
+    )
+    return tmp_path / "rec.vhdr"
+
+
+def test_brainvision_matches_mne(tmp_path): 
+    samples = np.random.default_rng(0).integers(-2000, 2000, size = (3, 20000))
+    vhdr = _write_brainvision(tmp_path, samples)
+    raw = mne.io.read_raw_brainvision(vhdr, preload = False, verbose = False)
+    memmap = MemmapRaw(raw, header_fname = str(vhdr))
+    assert memmap.n_times == raw.n_times
+    np.testing.assert_allclose( 
+        memmap.get_data(picks = [2, 0], start = 100, stop = 15000), 
+        raw.get_data(picks = [2, 0], start = 100, stop = 15000), 
+        rtol = 1e-6
+    )
+    # Everything else is the wrapped Raw's
+    assert memmap.ch_names == raw.ch_names
+
+
+def test_cache_matches_fif(tmp_path): 
+    info = mne.create_info(["a", "b"], 250.0, "seeg")
+    mne.io.RawArray(np.random.default_rng(1).standard_normal((2, 30000)), info, verbose = False).save(tmp_path / "rec_raw.fif", verbose = False)
+    raw = mne.io.read_raw(tmp_path / "rec_raw.fif", preload = False, verbose = False)
+    memmap = MemmapRaw(raw, cache_dir = tmp_path / "cache", chunk_duration = 10.0)
+    data, times = memmap[["b"], 50:29000]
+    np.testing.assert_allclose(data, raw.get_data(picks = ["b"], start = 50, stop = 29000), rtol = 1e-6)
+    np.testing.assert_allclose(times, raw.times[50:29000])
+
+    # Converted once, reused by the next session
+    cached, = (tmp_path / "cache").iterdir()
+    mtime = cached.stat().st_mtime_ns
+    MemmapRaw(raw, cache_dir = tmp_path / "cache")
+    assert cached.stat().st_mtime_ns == mtime
+
+
+def test_envelope_pyramid_matches_full_reduction(): 
+    data = np.random.default_rng(2).standard_normal(300000)
+    pyramid = EnvelopePyramid(data, chunk_bins = 64)
+    start, stop, n_pixels = 12345, 250000, 500
+    positions, values = pyramid.envelope(start, stop, n_pixels)
+
+    level = pyramid.select_level(stop - start, n_pixels)
+    bin_size = pyramid.bin_sizes[level]
+    first, last = start // bin_size, -(-stop // bin_size)
+    bins = [data[b * bin_size:(b + 1) * bin_size] for b in range(first, last)]
+    np.testing.assert_allclose(values[0::2], [b.min() for b in bins], rtol = 1e-6)
+    np.testing.assert_allclose(values[1::2], [b.max() for b in bins], rtol = 1e-6)
+    assert positions.min() >= start and positions.max() < stop
+
+
+def test_envelope_pyramid_builds_viewed_chunks_only(): 
+    pyramid = EnvelopePyramid(np.zeros(10**6), chunk_bins = 64)
+    pyramid.envelope(0, 20000, 100)
+    # Level 0 chunks hold 64 bins of 8 samples
+    assert max(pyramid._chunks[0]) * 64 * 8 < 30000
+
+
+def test_envelope_pyramid_zoomed_in(): 
+    pyramid = EnvelopePyramid(np.arange(1000.0))
+    assert pyramid.envelope(0, 100, 1000) is None
+    assert pyramid.envelope(500, 500, 100) is None
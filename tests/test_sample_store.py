@@ -0,0 +1,69 @@
+import numpy as np
+import mne
+import pytest
+
+from seegview.Data import SampleStore as sample_store
+from seegview.Data.SampleStore import get_sample_store
+
+
+def _raw(n_channels = 4, n_times = 5000): 
+    info = mne.create_info(n_channels, 500.0, "seeg")
+    return mne.io.RawArray(np.random.default_rng(0).standard_normal((n_channels, n_times)), info, verbose = False)
+
+
+def test_shared_between_widgets(): 
+    raw = _raw()
+    store = get_sample_store(raw)
+    assert get_sample_store(raw) is store
+    assert get_sample_store(raw, dtype = "float32") is not store
+    store.acquire([0])
+    store.release([0])
+    get_sample_store(raw, dtype = "float32").acquire([0])
+    get_sample_store(raw, dtype = "float32").release([0])
+
+
+def test_refcounting(): 
+    raw = _raw()
+    store = get_sample_store(raw)
+    store.acquire([0, 1])
+    store.acquire([1, 2])
+    assert store.loaded_channels == [0, 1, 2]
+    store.release([1])
+    assert store.loaded_channels == [0, 1, 2]
+    store.release([0, 1])
+    assert store.loaded_channels == [2]
+    # Releasing more than acquired is ignored
+    store.release([0])
+    store.release([2])
+    assert store.loaded_channels == []
+    assert (id(raw), store.dtype.str) not in sample_store._stores
+    assert get_sample_store(raw) is not store
+
+
+def test_preloaded_rows_are_read_only_views(): 
+    raw = _raw()
+    store = get_sample_store(raw)
+    store.acquire([1])
+    row = store.channel(1)
+    assert np.shares_memory(row, raw._data)
+    with pytest.raises(ValueError): 
+        row[0] = 0.0
+    assert store.nbytes == raw._data.nbytes
+    store.release([1])
+
+
+def test_lazy_raw_matches_get_data(tmp_path): 
+    fname = tmp_path / "rec_raw.fif"
+    _raw(n_times = 50000).save(fname, verbose = False)
+    raw = mne.io.read_raw(fname, preload = False, verbose = False)
+    store = get_sample_store(raw)
+    store.acquire([0, 3])
+    try: 
+        expected = raw.get_data(picks = [0, 3], start = 1234, stop = 45678)
+        np.testing.assert_array_equal(store.get([0, 3], 1234, 45678), expected)
+        np.testing.assert_array_equal(store.channel(3)[40000:40010], expected[1, 40000 - 1234:40010 - 1234])
+    finally: 
+        store.release([0, 3])
+    # The last release stops the prefetch thread
+    store.prefetcher._thread.join(timeout = 1.0)
+    assert not store.prefetcher._thread.is_alive()
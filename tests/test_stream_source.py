@@ -0,0 +1,95 @@
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from seegview.Data.StreamSource import FileStreamSource, RingBuffer, SocketStreamSource, StreamChannel, StreamSource
+
+
+def _wait_for(condition, timeout = 5.0): 
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline: 
+        time.sleep(0.01)
+    return condition()
+
+
+def test_ring_buffer_matches_the_stream(): 
+    rng = np.random.default_rng(0)
+    buffer = RingBuffer(3, 100)
+    written = np.empty((3, 0), dtype = np.float32)
+    for n in rng.integers(1, 60, size = 40): 
+        block = rng.standard_normal((3, n)).astype(np.float32)
+        buffer.write(block)
+        written = np.concatenate([written, block], axis = 1)
+        start = int(rng.integers(0, written.shape[1] + 10))
+        stop = start + int(rng.integers(0, 150))
+        expected = np.full((2, stop - start), np.nan, dtype = np.float32)
+        first, last = max(start, written.shape[1] - 100), min(stop, written.shape[1])
+        if last > first: 
+            expected[:, first - start:last - start] = written[[2, 0], first:last]
+        np.testing.assert_array_equal(buffer.read([2, 0], start, stop), expected)
+
+
+def test_ring_buffer_long_block(): 
+    buffer = RingBuffer(1, 10)
+    buffer.write(np.arange(25.0)[np.newaxis])
+    assert buffer.n_written == 25
+    np.testing.assert_array_equal(buffer.read([0], 15, 25)[0], np.arange(15.0, 25.0))
+    assert np.isnan(buffer.read([0], 14, 15)).all()
+    with pytest.raises(ValueError): 
+        buffer.write(np.zeros((2, 5)))
+    with pytest.raises(ValueError): 
+        RingBuffer(1, 0)
+
+
+def test_stream_source_reads_like_a_raw(): 
+    source = StreamSource(["a", "b"], 100.0, buffer_duration = 1.0)
+    source.push(np.vstack([np.arange(150.0), -np.arange(150.0)]))
+    assert source.n_times == 150
+    data, times = source.get_data(picks = "b", start = 140, return_times = True)
+    np.testing.assert_array_equal(data[0], -np.arange(140.0, 150.0))
+    np.testing.assert_allclose(times, np.arange(140, 150) / 100.0)
+    channel = StreamChannel(source, 0)
+    assert len(channel) == 150
+    np.testing.assert_array_equal(channel[145:150], np.arange(145.0, 150.0))
+    np.testing.assert_array_equal(channel[[60, 149]], [60.0, 149.0])
+    assert np.isnan(channel[10])
+
+
+def test_file_stream_source_keeps_partial_frames(tmp_path): 
+    fname = tmp_path / "stream.bin"
+    frames = np.arange(20, dtype = "<f4").reshape(10, 2)
+    payload = frames.tobytes()
+    fname.write_bytes(payload[:13])
+    source = FileStreamSource(str(fname), ["a", "b"], 100.0, poll_interval = 0.005)
+    source.start()
+    try: 
+        assert _wait_for(lambda: source.n_times == 1)
+        with open(fname, "ab") as f: 
+            f.write(payload[13:])
+        assert _wait_for(lambda: source.n_times == 10)
+        np.testing.assert_array_equal(source.get_data(), frames.T)
+    finally: 
+        source.stop()
+
+
+def test_socket_stream_source_stops_its_reader(): 
+    server = socket.create_server(("127.0.0.1", 0))
+    connections = []
+    threading.Thread(target = lambda: connections.append(server.accept()[0]), daemon = True).start()
+    source = SocketStreamSource("127.0.0.1", server.getsockname()[1], ["a", "b"], 100.0)
+    source.start()
+    try: 
+        assert _wait_for(lambda: connections)
+        connections[0].sendall(np.arange(8, dtype = "<f4").tobytes())
+        assert _wait_for(lambda: source.n_times == 4)
+        thread = source._thread
+    finally: 
+        source.stop()
+        server.close()
+    # The reader blocked in recv is woken up and joined
+    assert not thread.is_alive()
+    assert source._socket is None
+    assert source._read() is None
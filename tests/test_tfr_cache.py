@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import mne
+import pytest
+
+from seegview.Data.MemmapRaw import raw_fingerprint
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRCache import TFRCache, tfr_cache_key
+
+
+@pytest.fixture
+def fif_fname(tmp_path): 
+    info = mne.create_info(["a", "b", "c"], 256.0, "seeg")
+    raw = mne.io.RawArray(np.random.default_rng(0).standard_normal((3, 256 * 30)), info, verbose = False)
+    fname = tmp_path / "rec_raw.fif"
+    raw.save(fname, verbose = False)
+    return fname
+
+
+def test_key_stable_across_lazy_and_preloaded(fif_fname): 
+    lazy = mne.io.read_raw(fif_fname, preload = False, verbose = False)
+    preloaded = mne.io.read_raw(fif_fname, preload = True, verbose = False)
+    # As built by the precompute CLI and by the browser
+    cli = MorletEngine(lazy, freqs = np.arange(2.0, 51.5, 1.0), n_cycles = 7.0, decim = 100)
+    browser = MorletEngine(preloaded, freqs = np.arange(50) + 2, decim = 100)
+    assert tfr_cache_key(cli) == tfr_cache_key(browser)
+
+
+def test_key_follows_processing(fif_fname): 
+    lazy = mne.io.read_raw(fif_fname, preload = False, verbose = False)
+    filtered = mne.io.read_raw(fif_fname, preload = True, verbose = False).filter(1.0, None, verbose = False)
+    cropped = mne.io.read_raw(fif_fname, preload = False, verbose = False).crop(1.0)
+    freqs = np.arange(4.0, 20.0, 4.0)
+    keys = {tfr_cache_key(MorletEngine(raw, freqs = freqs, decim = 4)) for raw in (lazy, filtered, cropped)}
+    assert len(keys) == 3
+
+
+def test_cache_matches_engine(fif_fname, tmp_path): 
+    raw = mne.io.read_raw(fif_fname, preload = False, verbose = False)
+    engine = MorletEngine(raw, freqs = np.arange(4.0, 20.0, 4.0), decim = 4)
+    cache = TFRCache(engine, cache_dir = tmp_path / "tfr")
+    expected = engine.get(1, 100, 900)
+    np.testing.assert_allclose(cache.get(1, 100, 900), expected, rtol = 1e-5)
+    reopened = TFRCache(engine, cache_dir = tmp_path / "tfr")
+    assert reopened.has_tile(1, 0)
+    np.testing.assert_allclose(reopened.get(1, 100, 900), expected, rtol = 1e-5)
+
+
+def test_in_memory_raws_are_keyed_on_their_samples(): 
+    info = mne.create_info(["a"], 100.0, "seeg")
+    data = np.random.default_rng(3).standard_normal((1, 1000))
+    first = mne.io.RawArray(data, info, verbose = False)
+    same = mne.io.RawArray(data.copy(), info, verbose = False)
+    other = mne.io.RawArray(data + 1, info, verbose = False)
+    assert raw_fingerprint(first) == raw_fingerprint(same)
+    assert raw_fingerprint(first) != raw_fingerprint(other)
+    # An explicit key stands for the samples
+    assert raw_fingerprint(first, "session-1") == raw_fingerprint(other, "session-1")
+
+
+def test_data_key_and_clear(fif_fname, tmp_path): 
+    raw = mne.io.read_raw(fif_fname, preload = True, verbose = False)
+    engine = MorletEngine(raw, freqs = np.arange(4.0, 20.0, 4.0), decim = 4)
+    cache = TFRCache(engine, cache_dir = tmp_path)
+    keyed = TFRCache(engine, cache_dir = tmp_path, data_key = "rereferenced")
+    assert keyed.path != cache.path
+    keyed.fill([0])
+    assert keyed.done[0].all() and not keyed.done[1].any()
+    keyed.clear()
+    assert not os.path.exists(keyed.path)
+    assert os.path.exists(cache.path)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "uint16"])
+def test_compact_dtypes_persist(fif_fname, tmp_path, dtype): 
+    raw = mne.io.read_raw(fif_fname, preload = False, verbose = False)
+    engine = MorletEngine(raw, freqs = np.arange(4.0, 20.0, 4.0), decim = 4)
+    expected = engine.get(2, 0, engine.n_times)
+    TFRCache(engine, dtype = dtype, cache_dir = tmp_path).fill([2])
+    reopened = TFRCache(engine, dtype = dtype, cache_dir = tmp_path)
+    assert reopened.done[2].all()
+    # Quantized power is clipped to a floor, troughs below it are not compared
+    above = expected > np.percentile(expected, 1, axis = -1, keepdims = True)
+    got = reopened.get(2, 0, engine.n_times)
+    np.testing.assert_allclose(np.log10(got[above]), np.log10(expected[above]), atol = 0.01)
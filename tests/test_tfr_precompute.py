@@ -0,0 +1,48 @@
+import numpy as np
+import mne
+import pytest
+
+from seegview.Data.MorletEngine import MorletEngine
+from seegview.Data.TFRCache import TFRCache
+from seegview.Data.TFRPrecompute import precompute_tfr
+
+
+@pytest.fixture
+def engine(): 
+    info = mne.create_info(4, 256.0, "seeg")
+    raw = mne.io.RawArray(np.random.default_rng(0).standard_normal((4, 256 * 90)), info, verbose = False)
+    return MorletEngine(raw, freqs = np.arange(4.0, 30.0, 4.0), decim = 4)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "uint16"])
+def test_matches_the_engine(engine, tmp_path, dtype): 
+    cache = TFRCache(engine, dtype = dtype, cache_dir = tmp_path)
+    # One tile computed in process beforehand, it is not computed again
+    cache.get(1, 0, 10)
+    progress = []
+    precompute_tfr(cache, n_jobs = 2, tiles_per_task = 3, progress = lambda n_done, n_total: progress.append((n_done, n_total)))
+    n_total = 4 * cache.n_tiles - 1
+    assert progress[-1] == (n_total, n_total)
+    # Written by the workers, seen through the parent's mapping
+    assert cache.complete
+
+    reopened = TFRCache(engine, dtype = dtype, cache_dir = tmp_path)
+    for ch in range(4): 
+        expected = engine.get(ch, 0, engine.n_times)
+        got = reopened.get(ch, 0, engine.n_times)
+        if dtype == "float32": 
+            np.testing.assert_allclose(got, expected, rtol = 1e-5)
+        else: 
+            # Troughs under a tile's quantization floor are clipped to it
+            above = expected > np.percentile(expected, 5, axis = -1, keepdims = True)
+            np.testing.assert_allclose(np.log10(got[above]), np.log10(expected[above]), atol = 0.01)
+
+
+def test_channels_and_batches(engine, tmp_path): 
+    cache = TFRCache(engine, cache_dir = tmp_path)
+    # Batches of one channel each
+    precompute_tfr(cache, channels = [0, 3], n_jobs = 1, max_shared_bytes = 1)
+    assert cache.done[[0, 3]].all()
+    assert not cache.done[[1, 2]].any()
+    with pytest.raises(ValueError): 
+        precompute_tfr(cache, tiles_per_task = 0)
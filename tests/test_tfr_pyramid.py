@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from seegview.Data.TFRPyramid import TFRPyramid
+
+# Not a multiple of any bin size, the last bin of every level is partial
+N_TIMES = 50003
+
+
+@pytest.fixture
+def power(): 
+    return np.random.default_rng(0).random((3, N_TIMES)).astype(np.float32)
+
+
+def _direct(power, first, last, bin_size, pooling): 
+    # Every bin reduced from the samples it covers
+    reduce = np.mean if pooling == "mean" else np.max
+    return np.stack([ 
+        reduce(power[:, b * bin_size:min((b + 1) * bin_size, N_TIMES)], axis = -1)
+        for b in range(first // bin_size, -(-last // bin_size))
+    ], axis = -1)
+
+
+@pytest.mark.parametrize("pooling", ["mean", "max"])
+def test_images_match_direct_pooling(power, pooling): 
+    pyramid = TFRPyramid(lambda start, stop: power[:, start:stop], N_TIMES, pooling = pooling, chunk_bins = 16)
+    rng = np.random.default_rng(1)
+    windows = [(0, N_TIMES), (N_TIMES - 3000, N_TIMES + 100)] + [ 
+        tuple(sorted(rng.integers(0, N_TIMES, 2))) for _ in range(20)
+    ]
+    for start, stop in windows: 
+        for n_pixels in (50, 300, 2000): 
+            result = pyramid.image(start, stop, n_pixels)
+            level = pyramid.select_level(min(stop, N_TIMES) - start, n_pixels)
+            if level is None: 
+                assert result is None
+                continue
+            first, last, pooled = result
+            bin_size = pyramid.bin_sizes[level]
+            assert first <= start and last >= min(stop, N_TIMES)
+            np.testing.assert_allclose(pooled, _direct(power, start, min(stop, N_TIMES), bin_size, pooling), rtol = 1e-5)
+
+
+def test_levels_are_built_lazily(power): 
+    fetched = []
+
+    def fetch(start, stop): 
+        fetched.append((start, stop))
+        return power[:, start:stop]
+
+    pyramid = TFRPyramid(fetch, N_TIMES, chunk_bins = 16)
+    pyramid.image(1000, 3000, 100)
+    assert sum(stop - start for start, stop in fetched) < N_TIMES / 4
+    n_fetched = len(fetched)
+    pyramid.image(1000, 3000, 100)
+    assert len(fetched) == n_fetched
+
+
+def test_invalidate_refetches_refined_power(power): 
+    pyramid = TFRPyramid(lambda start, stop: power[:, start:stop], N_TIMES, chunk_bins = 16)
+    before = pyramid.image(0, N_TIMES, 100)[2]
+    power[:, 20000:20100] += 10
+    # Until invalidated, the pooled chunks are kept
+    np.testing.assert_array_equal(pyramid.image(0, N_TIMES, 100)[2], before)
+    pyramid.invalidate(20000, 20100)
+    after = pyramid.image(0, N_TIMES, 100)[2]
+    bin_size = pyramid.bin_sizes[pyramid.select_level(N_TIMES, 100)]
+    np.testing.assert_allclose(after, _direct(power, 0, N_TIMES, bin_size, "mean"), rtol = 1e-5)
+
+
+def test_bad_pooling(): 
+    with pytest.raises(ValueError): 
+        TFRPyramid(lambda start, stop: None, 100, pooling = "median")
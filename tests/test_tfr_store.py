@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from seegview.Data.TFRStore import TFRStore
+
+
+def _power(shape = (2, 5, 3000), seed = 0): 
+    # Wavelet-like power, spanning decades
+    return np.random.default_rng(seed).lognormal(mean = -20, sigma = 3, size = shape).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "uint16", "uint8"])
+def test_decoded_power_within_a_quantization_step(dtype): 
+    power = _power()
+    store = TFRStore(["A1", "A2"], np.arange(5.0), 100.0, power.shape[-1], dtype = dtype, block_size = 1000)
+    for ch in range(len(power)): 
+        store.set_channel(ch, power[ch])
+    assert store.data.dtype == np.dtype(dtype)
+
+    for ch in range(len(power)): 
+        got = store.get(ch, 0, store.n_times)
+        assert got.dtype == np.float32
+        error = np.abs(np.log10(got) - np.log10(power[ch]))
+        if dtype == "float16": 
+            # Half precision log10 power, 11 bits of mantissa
+            assert np.all(error <= np.abs(np.log10(power[ch])) * 2.0**-11 + 1e-6)
+            continue
+        # Half a step of the block's range, above its floor
+        blocks = np.arange(store.n_times) // store.block_size
+        low, high = store.log_min[ch][:, blocks], store.log_max[ch][:, blocks]
+        step = (high - low) / np.iinfo(dtype).max
+        above = np.log10(power[ch]) >= low
+        assert np.all(error[above] <= step[above] / 2 + 1e-4)
+        # Below it, power is clipped to the floor
+        np.testing.assert_allclose(np.log10(got[~above]), low[~above], atol = 1e-4)
+
+
+def test_blocks_written_in_any_order_are_quantized_alike(): 
+    power = _power((1, 3, 4000))
+    whole = TFRStore(["A1"], np.arange(3.0), 100.0, 4000, dtype = "uint16", block_size = 500)
+    whole.set_channel(0, power[0])
+    tiles = TFRStore(["A1"], np.arange(3.0), 100.0, 4000, dtype = "uint16", block_size = 500)
+    for start in np.random.default_rng(1).permutation(np.arange(0, 4000, 1000)): 
+        tiles.write(0, start, power[0, :, start:start + 1000])
+    np.testing.assert_array_equal(tiles.data, whole.data)
+    np.testing.assert_array_equal(tiles.get(0, 0, 4000), whole.get(0, 0, 4000))
+    np.testing.assert_array_equal(tiles.get(0, 1234, 2345), whole.get(0, 0, 4000)[:, 1234:2345])
+
+
+def test_float32_is_lossless_and_get_clamps(): 
+    power = _power((1, 3, 100))
+    store = TFRStore(["A1"], np.arange(3.0), 100.0, 100)
+    store.set_channel(0, power[0])
+    np.testing.assert_array_equal(store.get(0, -10, 200), power[0])
+    assert store.get(0, 90, 80).shape == (3, 0)
+    np.testing.assert_allclose(store.times, np.arange(100) / 100.0)
+
+
+def test_bad_arguments(): 
+    with pytest.raises(ValueError): 
+        TFRStore(["A1"], [1.0], 100.0, 10, dtype = "float64")
+    with pytest.raises(ValueError): 
+        TFRStore(["A1"], [1.0], 100.0, 10, dtype = "uint16", data = np.zeros((1, 1, 10), dtype = np.float32))
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from seegview.Widgets.Analysis import WindowedSpectrum, welch_with_CI
+
+
+@pytest.fixture
+def power(): 
+    return np.random.default_rng(1).gamma(2.0, size = (5, 1000))
+
+
+def test_matches_welch_with_CI(power): 
+    spectrum = WindowedSpectrum(lambda start, stop: power[:, start:stop], power.shape[1], chunk_size = 64, max_chunks = 2)
+    rng = np.random.default_rng(2)
+    for _ in range(50): 
+        start = int(rng.integers(0, 990))
+        stop = int(rng.integers(start + 2, 1001))
+        _, *expected = welch_with_CI(None, power[:, start:stop])
+        for got, want in zip(spectrum.spectrum_with_CI(start, stop), expected): 
+            np.testing.assert_allclose(got, want, rtol = 1e-7, atol = 1e-9)
+    # Only the edges of the last windows are held
+    assert len(spectrum._prefix) <= 2
+
+
+def test_invalidate_reads_again(power): 
+    data = power.copy()
+    spectrum = WindowedSpectrum(lambda start, stop: data[:, start:stop], data.shape[1], chunk_size = 64)
+    spectrum.spectrum_with_CI(0, 1000)
+    data[:, 100:200] *= 2
+    spectrum.invalidate(100, 200)
+    _, *expected = welch_with_CI(None, data)
+    np.testing.assert_allclose(spectrum.spectrum_with_CI(0, 1000)[0], expected[0])
+
+
+def test_empty_window(power): 
+    spectrum = WindowedSpectrum(lambda start, stop: power[:, start:stop], power.shape[1])
+    assert spectrum.spectrum_with_CI(500, 500) is None